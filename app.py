@@ -1,7 +1,8 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, make_response, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_from_directory, make_response, redirect, url_for, g, has_request_context
 import pandas as pd
 import json
 import os
+import sys
 from datetime import datetime
 import numpy as np
 from werkzeug.utils import secure_filename
@@ -14,24 +15,56 @@ import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import requests
 import hashlib
+import shutil
 import time
-from functools import lru_cache
+from functools import lru_cache, wraps
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 import re
+import warnings
 import google.generativeai as genai
 from dotenv import load_dotenv
-import subprocess
 import tempfile
 import signal
 import atexit
 import threading
 import time
+import csv
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', '1024')) * 1024 * 1024  # Límite configurable de subida
+app.config['STREAMING_THRESHOLD'] = 16 * 1024 * 1024  # Archivos mayores se procesan por bloques
+app.config['STREAMING_CHUNK_ROWS'] = 200_000  # Filas por bloque en la ingesta por bloques
+app.config['STREAMING_DEDUP'] = os.getenv('STREAMING_DEDUP', '1') != '0'  # Eliminar filas duplicadas entre bloques
+app.config['STREAMING_DEDUP_MAX_ROWS'] = int(os.getenv('STREAMING_DEDUP_MAX_ROWS', '20000000'))  # Filas distintas recordadas (8 bytes cada una)
+app.config['PARSED_CACHE_FOLDER'] = 'parsed_cache'  # Datasets ya procesados, indexados por contenido
+app.config['PARSED_CACHE_MAX_BYTES'] = int(os.getenv('PARSED_CACHE_MAX_MB', '512')) * 1024 * 1024
+app.config['UPLOAD_SESSION_TTL'] = int(os.getenv('UPLOAD_SESSION_TTL', '900'))  # Segundos sin uso antes de descartar una sesión de carga
+app.config['UPLOAD_SESSION_MAX_BYTES'] = int(os.getenv('UPLOAD_SESSION_MAX_MB', '256')) * 1024 * 1024
+app.config['INGEST_WORKERS'] = int(os.getenv('INGEST_WORKERS', '2'))  # Hilos que procesan cargas en segundo plano
+app.config['INGEST_MAX_PENDING'] = int(os.getenv('INGEST_MAX_PENDING', '8'))  # Trabajos en cola o en curso admitidos
+app.config['INGEST_JOB_TTL'] = 3600  # Segundos que se conserva el estado de un trabajo terminado
+app.config['BATCH_WORKERS'] = int(os.getenv('BATCH_WORKERS', str(min(4, os.cpu_count() or 1))))  # Procesos para cargas por lotes y backtests de pronóstico
+app.config['BATCH_MAX_FILES'] = int(os.getenv('BATCH_MAX_FILES', '60'))
+app.config['CACHE_WARMUP'] = os.getenv('CACHE_WARMUP', '1') != '0'  # Precalcular gráficos y estadísticas tras cada carga
+app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '512'))  # Resultados de análisis y gráficos en caché
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.getenv('RESULT_CACHE_MAX_MB', '64')) * 1024 * 1024
+app.config['RESULT_CACHE_TTL'] = int(os.getenv('RESULT_CACHE_TTL', '300'))  # Segundos
+app.config['STATS_CACHE_DB'] = os.getenv('STATS_CACHE_DB', 'stats_cache.db')  # Estadísticas persistentes entre reinicios ('' la desactiva)
+app.config['STATS_CACHE_MAX_BYTES'] = int(os.getenv('STATS_CACHE_MAX_MB', '64')) * 1024 * 1024
+app.config['DATASET_MEMORY_BYTES'] = int(os.getenv('DATASET_MEMORY_MB', '1024')) * 1024 * 1024  # Memoria para los datasets de todas las sesiones
+app.config['DATASET_SPILL_FOLDER'] = 'dataset_spill'  # Datasets expulsados de memoria
+app.config['DATASET_SPILL_TTL'] = int(os.getenv('DATASET_SPILL_TTL', str(7 * 24 * 3600)))  # Segundos que se conserva un dataset sin uso
+app.config['DATASET_STORE_FOLDER'] = os.getenv('DATASET_STORE_DIR', 'dataset_store')  # Pivots compartidos entre procesos (p. ej. /dev/shm/asapalsa)
+app.config['DATASET_STORE_GRACE'] = int(os.getenv('DATASET_STORE_GRACE', '300'))  # Segundos que se conserva una versión reemplazada
 
 # Configurar Google Gemini (gratuito)
 # Para obtener tu API key: https://makersuite.google.com/app/apikey
@@ -61,65 +94,34 @@ def cleanup_processes():
         except Exception as e:
             print(f"⚠️ Error terminando proceso: {e}")
     active_processes.clear()
-
-def safe_subprocess_run(*args, **kwargs):
-    """Ejecutar subprocess de forma segura"""
-    proc = None
-    try:
-        # Agregar flags para evitar ventanas en Windows
-        if os.name == 'nt':
-            kwargs.setdefault('creationflags', subprocess.CREATE_NO_WINDOW)
-        
-        # Reducir timeout por defecto para evitar procesos colgados
-        kwargs.setdefault('timeout', 30)
-        
-        # Ejecutar el proceso
-        result = subprocess.run(*args, **kwargs)
-        
-        # Limpiar inmediatamente después de la ejecución
-        if hasattr(result, 'stdout'):
-            if hasattr(result.stdout, 'close'):
-                try:
-                    result.stdout.close()
-                except:
-                    pass
-        if hasattr(result, 'stderr'):
-            if hasattr(result.stderr, 'close'):
-                try:
-                    result.stderr.close()
-                except:
-                    pass
-        
-        return result
-    except subprocess.TimeoutExpired as e:
-        print(f"⚠️ Subprocess timeout: {e}")
-        if proc and proc.poll() is None:
-            try:
-                proc.terminate()
-                proc.wait(timeout=2)
-            except:
-                try:
-                    proc.kill()
-                except:
-                    pass
-        return None
-    except Exception as e:
-        print(f"⚠️ Error en subprocess: {e}")
-        return None
+    
+    # Procesos del pool de cargas por lotes
+    executor = globals().get('_batch_executor')
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 # Registrar función de limpieza
 atexit.register(cleanup_processes)
 
 # Manejar señales de terminación
+_previous_signal_handlers = {}
+
 def signal_handler(signum, frame):
-    """Manejar señales de terminación"""
+    """Limpia los procesos hijos y deja que el manejador anterior (o el servidor) termine el proceso"""
     print(f"\n🛑 Señal {signum} recibida. Limpiando procesos...")
     cleanup_processes()
-    exit(0)
+    previous = _previous_signal_handlers.get(signum)
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        raise SystemExit(0)
 
-# Registrar manejadores de señales
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+# Registrar manejadores de señales; Python solo lo permite desde el hilo principal
+# (al importar la app desde otro hilo, el servidor maneja las señales por su cuenta)
+if threading.current_thread() is threading.main_thread():
+    for _signum in (signal.SIGINT, signal.SIGTERM):
+        _previous_signal_handlers[_signum] = signal.getsignal(_signum)
+        signal.signal(_signum, signal_handler)
 
 if not ai_model:
     print("ℹ️ Google Gemini no configurado - usando análisis local")
@@ -152,55 +154,468 @@ def is_mobile_device():
 # Crear directorio de uploads si no existe
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Variables globales para almacenar datos
-current_data = None
-processed_data = None
-original_data = None
+class ReadWriteLock:
+    """Lock de lectores/escritor: varias lecturas a la vez, escrituras exclusivas.
+    
+    Un escritor en espera bloquea a los lectores nuevos para no quedar postergado.
+    No es reentrante: no se debe volver a tomar dentro de una sección ya protegida.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+    
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+    
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+class ResultCache:
+    """Caché de resultados de análisis con TTL, expulsión LRU y presupuesto de entradas y bytes.
+    
+    Las claves son (hash de datos, operación); las métricas se llevan por operación.
+    """
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()  # Un acierto reordena la lista LRU, así que también escribe
+        self._counters = defaultdict(lambda: {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0, 'rejected': 0})
+        self._last_sweep = time.time()
+    
+    ESTIMATE_SAMPLE = 32  # Elementos que se miden de una lista o dict largo; el resto se extrapola
+    
+    @staticmethod
+    def _estimate_bytes(data):
+        """Tamaño aproximado del resultado serializado, sin serializarlo.
+        
+        Las cadenas cuentan su longitud (las imágenes base64 son casi todo el tamaño de un gráfico), los
+        números un ancho fijo y las listas y dicts largos se extrapolan desde una muestra de sus elementos.
+        """
+        if isinstance(data, str):
+            return len(data) + 2
+        if data is None or isinstance(data, (bool, np.bool_)):
+            return 5
+        if isinstance(data, (int, float, np.number)):
+            return 16  # Ancho típico de un float en JSON
+        if isinstance(data, np.ndarray):
+            return data.size * 16 + 2
+        if isinstance(data, dict):
+            items = data.items()
+            sampled = list(itertools.islice(items, ResultCache.ESTIMATE_SAMPLE))
+            size = sum(len(str(key)) + 4 + ResultCache._estimate_bytes(value) for key, value in sampled)
+        elif isinstance(data, (list, tuple)):
+            step = max(len(data) // ResultCache.ESTIMATE_SAMPLE, 1)
+            sampled = data[::step]
+            size = sum(ResultCache._estimate_bytes(value) + 1 for value in sampled)
+        else:
+            return sys.getsizeof(data)
+        return (size * len(data) // len(sampled) if sampled else 0) + 2
+    
+    def _remove(self, key, reason):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['bytes']
+        self._counters[entry['operation']][reason] += 1
+    
+    def _sweep(self, now):
+        """Elimina las entradas vencidas (con el lock tomado)"""
+        for key in [key for key, entry in self._entries.items() if now - entry['timestamp'] >= self.ttl]:
+            self._remove(key, 'expired')
+        self._last_sweep = now
+    
+    def get(self, data_hash, operation):
+        key = get_cache_key(data_hash, operation)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['timestamp'] >= self.ttl:
+                self._remove(key, 'expired')
+                entry = None
+            if entry is None:
+                self._counters[operation]['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters[operation]['hits'] += 1
+            return entry['data']
+    
+    def set(self, data_hash, operation, data):
+        key = get_cache_key(data_hash, operation)
+        size = self._estimate_bytes(data)
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)['bytes']
+            if size > self.max_bytes:
+                self._counters[operation]['rejected'] += 1
+                return False
+            if now - self._last_sweep >= self.ttl:
+                self._sweep(now)
+            self._entries[key] = {'data': data, 'timestamp': now, 'bytes': size,
+                                  'operation': operation, 'data_hash': data_hash}
+            self._bytes += size
+            self._counters[operation]['stores'] += 1
+            # Expulsar las menos usadas hasta respetar ambos límites
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)), 'evictions')
+            return True
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def stats(self):
+        """Tamaño, límites y métricas por operación"""
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            operations = {}
+            for operation, counters in self._counters.items():
+                lookups = counters['hits'] + counters['misses']
+                operations[operation] = {**counters, 'entries': 0, 'bytes': 0,
+                                         'hit_ratio': round(counters['hits'] / lookups, 3) if lookups else 0}
+            entries = []
+            for key, entry in self._entries.items():
+                operations[entry['operation']]['entries'] += 1
+                operations[entry['operation']]['bytes'] += entry['bytes']
+                entries.append({
+                    'key': key,
+                    'operation': entry['operation'],
+                    'bytes': entry['bytes'],
+                    'age_seconds': round(now - entry['timestamp'], 2),
+                    'is_valid': True
+                })
+            hits = sum(counters['hits'] for counters in self._counters.values())
+            lookups = hits + sum(counters['misses'] for counters in self._counters.values())
+            return {
+                'total_entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'cache_ttl': self.ttl,
+                'hit_ratio': round(hits / lookups, 3) if lookups else 0,
+                'operations': operations,
+                'entries': entries
+            }
 
 # Sistema de caché
-cache = {}
-cache_ttl = 300  # 5 minutos en segundos
+cache = ResultCache(app.config['RESULT_CACHE_MAX_ENTRIES'], app.config['RESULT_CACHE_MAX_BYTES'], app.config['RESULT_CACHE_TTL'])
 
 # Configuración de base de datos
 DATABASE = 'analytics_history.db'
 
+# Subir al cambiar el cálculo o el formato de alguna estadística: invalida lo guardado en disco
+STATS_CACHE_VERSION = 2
+PERSISTENT_OPERATIONS = ('correlations', 'trends', 'descriptive', 'anomalies', 'accuracy')  # También sus variantes (trends_theil_sen, ...)
+
+class StatsStore:
+    """Nivel persistente (SQLite) detrás de la caché en memoria para las estadísticas.
+    
+    Las claves son la versión del dataset (huella del contenido) y la operación, así que siguen siendo
+    válidas tras un reinicio; las filas de otra STATS_CACHE_VERSION se descartan y el tamaño total
+    se mantiene bajo max_bytes expulsando las menos usadas.
+    
+    Cada hilo reutiliza su conexión; los accesos se anotan en memoria y se escriben por lotes, y el
+    total de entradas y bytes se lleva en stats_cache_totals para no sumar la tabla en cada escritura.
+    """
+    ACCESS_FLUSH_SIZE = 256  # Accesos pendientes que fuerzan la escritura de last_access
+    ACCESS_FLUSH_INTERVAL = 30  # Segundos máximos entre escrituras de last_access
+    
+    def __init__(self, path, max_bytes, version):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self._counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+        self._local = threading.local()
+        self._access = {}
+        self._access_lock = threading.Lock()
+        self._access_flushed = time.time()
+    
+    def _connect(self):
+        # Sin transacciones implícitas: las escrituras abren BEGIN IMMEDIATE en _write
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')  # Lectores de varios procesos sin bloquear al que escribe
+        return conn
+    
+    def _connection(self):
+        """Conexión del hilo actual; un proceso hijo abre la suya en lugar de usar la heredada"""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.conn
+    
+    @contextmanager
+    def _write(self):
+        """Transacción de escritura; se toma el lock al empezar para no fallar al pasar de lectura a escritura"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    
+    def init(self):
+        """Crea las tablas, descarta resultados de versiones anteriores y recalcula el total"""
+        with self._write() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stats_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    data_hash TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_cache_hash ON stats_cache (data_hash)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_cache_access ON stats_cache (last_access)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stats_cache_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    entries INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                )
+            ''')
+            removed = conn.execute('DELETE FROM stats_cache WHERE version != ?', (self.version,)).rowcount
+            conn.execute('''INSERT OR REPLACE INTO stats_cache_totals
+                            SELECT 0, COUNT(*), COALESCE(SUM(bytes), 0) FROM stats_cache''')
+        if removed:
+            print(f"🧹 {removed} estadísticas persistentes de versiones anteriores descartadas")
+    
+    def _note_access(self, key):
+        """Anota el acceso; last_access se escribe por lotes, solo sirve para elegir qué expulsar"""
+        now = time.time()
+        with self._access_lock:
+            self._access[key] = now
+            if len(self._access) < self.ACCESS_FLUSH_SIZE and now - self._access_flushed < self.ACCESS_FLUSH_INTERVAL:
+                return
+        self._flush_access()
+    
+    def _flush_access(self, conn=None):
+        with self._access_lock:
+            pending, self._access = self._access, {}
+            self._access_flushed = time.time()
+        if not pending:
+            return
+        rows = [(accessed, key) for key, accessed in pending.items()]
+        try:
+            if conn is not None:
+                conn.executemany('UPDATE stats_cache SET last_access = ? WHERE cache_key = ?', rows)
+            else:
+                with self._write() as conn:
+                    conn.executemany('UPDATE stats_cache SET last_access = ? WHERE cache_key = ?', rows)
+        except sqlite3.Error as e:
+            self._counters['errors'] += 1  # Se pierde solo la pista de uso de esas entradas
+            print(f"⚠️ Error guardando accesos a estadísticas persistentes: {e}")
+    
+    def get(self, data_hash, operation):
+        key = get_cache_key(data_hash, operation)
+        try:
+            row = self._connection().execute('SELECT payload FROM stats_cache WHERE cache_key = ? AND version = ?',
+                                             (key, self.version)).fetchone()
+        except sqlite3.Error as e:
+            self._counters['errors'] += 1
+            print(f"⚠️ Error leyendo estadísticas persistentes: {e}")
+            return None
+        if row is None:
+            self._counters['misses'] += 1
+            return None
+        self._counters['hits'] += 1
+        self._note_access(key)
+        return json.loads(row[0])
+    
+    def set(self, data_hash, operation, data):
+        try:
+            payload = json.dumps(data, default=str)
+        except (TypeError, ValueError):
+            return False
+        if len(payload) > self.max_bytes:
+            return False
+        key = get_cache_key(data_hash, operation)
+        now = time.time()
+        try:
+            with self._write() as conn:
+                old = conn.execute('SELECT bytes FROM stats_cache WHERE cache_key = ?', (key,)).fetchone()
+                conn.execute('INSERT OR REPLACE INTO stats_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, data_hash, operation, self.version, payload, len(payload), now, now))
+                conn.execute('UPDATE stats_cache_totals SET entries = entries + ?, bytes = bytes + ? WHERE id = 0',
+                             (0 if old else 1, len(payload) - (old[0] if old else 0)))
+                total = conn.execute('SELECT bytes FROM stats_cache_totals WHERE id = 0').fetchone()[0]
+                if total > self.max_bytes:
+                    # Expulsar las menos usadas hasta respetar el límite de tamaño
+                    self._flush_access(conn)
+                    stale, freed = [], 0
+                    candidates = conn.execute('SELECT cache_key, bytes FROM stats_cache ORDER BY last_access')
+                    for stale_key, size in candidates:
+                        if total - freed <= self.max_bytes:
+                            break
+                        stale.append((stale_key,))
+                        freed += size
+                    candidates.close()
+                    conn.executemany('DELETE FROM stats_cache WHERE cache_key = ?', stale)
+                    conn.execute('UPDATE stats_cache_totals SET entries = entries - ?, bytes = bytes - ? WHERE id = 0',
+                                 (len(stale), freed))
+                    self._counters['evictions'] += len(stale)
+        except sqlite3.Error as e:
+            self._counters['errors'] += 1
+            print(f"⚠️ Error guardando estadísticas persistentes: {e}")
+            return False
+        self._counters['stores'] += 1
+        return True
+    
+    def clear(self):
+        """Borra todas las entradas; devuelve False si la base de datos no está disponible"""
+        with self._access_lock:
+            self._access = {}
+        try:
+            with self._write() as conn:
+                conn.execute('DELETE FROM stats_cache')
+                conn.execute('UPDATE stats_cache_totals SET entries = 0, bytes = 0 WHERE id = 0')
+        except sqlite3.Error as e:
+            self._counters['errors'] += 1
+            print(f"⚠️ Error limpiando estadísticas persistentes: {e}")
+            return False
+        return True
+    
+    def stats(self):
+        """Entradas y bytes en disco más las métricas de este proceso"""
+        lookups = self._counters['hits'] + self._counters['misses']
+        stats = {
+            'path': self.path,
+            'version': self.version,
+            'entries': None,
+            'bytes': None,
+            'max_bytes': self.max_bytes,
+            **self._counters,
+            'hit_ratio': round(self._counters['hits'] / lookups, 3) if lookups else 0
+        }
+        try:
+            stats['entries'], stats['bytes'] = self._connection().execute(
+                'SELECT entries, bytes FROM stats_cache_totals WHERE id = 0').fetchone()
+        except (sqlite3.Error, TypeError) as e:
+            stats['error'] = f"No se pudo leer la base de datos: {e}"
+        return stats
+
+stats_store = StatsStore(app.config['STATS_CACHE_DB'], app.config['STATS_CACHE_MAX_BYTES'], STATS_CACHE_VERSION) if app.config['STATS_CACHE_DB'] else None
+
 def get_cache_key(data_hash, operation):
     """Generar clave de caché única"""
     return f"{data_hash}_{operation}"
 
-def is_cache_valid(cache_entry):
-    """Verificar si una entrada de caché es válida"""
-    if not cache_entry:
-        return False
-    return time.time() - cache_entry['timestamp'] < cache_ttl
-
 def get_from_cache(data_hash, operation):
-    """Obtener datos del caché"""
-    key = get_cache_key(data_hash, operation)
-    cache_entry = cache.get(key)
-    
-    if is_cache_valid(cache_entry):
-        return cache_entry['data']
-    return None
+    """Obtener datos del caché; las estadísticas se buscan también en el nivel persistente"""
+    result = cache.get(data_hash, operation)
+    if result is None and stats_store is not None and operation.startswith(PERSISTENT_OPERATIONS):
+        result = stats_store.get(data_hash, operation)
+        if result is not None:
+            cache.set(data_hash, operation, result)
+    return result
 
 def set_cache(data_hash, operation, data):
     """Guardar datos en el caché"""
-    key = get_cache_key(data_hash, operation)
-    cache[key] = {
-        'data': data,
-        'timestamp': time.time()
-    }
+    cache.set(data_hash, operation, data)
+    if stats_store is not None and operation.startswith(PERSISTENT_OPERATIONS):
+        stats_store.set(data_hash, operation, data)
 
 def clear_cache():
-    """Limpiar todo el caché"""
-    global cache
+    """Limpiar todo el caché; devuelve False si no se pudieron borrar las estadísticas persistentes"""
     cache.clear()
+    return stats_store.clear() if stats_store is not None else True
 
-def get_data_hash(data):
-    """Generar hash único para los datos"""
-    if data is None or data.empty:
+def cached_operation(operation, cache_errors=False):
+    """Decorador: sirve el resultado desde la caché de resultados del dataset activo.
+    
+    operation es un formato ('chart_{0}') o una función que recibe los argumentos posicionales.
+    La clave es el id de versión del dataset activo (o data_hash, o la huella de processed_data si se pasa
+    explícito); la función recibe esos mismos datos y la clave, para reutilizarla en otras operaciones en caché. Los resultados con 'error' solo se guardan con cache_errors,
+    para operaciones cuyo error depende únicamente de los datos.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, processed_data=None, data_hash=None):
+            if processed_data is None:
+                frames = get_active_frames()
+                processed_data, data_hash = frames['processed_data'], frames['version_id']
+            elif data_hash is None:
+                data_hash = fingerprint_frame(processed_data)
+            name = operation(*args) if callable(operation) else operation.format(*args)
+            if data_hash is not None:
+                result = get_from_cache(data_hash, name)
+                if result is not None:
+                    return result
+            result = func(*args, processed_data=processed_data, data_hash=data_hash)
+            if data_hash is not None and isinstance(result, dict) and (cache_errors or 'error' not in result):
+                set_cache(data_hash, name, result)
+            return result
+        return wrapper
+    return decorator
+
+def _buffer_for_hash(values):
+    """Buffer contiguo de un índice o columna: numéricos y fechas tal cual, el resto con el hash de pandas"""
+    array = values.to_numpy() if hasattr(values, 'to_numpy') else np.asarray(values)
+    if array.dtype.kind in 'mM':
+        array = array.view('i8')
+    if array.dtype.kind not in 'biufc':
+        array = pd.util.hash_pandas_object(pd.Series(array), index=False).to_numpy()
+    return np.ascontiguousarray(array)
+
+def fingerprint_frame(frame):
+    """Huella del contenido: buffers del índice y de cada columna, más nombres, tipos y forma"""
+    if frame is None or frame.empty:
         return None
-    return hashlib.md5(str(data.values.tobytes()).encode()).hexdigest()
+    digest = hashlib.blake2b(digest_size=16)
+    layout = {
+        'shape': list(frame.shape),
+        'columns': [str(col) for col in frame.columns],
+        'dtypes': [str(dtype) for dtype in frame.dtypes],
+        'index': [str(frame.index.name), str(frame.index.dtype)]
+    }
+    digest.update(json.dumps(layout).encode('utf-8'))
+    digest.update(_buffer_for_hash(frame.index))
+    for position in range(frame.shape[1]):
+        digest.update(_buffer_for_hash(frame.iloc[:, position]))
+    return digest.hexdigest()
+
+def derive_version_id(parent_id, spec):
+    """Id de versión de una vista derivada (p. ej. un filtro) sin recorrer los datos"""
+    if parent_id is None:
+        return None
+    payload = f"{parent_id}|{json.dumps(spec, sort_keys=True, default=str)}"
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
 
 def init_db():
     """Inicializar la base de datos para el historial"""
@@ -330,13 +745,1117 @@ def get_analysis_by_id(analysis_id):
 
 # Inicializar la base de datos al iniciar la aplicación
 init_db()
+if stats_store is not None:
+    try:
+        stats_store.init()
+    except sqlite3.Error as e:
+        print(f"⚠️ Caché persistente de estadísticas desactivada: {e}")
+        stats_store = None
 
-def process_file_data(file_path):
-    """Procesa archivo CSV y prepara los datos para visualización"""
-    global current_data, processed_data, original_data
+# Caché de datasets procesados indexada por contenido del archivo
+PIPELINE_VERSION = '2'  # Incrementar cuando cambie el resultado de la ingesta
+parsed_cache_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+def save_upload_hashed(file_storage, file_path, block_size=1024 * 1024):
+    """Guarda el archivo subido por bloques calculando su SHA-256 al mismo tiempo"""
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as out:
+        while True:
+            block = file_storage.stream.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+def get_parsed_cache_key(content_hash, mode):
+    """Clave de caché: contenido + versión del pipeline + modo de procesamiento"""
+    return f"{content_hash}_v{PIPELINE_VERSION}_{mode}"
+
+def _encode_frame(name, frame, arrays):
+    """Codifica un DataFrame por columnas: numéricas y fechas tal cual, texto como códigos + categorías
+    
+    Los dtypes con nulos de pandas (Int64, boolean, Float64) se guardan como valores + máscara; nada se guarda
+    como objeto, porque np.savez lo serializaría con pickle y read_frames_file no lo admite.
+    """
+    columns = [('__index__', pd.Series(frame.index))]
+    columns += [(col, frame[col]) for col in frame.columns]
+    meta = {'columns': [], 'index_name': frame.index.name}
+    
+    for position, (col, series) in enumerate(columns):
+        key = f"{name}_{position}"
+        extra = {}
+        if pd.api.types.is_datetime64_any_dtype(series):
+            arrays[key] = series.to_numpy(dtype='datetime64[ns]').view('i8')
+            kind, categories = 'datetime', None
+        elif isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and hasattr(series.dtype, 'numpy_dtype'):
+            # Int64, boolean, Float64...: valores sin nulos más la máscara de pd.NA
+            arrays[key] = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+            arrays[f"{key}_mask"] = series.isna().to_numpy()
+            kind, categories, extra = 'masked', None, {'dtype': str(series.dtype)}
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            arrays[key] = series.to_numpy()
+            kind, categories = 'numeric', None
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            # Columnas categóricas de coerce_columns: se conservan sus códigos y el dtype
+            arrays[key] = series.cat.codes.to_numpy().astype(np.int32)
+            kind, categories = 'categorical', series.cat.categories.tolist()
+        else:
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            arrays[key] = codes.astype(np.int32)
+            kind, categories = 'category', uniques.tolist()
+        if arrays[key].dtype == object:
+            raise ValueError(f"La columna {col} ({series.dtype}) no se puede guardar sin pickle")
+        meta['columns'].append({'name': col, 'kind': kind, 'categories': categories, **extra})
+    return meta
+
+def _decode_frame(name, meta, arrays):
+    """Reconstruye un DataFrame codificado con _encode_frame"""
+    data = {}
+    index = None
+    for position, column in enumerate(meta['columns']):
+        values = arrays[f"{name}_{position}"]
+        if column['kind'] == 'datetime':
+            values = values.view('datetime64[ns]')
+        elif column['kind'] == 'category':
+            categories = np.array(column['categories'] + [np.nan], dtype=object)
+            values = categories[values]  # El código -1 apunta al NaN final
+        elif column['kind'] == 'categorical':
+            values = pd.Categorical.from_codes(values, categories=column['categories'])
+        elif column['kind'] == 'masked':
+            values = pd.array(values, dtype=column['dtype'])
+            values[arrays[f"{name}_{position}_mask"]] = pd.NA
+        if position == 0:
+            index = pd.Index(values, name=meta['index_name'])
+        else:
+            data[column['name']] = values
+    return pd.DataFrame(data, index=index, columns=[c['name'] for c in meta['columns'][1:]])
+
+def write_frames_file(path, frames, meta):
+    """Escribe varios DataFrames y sus metadatos en un .npz"""
+    arrays = {}
+    meta = {**meta, 'frames': {}}
+    for name, frame in frames.items():
+        if frame is not None:
+            meta['frames'][name] = _encode_frame(name, frame, arrays)
+    arrays['__meta__'] = np.frombuffer(json.dumps(meta, default=str).encode('utf-8'), dtype=np.uint8)
+    
+    # Escritura atómica para que un lector concurrente nunca vea un archivo a medias
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temp_path, path)
+
+def read_frames_file(path):
+    """Lee un archivo de write_frames_file; devuelve (frames, meta)"""
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = json.loads(arrays['__meta__'].tobytes().decode('utf-8'))
+        frames = {name: _decode_frame(name, frame_meta, arrays) for name, frame_meta in meta['frames'].items()}
+    return frames, meta
+
+def store_parsed_dataset(key, frames, message, notes):
+    """Guarda los DataFrames procesados en la caché en disco"""
+    folder = app.config['PARSED_CACHE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    write_frames_file(os.path.join(folder, f"{key}.npz"), frames, {'message': message, 'notes': notes})
+    parsed_cache_stats['stores'] += 1
+    evict_parsed_cache()
+
+def load_parsed_dataset(key):
+    """Carga un dataset procesado desde la caché; devuelve (frames, message, notes) o None"""
+    path = os.path.join(app.config['PARSED_CACHE_FOLDER'], f"{key}.npz")
+    if not os.path.exists(path):
+        parsed_cache_stats['misses'] += 1
+        return None
+    try:
+        frames, meta = read_frames_file(path)
+        os.utime(path)  # Marcar como usado recientemente para la expulsión
+        parsed_cache_stats['hits'] += 1
+        return frames, meta['message'], meta['notes']
+    except Exception as e:
+        print(f"⚠️ Entrada de caché de datasets inválida, se descarta: {e}")
+        os.remove(path)
+        parsed_cache_stats['misses'] += 1
+        return None
+
+def evict_parsed_cache():
+    """Expulsa las entradas usadas hace más tiempo hasta respetar el límite de tamaño"""
+    folder = app.config['PARSED_CACHE_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith('.npz'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= app.config['PARSED_CACHE_MAX_BYTES']:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            parsed_cache_stats['evictions'] += 1
+        except OSError:
+            continue
+
+def get_parsed_cache_info():
+    """Resumen de la caché de datasets procesados"""
+    folder = app.config['PARSED_CACHE_FOLDER']
+    sizes = [entry.stat().st_size for entry in os.scandir(folder) if entry.name.endswith('.npz')] if os.path.isdir(folder) else []
+    lookups = parsed_cache_stats['hits'] + parsed_cache_stats['misses']
+    return {
+        **parsed_cache_stats,
+        'hit_ratio': round(parsed_cache_stats['hits'] / lookups, 3) if lookups else 0,
+        'entries': len(sizes),
+        'bytes': sum(sizes),
+        'max_bytes': app.config['PARSED_CACHE_MAX_BYTES'],
+        'pipeline_version': PIPELINE_VERSION
+    }
+
+# Sesiones de carga: validar → reparar → procesar sin reenviar ni re-parsear el archivo
+upload_sessions = {}
+upload_sessions_lock = threading.Lock()
+
+def _session_bytes(upload_session):
+    """Memoria ocupada por los DataFrames de una sesión"""
+    return sum(int(df.memory_usage(deep=True).sum()) for df, schema in upload_session['frames'].values())
+
+def remove_upload_file(file_path):
+    """Borra un archivo subido que ya no se necesita"""
+    if file_path and os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            print(f"⚠️ No se pudo borrar {file_path}: {e}")
+
+def removing_upload(task, file_path):
+    """Envuelve una tarea de ingesta para borrar su archivo al terminar, con o sin éxito"""
+    def run():
+        try:
+            return task()
+        finally:
+            remove_upload_file(file_path)
+    return run
+
+def _discard_upload_session(upload_session):
+    """Borra el archivo temporal de una sesión descartada"""
+    remove_upload_file(upload_session.get('file_path'))
+
+def expire_upload_sessions():
+    """Descarta sesiones vencidas y, si se supera el presupuesto de memoria, las menos usadas"""
+    now = time.time()
+    removed = []
+    with upload_sessions_lock:
+        for session_id, upload_session in list(upload_sessions.items()):
+            if now - upload_session['last_access'] > app.config['UPLOAD_SESSION_TTL']:
+                removed.append(upload_sessions.pop(session_id))
+        
+        total = sum(upload_session['bytes'] for upload_session in upload_sessions.values())
+        for session_id in sorted(upload_sessions, key=lambda key: upload_sessions[key]['last_access']):
+            if total <= app.config['UPLOAD_SESSION_MAX_BYTES']:
+                break
+            upload_session = upload_sessions.pop(session_id)
+            total -= upload_session['bytes']
+            removed.append(upload_session)
+    
+    for upload_session in removed:
+        _discard_upload_session(upload_session)
+    if removed:
+        print(f"🗑️ Sesiones de carga descartadas: {len(removed)}")
+    return len(removed)
+
+def create_upload_session(df, schema, file_path, filename, content_hash):
+    """Guarda el DataFrame parseado y su schema; devuelve el id o None si no cabe en el presupuesto"""
+    session_id = uuid.uuid4().hex
+    now = time.time()
+    upload_session = {
+        'frames': {'parsed': (df, schema)},
+        'file_path': file_path,
+        'filename': filename,
+        'content_hash': content_hash,
+        'created': now,
+        'last_access': now
+    }
+    upload_session['bytes'] = _session_bytes(upload_session)
+    with upload_sessions_lock:
+        upload_sessions[session_id] = upload_session
+    expire_upload_sessions()
+    
+    with upload_sessions_lock:
+        if session_id not in upload_sessions:
+            print(f"⚠️ Dataset demasiado grande para una sesión de carga ({upload_session['bytes']} bytes)")
+            return None
+    print(f"🎫 Sesión de carga creada: {session_id} ({upload_session['bytes'] / 1024 / 1024:.1f} MB)")
+    return session_id
+
+def get_upload_session(session_id):
+    """Devuelve la sesión si sigue vigente y renueva su último acceso"""
+    expire_upload_sessions()
+    with upload_sessions_lock:
+        upload_session = upload_sessions.get(session_id)
+        if upload_session:
+            upload_session['last_access'] = time.time()
+        return upload_session
+
+def get_session_frame(upload_session, stage='parsed'):
+    """Copia del DataFrame de una etapa ('parsed' o 'repaired') y su schema; el llamador puede modificarla"""
+    df, schema = upload_session['frames'].get(stage) or upload_session['frames']['parsed']
+    return df.copy(), schema
+
+def set_session_frame(session_id, stage, df, schema):
+    """Guarda el resultado de una etapa (por ejemplo, la reparación) en la sesión"""
+    with upload_sessions_lock:
+        upload_session = upload_sessions.get(session_id)
+        if upload_session is None:
+            return False
+        upload_session['frames'][stage] = (df, schema)
+        upload_session['bytes'] = _session_bytes(upload_session)
+        upload_session['last_access'] = time.time()
+    expire_upload_sessions()
+    return True
+
+def drop_upload_session(session_id):
+    """Descarta una sesión ya consumida"""
+    with upload_sessions_lock:
+        upload_session = upload_sessions.pop(session_id, None)
+    if upload_session:
+        _discard_upload_session(upload_session)
+
+def get_upload_session_info():
+    """Resumen de las sesiones de carga activas"""
+    with upload_sessions_lock:
+        return {
+            'active': len(upload_sessions),
+            'bytes': sum(upload_session['bytes'] for upload_session in upload_sessions.values()),
+            'max_bytes': app.config['UPLOAD_SESSION_MAX_BYTES'],
+            'ttl': app.config['UPLOAD_SESSION_TTL']
+        }
+
+def session_expired_response():
+    """Respuesta común cuando el id de sesión ya no existe; el cliente debe reenviar el archivo"""
+    return jsonify({
+        'success': False,
+        'message': 'La sesión de carga expiró, vuelve a enviar el archivo',
+        'session_expired': True
+    }), 410
+
+# Registro de datasets: cada sesión de navegador (cookie dataset_id) tiene sus propios frames.
+# Los datasets usados hace más tiempo se escriben a disco cuando se supera el presupuesto de memoria
+# y se recargan al volver a pedirlos.
+DATASET_COOKIE = 'dataset_id'
+DATASET_FRAMES = ('current_data', 'processed_data', 'original_data')
+_DATASET_ID = re.compile(r'^[0-9a-f]{32}$')
+datasets = {}
+datasets_lock = ReadWriteLock()  # Las lecturas de gráficos y estadísticas no se bloquean entre sí
+dataset_stats = {'spills': 0, 'reloads': 0, 'lost': 0}
+
+def _empty_frames():
+    return {name: None for name in DATASET_FRAMES}
+
+def _frames_bytes(frames):
+    """Memoria ocupada por los frames de un dataset"""
+    total = 0
+    for frame in frames.values():
+        if frame is not None:
+            total += int(frame.memory_usage(deep=True).sum())
+    return total
+
+def _private_frames(entry):
+    """Frames que solo viven en este proceso (el pivot publicado en el almacén compartido no cuenta)"""
+    shared = entry.get('store_version') is not None
+    return {name: frame for name, frame in entry['frames'].items()
+            if frame is not None and not (shared and name == 'processed_data')}
+
+def _entry_bytes(entry):
+    # Las vistas de filtros con posiciones sueltas son copias y cuentan para el presupuesto de memoria
+    copies = {str(position): level['view'] for position, level in enumerate(entry.get('filters') or [])
+              if level.get('view') is not None and not isinstance(level['rows'], slice)}
+    return _frames_bytes(_private_frames(entry)) + _frames_bytes(copies)
+
+def _dataset_spill_path(dataset_id):
+    return os.path.join(app.config['DATASET_SPILL_FOLDER'], f"{dataset_id}.npz")
+
+def resolve_dataset_id():
+    """Id del dataset de la petición (cabecera, parámetro o cookie) o del trabajo de ingesta en curso"""
+    job = _current_job()
+    if job is not None:
+        return job.get('dataset_id', 'default')
+    if not has_request_context():
+        return 'default'
+    if 'dataset_id' not in g:
+        dataset_id = (request.headers.get('X-Dataset-Id') or request.args.get('dataset_id')
+                      or request.cookies.get(DATASET_COOKIE))
+        if not dataset_id or not _DATASET_ID.match(dataset_id):
+            dataset_id = uuid.uuid4().hex
+            g.new_dataset_id = dataset_id
+        g.dataset_id = dataset_id
+    return g.dataset_id
+
+@app.after_request
+def attach_dataset_cookie(response):
+    """Entrega la cookie con el id de dataset asignado en esta petición"""
+    dataset_id = g.get('new_dataset_id')
+    if dataset_id:
+        response.set_cookie(DATASET_COOKIE, dataset_id, max_age=app.config['DATASET_SPILL_TTL'],
+                            httponly=True, samesite='Lax')
+    return response
+
+def conditional_get(view):
+    """Decorador de rutas GET: ETag fuerte por versión del dataset y parámetros de la petición.
+    
+    Si el cliente ya tiene esa versión (If-None-Match) se responde 304 sin calcular ni serializar nada.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version_id = get_active_frames()['version_id']
+        if version_id is None:
+            return view(*args, **kwargs)
+        key = json.dumps([version_id, request.path, sorted(request.args.items(multi=True))])
+        etag = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        # Datos por sesión que cambian al cargar o filtrar: el navegador siempre revalida
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+def _spill_dataset(entry):
+    """Escribe los frames de un dataset a disco y los libera de memoria (con datasets_lock de escritura)"""
+    frames = _private_frames(entry)  # El pivot compartido se vuelve a mapear desde el almacén
+    try:
+        os.makedirs(app.config['DATASET_SPILL_FOLDER'], exist_ok=True)
+        filters = [level['filter'] for level in entry['filters']]
+        meta = {'notes': entry['notes'], 'filters': filters, 'store_version': entry.get('store_version'),
+                'version_id': entry.get('version_id')}
+        write_frames_file(_dataset_spill_path(entry['id']), frames, meta)
+    except Exception as e:
+        print(f"⚠️ No se pudo escribir el dataset {entry['id']} a disco, se conserva en memoria: {e}")
+        return False
+    entry['frames'] = None
+    entry['filters'] = []  # Las vistas se reconstruyen al recargar
+    dataset_stats['spills'] += 1
+    print(f"💾 Dataset {entry['id']} escrito a disco ({entry['bytes'] / 1024 / 1024:.1f} MB)")
+    return True
+
+def _reload_dataset(entry):
+    """Recarga desde disco los frames de un dataset expulsado (con datasets_lock de escritura)"""
+    path = _dataset_spill_path(entry['id'])
+    if not os.path.exists(path):
+        # Solo existe en el almacén compartido (publicado por otro proceso)
+        entry['frames'] = _empty_frames()
+        return True
+    try:
+        frames, meta = read_frames_file(path)
+    except Exception as e:
+        print(f"⚠️ No se pudo recargar el dataset {entry['id']}: {e}")
+        del datasets[entry['id']]
+        dataset_stats['lost'] += 1
+        return False
+    entry['frames'] = {**_empty_frames(), **frames}
+    entry['notes'] = meta.get('notes') or entry['notes']
+    entry['store_version'] = meta.get('store_version')
+    entry['version_id'] = meta.get('version_id')
+    if entry['store_version'] is not None:
+        _attach_store_version(entry, entry['store_version'])
+    _rebuild_filters(entry, meta.get('filters') or [])
+    dataset_stats['reloads'] += 1
+    os.remove(path)
+    return True
+
+def _enforce_dataset_budget(keep=None):
+    """Expulsa a disco los datasets usados hace más tiempo hasta respetar DATASET_MEMORY_BYTES (con datasets_lock de escritura)"""
+    resident = [entry for entry in datasets.values() if entry['frames'] is not None]
+    total = sum(entry['bytes'] for entry in resident)
+    for entry in sorted(resident, key=lambda entry: entry['last_access']):
+        if total <= app.config['DATASET_MEMORY_BYTES']:
+            break
+        if entry['id'] != keep and _spill_dataset(entry):
+            total -= entry['bytes']
+
+def _get_dataset_entry(dataset_id):
+    """Entrada del registro con sus frames en memoria, recargándola de disco si hace falta (con datasets_lock de escritura)"""
+    entry = datasets.get(dataset_id)
+    version = store_version(dataset_id)
+    if entry is None and (version is not None or os.path.exists(_dataset_spill_path(dataset_id))):
+        # Dataset publicado por otro proceso o escrito a disco por un proceso anterior
+        entry = {'id': dataset_id, 'frames': None, 'notes': {'warnings': [], 'repairs': []}, 'filters': [],
+                 'bytes': 0, 'sequence': 0, 'store_version': None, 'version_id': None, 'last_access': time.time()}
+        datasets[dataset_id] = entry
+    if entry is None:
+        return None
+    entry['last_access'] = time.time()
+    if entry['frames'] is None:
+        if not _reload_dataset(entry):
+            return None
+    if version is not None and (entry.get('store_version') != version or entry['frames']['processed_data'] is None):
+        _attach_store_version(entry, version)
+    entry['bytes'] = _entry_bytes(entry)
+    _enforce_dataset_budget(keep=dataset_id)
+    return entry
+
+def _read_dataset(dataset_id, reader):
+    """Ejecuta reader(entry) con lock de lectura si el dataset está en memoria y al día con el almacén compartido;
+    si no, lo recarga con lock de escritura"""
+    version = store_version(dataset_id)
+    with datasets_lock.read():
+        entry = datasets.get(dataset_id)
+        if entry is not None and entry['frames'] is not None and (version is None or entry.get('store_version') == version):
+            entry['last_access'] = time.time()
+            _touch_store(entry)
+            return reader(entry)
+    with datasets_lock.write():
+        return reader(_get_dataset_entry(dataset_id))
+
+def get_active_frames(filtered=True):
+    """Frames (current_data, processed_data, original_data) del dataset de la petición o del trabajo
+    
+    Con filtered=True, processed_data es la vista de los filtros aplicados. La clave 'version_id'
+    identifica el contenido de ese processed_data (sirve de clave de caché sin recorrer los datos).
+    """
+    def read_frames(entry):
+        if entry is None:
+            return {**_empty_frames(), 'version_id': None}
+        frames = {**entry['frames'], 'version_id': entry.get('version_id')}
+        if filtered and entry['filters']:
+            frames['processed_data'] = entry['filters'][-1]['view']
+            frames['version_id'] = entry['filters'][-1]['version_id']
+        return frames
+    return _read_dataset(resolve_dataset_id(), read_frames)
+
+def store_dataset(dataset_id, frames, notes=None, sequence=None, base_version_id=None):
+    """Guarda el resultado de una ingesta en el registro; un trabajo más antiguo no reemplaza a uno más reciente
+    
+    Los pivots con índice de fechas se publican en el almacén compartido y se usan mapeados desde ahí.
+    Con base_version_id (carga incremental) solo se guarda si el dataset sigue en esa versión; si no, devuelve False.
+    """
+    with datasets_lock.write():
+        if base_version_id is not None:
+            entry = _get_dataset_entry(dataset_id)  # Al día con lo publicado por otros procesos
+            if entry is None or entry.get('version_id') != base_version_id:
+                return False
+        else:
+            entry = datasets.get(dataset_id)
+            if entry is not None and sequence is not None and sequence <= entry['sequence']:
+                return False
+        if entry is None:
+            entry = datasets[dataset_id] = {'id': dataset_id, 'sequence': 0}
+        frames = {**_empty_frames(), **frames}
+        version = version_id = None
+        if can_share_pivot(frames['processed_data']):
+            base_version = entry.get('store_version') if base_version_id is not None else None
+            try:
+                published = publish_pivot(dataset_id, frames['processed_data'], base_version, frames, notes)
+            except Exception as e:
+                print(f"⚠️ No se pudo publicar el dataset {dataset_id} en el almacén compartido: {e}")
+                published = ()
+            if published is None:
+                return False  # Otro proceso publicó antes una versión sobre la misma base
+            if published:
+                version, frames['processed_data'], version_id = published
+        if version is None:
+            version_id = fingerprint_frame(frames['processed_data'])
+        entry.update({
+            'frames': frames,
+            'notes': notes or {'warnings': [], 'repairs': []},
+            'filters': [],
+            'store_version': version,
+            'version_id': version_id,  # Identifica el contenido del pivot para la caché de resultados
+            'last_access': time.time()
+        })
+        entry['bytes'] = _entry_bytes(entry)
+        if sequence is not None:
+            entry['sequence'] = max(entry['sequence'], sequence)
+        spill_path = _dataset_spill_path(dataset_id)
+        if os.path.exists(spill_path):
+            os.remove(spill_path)  # La copia en disco corresponde a la versión anterior
+        _enforce_dataset_budget(keep=dataset_id)
+    expire_dataset_spill()
+    expire_dataset_store()
+    return True
+
+def expire_dataset_spill():
+    """Elimina los datasets en disco sin uso durante más de DATASET_SPILL_TTL segundos"""
+    folder = app.config['DATASET_SPILL_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    limit = time.time() - app.config['DATASET_SPILL_TTL']
+    with datasets_lock.write():
+        for entry in os.scandir(folder):
+            if entry.name.endswith('.npz') and entry.stat().st_mtime < limit:
+                dataset_id = entry.name[:-4]
+                if dataset_id in datasets and datasets[dataset_id]['frames'] is None:
+                    del datasets[dataset_id]
+                os.remove(entry.path)
+
+# Almacén compartido: el pivot de cada dataset se publica en archivos mapeados en memoria
+# (índice Fecha + una fila float64 contigua por tipo de movimiento) con un contador de versión.
+# Todos los procesos del servidor mapean la misma copia en solo lectura y ven las versiones nuevas.
+def _store_dir(dataset_id):
+    return os.path.join(app.config['DATASET_STORE_FOLDER'], dataset_id)
+
+_store_versions = {}  # dataset_id -> (firma de CURRENT, versión): se relee solo si CURRENT cambió
+
+def store_version(dataset_id):
+    """Versión publicada de un dataset en el almacén compartido, o None"""
+    path = os.path.join(_store_dir(dataset_id), 'CURRENT')
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _store_versions.pop(dataset_id, None)
+        return None
+    # CURRENT se reemplaza con os.replace: un inodo o una fecha distinta indican una versión nueva
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _store_versions.get(dataset_id)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    try:
+        with open(path, encoding='utf-8') as f:
+            version = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    _store_versions[dataset_id] = (signature, version)
+    return version
+
+def can_share_pivot(pivot):
+    """Solo se comparten pivots con índice de fechas y columnas numéricas"""
+    return (pivot is not None and isinstance(pivot.index, pd.DatetimeIndex) and len(pivot.columns) > 0
+            and pivot.columns.is_unique and all(pd.api.types.is_numeric_dtype(dtype) for dtype in pivot.dtypes))
+
+def publish_pivot(dataset_id, pivot, base_version=None, detail=None, notes=None):
+    """Publica un pivot como nueva versión del dataset; devuelve (versión, pivot mapeado, huella)
+    
+    Con base_version solo se publica la versión siguiente a esa: si CURRENT ya avanzó o otro proceso
+    reservó esa versión, devuelve None. detail (current_data/original_data) y notes se guardan junto al
+    pivot para que los demás procesos puedan generar informes y exportaciones.
+    """
+    folder = _store_dir(dataset_id)
+    os.makedirs(folder, exist_ok=True)
+    current = store_version(dataset_id)
+    if base_version is not None and current != base_version:
+        return None
+    version = (current or 0) + 1
+    while True:
+        # mkdir es atómico: dos procesos que publican a la vez no comparten versión
+        version_dir = os.path.join(folder, f"v{version}")
+        try:
+            os.mkdir(version_dir)
+            break
+        except FileExistsError:
+            if base_version is not None:
+                return None
+            version += 1
+    
+    try:
+        mapped, fingerprint = _write_version_dir(version_dir, version, pivot)
+        _write_version_detail(version_dir, detail or {}, notes)
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)  # Una versión a medias no debe bloquear la siguiente
+        raise
+    
+    # Los lectores solo siguen CURRENT, que se reemplaza de forma atómica cuando la versión está completa
+    temp_path = os.path.join(folder, f"CURRENT.{uuid.uuid4().hex}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(str(version))
+    os.replace(temp_path, os.path.join(folder, 'CURRENT'))
+    _prune_store_versions(folder, version)
+    return version, mapped, fingerprint
+
+def _write_version_dir(version_dir, version, pivot):
+    """Escribe los archivos de una versión; devuelve (pivot mapeado, huella)"""
+    np.save(os.path.join(version_dir, 'index.npy'), pivot.index.to_numpy(dtype='datetime64[ns]').view('i8'))
+    # Matriz (tipos x fechas): cada tipo de movimiento es un bloque contiguo y values.T no requiere copia
+    np.save(os.path.join(version_dir, 'values.npy'), np.ascontiguousarray(pivot.to_numpy(dtype=np.float64).T))
+    meta = {
+        'version': version,
+        'columns': [str(col) for col in pivot.columns],
+        'columns_name': pivot.columns.name,
+        'index_name': pivot.index.name,
+        'rows': len(pivot),
+        'created': time.time()
+    }
+    # La huella se calcula una sola vez, sobre el pivot tal como lo verán los lectores
+    mapped = _map_version_dir(version_dir, meta)
+    meta['fingerprint'] = fingerprint_frame(mapped)
+    with open(os.path.join(version_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return mapped, meta['fingerprint']
+
+def _write_version_detail(version_dir, detail, notes):
+    """Guarda los datos de detalle de una versión; si no se pueden codificar, la versión queda solo con el pivot"""
+    current, original = detail.get('current_data'), detail.get('original_data')
+    frames = {'current_data': current, 'original_data': None if original is current else original}
+    if all(frame is None for frame in frames.values()):
+        return
+    try:
+        write_frames_file(os.path.join(version_dir, 'detail.npz'), frames,
+                          {'notes': notes, 'original_is_current': original is current})
+    except Exception as e:
+        print(f"⚠️ Los datos de detalle de {version_dir} no se comparten con otros procesos: {e}")
+
+def load_store_detail(dataset_id, version):
+    """Datos de detalle y notas de una versión publicada por otro proceso; devuelve (frames, notas)"""
+    path = os.path.join(_store_dir(dataset_id), f"v{version}", 'detail.npz')
+    if not os.path.exists(path):
+        return {}, None
+    try:
+        frames, meta = read_frames_file(path)
+    except Exception as e:
+        print(f"⚠️ No se pudieron leer los datos de detalle de la versión {version} del dataset {dataset_id}: {e}")
+        return {}, None
+    if meta.get('original_is_current'):
+        frames['original_data'] = frames.get('current_data')
+    return frames, meta.get('notes')
+
+def _prune_store_versions(folder, version):
+    """Borra las versiones anteriores a la previa reemplazadas hace más de DATASET_STORE_GRACE segundos,
+    para que un proceso que acaba de leer CURRENT aún pueda mapearlas"""
+    limit = time.time() - app.config['DATASET_STORE_GRACE']
+    for entry in os.scandir(folder):
+        if not (entry.is_dir() and entry.name.startswith('v') and entry.name[1:].isdigit()):
+            continue
+        number = int(entry.name[1:])
+        if number >= version - 1:
+            continue
+        # La versión dejó de ser la actual cuando se completó la siguiente
+        try:
+            replaced = os.stat(os.path.join(folder, f"v{number + 1}", 'meta.json')).st_mtime
+        except OSError:
+            replaced = 0  # La siguiente ya se borró: esta quedó reemplazada hace tiempo
+        if replaced < limit:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def _map_version_dir(version_dir, meta):
+    """Mapea en solo lectura los archivos de una versión; el DataFrame usa las páginas compartidas sin copiarlas"""
+    index = pd.DatetimeIndex(np.load(os.path.join(version_dir, 'index.npy')).view('datetime64[ns]'), name=meta['index_name'])
+    values = np.load(os.path.join(version_dir, 'values.npy'), mmap_mode='r')
+    columns = pd.Index(meta['columns'], name=meta['columns_name'])
+    return pd.DataFrame(values.T, index=index, columns=columns, copy=False)
+
+def map_pivot(dataset_id, version):
+    """Mapea una versión publicada; devuelve (pivot, metadatos)"""
+    version_dir = os.path.join(_store_dir(dataset_id), f"v{version}")
+    with open(os.path.join(version_dir, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    return _map_version_dir(version_dir, meta), meta
+
+def _attach_store_version(entry, version):
+    """Reemplaza el pivot de una entrada por la versión publicada (con datasets_lock de escritura)"""
+    try:
+        pivot, meta = map_pivot(entry['id'], version)
+    except Exception as e:
+        print(f"⚠️ No se pudo mapear la versión {version} del dataset {entry['id']}: {e}")
+        return False
+    if entry.get('store_version') != version:
+        # Versión publicada por otro proceso: los datos de detalle locales ya no corresponden
+        detail, notes = load_store_detail(entry['id'], version)
+        entry['frames'] = {**_empty_frames(), **detail, 'processed_data': pivot}
+        if notes is not None:
+            entry['notes'] = notes
+        specs = [level['filter'] for level in entry['filters']]
+        entry['store_version'] = version
+        entry['version_id'] = meta.get('fingerprint') or fingerprint_frame(pivot)
+        _rebuild_filters(entry, specs)
+    else:
+        entry['frames']['processed_data'] = pivot
+    entry['bytes'] = _entry_bytes(entry)
+    return True
+
+def _touch_store(entry):
+    """Marca como usado el dataset compartido (como mucho una vez por minuto) para que no expire"""
+    now = time.time()
+    if entry.get('store_version') is not None and now - entry.get('store_touched', 0) > 60:
+        entry['store_touched'] = now
+        try:
+            os.utime(os.path.join(_store_dir(entry['id']), 'CURRENT'))
+        except OSError:
+            pass
+
+def expire_dataset_store():
+    """Elimina los datasets compartidos sin uso durante más de DATASET_SPILL_TTL segundos"""
+    folder = app.config['DATASET_STORE_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    limit = time.time() - app.config['DATASET_SPILL_TTL']
+    for entry in os.scandir(folder):
+        current = os.path.join(entry.path, 'CURRENT')
+        if entry.is_dir() and entry.name != 'jobs' and os.path.exists(current) and os.stat(current).st_mtime < limit:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            _store_versions.pop(entry.name, None)
+
+def get_dataset_store_info():
+    """Resumen del almacén compartido"""
+    folder = app.config['DATASET_STORE_FOLDER']
+    total, count = 0, 0
+    if os.path.isdir(folder):
+        for root, dirs, files in os.walk(folder):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        count = sum(1 for entry in os.scandir(folder) if entry.is_dir() and entry.name != 'jobs')
+    return {'folder': folder, 'datasets': count, 'bytes': total}
+
+# Filtros: pila de selecciones de filas sobre el pivot base, que nunca se modifica.
+# Cada nivel guarda la selección (slice o posiciones) y su vista; deshacer o limpiar solo recorta la pila.
+FILTER_KEYS = ('date_from', 'date_to', 'movement_type')
+
+def _row_positions(rows, length):
+    """Posiciones de fila de una selección (slice o array de posiciones ordenadas)"""
+    return np.arange(length)[rows] if isinstance(rows, slice) else rows
+
+def _intersect_rows(rows, start, stop):
+    """Recorta una selección al rango de posiciones [start, stop)"""
+    if isinstance(rows, slice):
+        start = max(rows.start, start)
+        return slice(start, max(start, min(rows.stop, stop)))
+    return rows[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+
+def resolve_filter(base, rows, spec):
+    """Aplica un filtro a la selección anterior y devuelve la nueva; lanza ValueError si no es aplicable"""
+    if spec.get('date_from') or spec.get('date_to'):
+        index = base.index
+        if not isinstance(index, pd.DatetimeIndex):
+            raise ValueError('El dataset no tiene un índice de fechas')
+        date_from = pd.to_datetime(spec['date_from']) if spec.get('date_from') else None
+        date_to = pd.to_datetime(spec['date_to']) if spec.get('date_to') else None
+        if index.is_monotonic_increasing:
+            # Búsqueda binaria sobre el índice ordenado: el rango queda como slice
+            start = index.searchsorted(date_from, side='left') if date_from is not None else 0
+            stop = index.searchsorted(date_to, side='right') if date_to is not None else len(index)
+            rows = _intersect_rows(rows, int(start), int(stop))
+        else:
+            mask = np.ones(len(index), dtype=bool)
+            if date_from is not None:
+                mask &= index >= date_from
+            if date_to is not None:
+                mask &= index <= date_to
+            rows = np.intersect1d(_row_positions(rows, len(base)), np.flatnonzero(mask))
     
+    movement_type = spec.get('movement_type')
+    if movement_type:
+        if movement_type not in base.columns:
+            raise ValueError(f'Tipo de movimiento no encontrado: {movement_type}')
+        # Solo las filas donde este tipo de movimiento tiene valores
+        values = base[movement_type].to_numpy()[rows]
+        rows = _row_positions(rows, len(base))[pd.notna(values) & (values > 0)]
+    return rows
+
+def _compact_rows(rows):
+    """Posiciones consecutivas como slice, para que su vista no copie los datos"""
+    if isinstance(rows, slice):
+        return rows
+    if len(rows) == 0:
+        return slice(0, 0)
+    if rows[-1] - rows[0] + 1 == len(rows):
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+    return rows
+
+def _filter_view(base, rows):
+    """Vista del pivot para una selección.
+    
+    Con un slice no se copian los datos. Con posiciones sueltas take() copia esas filas: como mucho el pivot
+    (meses x tipos de movimiento), y solo para el nivel superior de la pila, que es el único que se lee.
+    """
+    return base.iloc[rows] if isinstance(rows, slice) else base.take(rows)
+
+def _push_filter_level(entry, spec):
+    """Agrega un nivel a la pila de filtros de un dataset (con datasets_lock de escritura)"""
+    base = entry['frames']['processed_data']
+    parent = entry['filters'][-1] if entry['filters'] else None
+    rows = parent['rows'] if parent else slice(0, len(base))
+    rows = _compact_rows(resolve_filter(base, rows, spec))
+    parent_id = parent['version_id'] if parent else entry.get('version_id')
+    if parent is not None and not isinstance(parent['rows'], slice):
+        parent['view'] = None  # Los niveles intermedios solo guardan sus posiciones; la copia se libera
+    level = {'filter': spec, 'rows': rows, 'view': _filter_view(base, rows),
+             'version_id': derive_version_id(parent_id, spec)}
+    entry['filters'].append(level)
+    entry['bytes'] = _entry_bytes(entry)
+    return level
+
+def _rebuild_filters(entry, specs):
+    """Reconstruye la pila de filtros de un dataset recargado desde disco"""
+    entry['filters'] = []
+    for spec in specs:
+        try:
+            _push_filter_level(entry, spec)
+        except ValueError:
+            break
+
+def push_filter(spec):
+    """Aplica un filtro sobre el dataset activo; devuelve la vista filtrada y la profundidad de la pila"""
+    spec = {key: spec[key] for key in FILTER_KEYS if spec.get(key)}
+    if not spec:
+        raise ValueError('No se indicó ningún filtro')
+    with datasets_lock.write():
+        entry = _get_dataset_entry(resolve_dataset_id())
+        if entry is None or entry['frames']['processed_data'] is None:
+            return None, 0
+        level = _push_filter_level(entry, spec)
+        return level['view'], len(entry['filters'])
+
+def pop_filters(count=1):
+    """Quita los últimos filtros (todos con count=None); devuelve la vista resultante y la profundidad"""
+    with datasets_lock.write():
+        entry = _get_dataset_entry(resolve_dataset_id())
+        if entry is None or entry['frames']['processed_data'] is None:
+            return None, 0
+        filters = entry['filters']
+        del filters[0 if count is None else max(len(filters) - count, 0):]
+        if not filters:
+            return entry['frames']['processed_data'], 0
+        if filters[-1]['view'] is None:
+            filters[-1]['view'] = _filter_view(entry['frames']['processed_data'], filters[-1]['rows'])
+        entry['bytes'] = _entry_bytes(entry)
+        return filters[-1]['view'], len(filters)
+
+def get_active_filters():
+    """Filtros aplicados al dataset activo, del más antiguo al más reciente"""
+    return _read_dataset(resolve_dataset_id(),
+                         lambda entry: [level['filter'] for level in entry['filters']] if entry is not None else [])
+
+def get_dataset_registry_info():
+    """Resumen del registro de datasets"""
+    with datasets_lock.read():
+        resident = [entry for entry in datasets.values() if entry['frames'] is not None]
+        return {
+            **dataset_stats,
+            'datasets': len(datasets),
+            'resident': len(resident),
+            'spilled': len(datasets) - len(resident),
+            'shared': sum(1 for entry in resident if entry.get('store_version') is not None),
+            'bytes': sum(entry['bytes'] for entry in resident),
+            'max_bytes': app.config['DATASET_MEMORY_BYTES'],
+            'store': get_dataset_store_info()
+        }
+
+# Trabajos de ingesta en segundo plano: /upload encola y responde con un id de trabajo
+ingestion_executor = ThreadPoolExecutor(max_workers=app.config['INGEST_WORKERS'], thread_name_prefix='ingesta')
+ingestion_jobs = {}
+ingestion_jobs_lock = threading.Lock()
+_ingest_context = threading.local()  # Trabajo que se está ejecutando en el hilo actual
+_job_sequence = 0
+
+def _current_job():
+    """Trabajo de ingesta del hilo actual, o None si se procesa dentro de una petición"""
+    return getattr(_ingest_context, 'job', None)
+
+def set_active_dataset(current, processed, original):
+    """Publica el resultado de un procesamiento; dentro de un trabajo queda pendiente hasta su promoción"""
+    frames = {'current_data': current, 'processed_data': processed, 'original_data': original}
+    job = _current_job()
+    if job is not None:
+        job['frames'] = frames
+    else:
+        store_dataset(resolve_dataset_id(), frames)
+
+def set_ingest_notes(warnings=None, repairs=None):
+    """Registra advertencias y reparaciones del procesamiento en curso y devuelve el dict para ampliarlo"""
+    notes = {'warnings': list(warnings or []), 'repairs': list(repairs or [])}
+    job = _current_job()
+    if job is not None:
+        job['notes'] = notes
+    else:
+        with datasets_lock.write():
+            entry = _get_dataset_entry(resolve_dataset_id())
+            if entry is not None:
+                entry['notes'] = notes
+    return notes
+
+def get_ingest_result():
+    """Frames y notas del procesamiento en curso (del trabajo actual o del dataset activo)"""
+    job = _current_job()
+    if job is not None:
+        return job.get('frames'), job.get('notes') or {'warnings': [], 'repairs': []}
+    def read_result(entry):
+        if entry is None:
+            return _empty_frames(), {'warnings': [], 'repairs': []}
+        return dict(entry['frames']), entry['notes']
+    return _read_dataset(resolve_dataset_id(), read_result)
+
+def report_progress(stage, percent=None, rows=None):
+    """Actualiza etapa, porcentaje y filas procesadas del trabajo actual (sin efecto fuera de un trabajo)"""
+    job = _current_job()
+    if job is None:
+        return
+    with ingestion_jobs_lock:
+        job['stage'] = stage
+        if percent is not None:
+            job['percent'] = max(job['percent'], min(int(percent), 99))
+        if rows is not None:
+            job['rows_processed'] = int(rows)
+
+def get_dataset_info(processed):
+    """Resumen del dataset procesado que se devuelve al cliente tras la carga"""
+    try:
+        return {
+            'total_records': len(processed) if processed is not None else 0,
+            'date_range': get_date_range(processed),
+            'movement_types': list(processed.columns) if processed is not None else [],
+            'total_tonnage': float(processed.sum().sum()) if processed is not None and not processed.empty else 0
+        }
+    except Exception as e:
+        print(f"Error obteniendo info del dataset: {e}")
+        return {
+            'total_records': 0,
+            'date_range': 'N/A',
+            'movement_types': [],
+            'total_tonnage': 0
+        }
+
+def _public_job(job):
+    """Copia serializable del estado de un trabajo (con ingestion_jobs_lock tomado)"""
+    return {key: value for key, value in job.items() if key not in ('frames', 'notes', 'sequence', 'dataset_id', 'rebase', 'base_version_id')}
+
+def _job_snapshot_folder():
+    return os.path.join(app.config['DATASET_STORE_FOLDER'], 'jobs')
+
+def _job_snapshot_path(job_id):
+    return os.path.join(_job_snapshot_folder(), f"{job_id}.json")
+
+def _save_job_snapshot(job):
+    """Guarda el estado del trabajo en el almacén compartido para que cualquier proceso pueda responder su consulta"""
+    with ingestion_jobs_lock:
+        snapshot = _public_job(job)
+    path = _job_snapshot_path(job['id'])
+    try:
+        os.makedirs(_job_snapshot_folder(), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, default=str)
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el estado del trabajo {job['id']}: {e}")
+
+def _prune_ingestion_jobs():
+    """Olvida trabajos terminados hace más de INGEST_JOB_TTL segundos"""
+    now = time.time()
+    with ingestion_jobs_lock:
+        for job_id, job in list(ingestion_jobs.items()):
+            if job['finished'] and now - job['finished'] > app.config['INGEST_JOB_TTL']:
+                del ingestion_jobs[job_id]
+    folder = _job_snapshot_folder()
+    if os.path.isdir(folder):
+        for entry in os.scandir(folder):
+            if entry.name.endswith('.json') and now - entry.stat().st_mtime > app.config['INGEST_JOB_TTL']:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+def _run_ingestion_job(job, task):
+    """Ejecuta la tarea en un hilo del pool y promueve su resultado al dataset activo"""
+    _ingest_context.job = job
+    with ingestion_jobs_lock:
+        job['status'] = 'running'
+        job['started'] = time.time()
+    try:
+        success, message, from_cache = task()
+        if success and job.get('frames'):
+            # Un trabajo más antiguo que termina tarde no reemplaza a uno más reciente del mismo dataset
+            promoted = store_dataset(job['dataset_id'], job['frames'], job.get('notes'), job['sequence'], job.get('base_version_id'))
+            for _ in range(INCREMENTAL_MAX_REBASES):
+                # Una carga incremental cuya base cambió mientras tanto se vuelve a fusionar sobre la versión nueva
+                if promoted or not job.get('rebase') or not job['rebase']():
+                    break
+                promoted = store_dataset(job['dataset_id'], job['frames'], job.get('notes'), job['sequence'], job['base_version_id'])
+            notes = job.get('notes') or {}
+            result = {
+                'info': get_dataset_info(job['frames']['processed_data']),
+                'warnings': notes.get('warnings', []),
+                'repairs_made': notes.get('repairs', []),
+                'from_cache': from_cache,
+                'promoted': promoted
+            }
+            if 'changes' in notes:
+                result['changes'] = notes['changes']
+            status = 'done'
+        else:
+            result, status = None, 'failed'
+            if success:
+                message = "El procesamiento no produjo datos"
+        warmup_version = None
+        if status == 'done' and result['promoted'] and app.config['CACHE_WARMUP']:
+            warmup_version = _read_dataset(job['dataset_id'], lambda entry: entry.get('version_id') if entry is not None else None)
+    except Exception as e:
+        print(f"❌ Error en trabajo de ingesta {job['id']}: {e}")
+        import traceback
+        traceback.print_exc()
+        result, status, message = None, 'failed', f"Error al procesar el archivo: {str(e)}"
+        warmup_version = None
+    finally:
+        _ingest_context.job = None
+    
+    with ingestion_jobs_lock:
+        for key in ('frames', 'rebase', 'base_version_id'):
+            job.pop(key, None)  # El resultado ya vive en el dataset activo y en la caché
+        job.update({
+            'status': status,
+            'stage': 'completado' if status == 'done' else 'error',
+            'percent': 100 if status == 'done' else job['percent'],
+            'message': message,
+            'result': result,
+            'finished': time.time()
+        })
+        if warmup_version is not None:
+            job['warmup'] = {'status': 'queued', 'current': None, 'completed': 0, 'total': len(WARMUP_STEPS), 'percent': 0}
+    _save_job_snapshot(job)
+    print(f"📦 Trabajo {job['id']} {status}: {message}")
+    if warmup_version is not None:
+        warmup_executor.submit(_run_cache_warmup, job, warmup_version)
+
+def submit_ingestion_job(task, filename):
+    """Encola una tarea (success, message, from_cache) y devuelve el trabajo, o None si la cola está llena"""
+    global _job_sequence
+    _prune_ingestion_jobs()
+    with ingestion_jobs_lock:
+        pending = sum(1 for job in ingestion_jobs.values() if job['status'] in ('queued', 'running'))
+        if pending >= app.config['INGEST_MAX_PENDING']:
+            return None
+        _job_sequence += 1
+        job = {
+            'id': uuid.uuid4().hex,
+            'sequence': _job_sequence,
+            'dataset_id': resolve_dataset_id(),
+            'filename': filename,
+            'status': 'queued',
+            'stage': 'en cola',
+            'percent': 0,
+            'rows_processed': 0,
+            'message': None,
+            'result': None,
+            'created': time.time(),
+            'started': None,
+            'finished': None
+        }
+        ingestion_jobs[job['id']] = job
+    _save_job_snapshot(job)
+    ingestion_executor.submit(_run_ingestion_job, job, task)
+    print(f"📦 Trabajo de ingesta encolado: {job['id']} ({filename})")
+    return job
+
+def get_ingestion_job(job_id):
+    """Copia serializable del estado de un trabajo; si lo ejecuta otro proceso, se lee su último estado guardado"""
+    with ingestion_jobs_lock:
+        job = ingestion_jobs.get(job_id)
+        if job is not None:
+            return _public_job(job)
+    if not re.match(r'^[0-9a-f]{32}$', job_id):
+        return None
+    try:
+        with open(_job_snapshot_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def process_file_data(file_path, streaming=None):
+    """Procesa archivo CSV y prepara los datos para visualización"""
     try:
         print(f"🔍 Procesando archivo: {file_path}")
+        report_progress('lectura', 5)
         
         # Verificar que el archivo existe
         if not os.path.exists(file_path):
@@ -348,6 +1867,17 @@ def process_file_data(file_path):
         
         # Solo procesar archivos CSV
         if file_path.lower().endswith('.csv'):
+            if streaming is None:
+                streaming = os.path.getsize(file_path) > app.config['STREAMING_THRESHOLD']
+            if streaming:
+                # Los archivos ASAPALSA grandes se procesan por bloques
+                dialect = sniff_csv_dialect(file_path)
+                header = pd.read_csv(file_path, sep=dialect['sep'], encoding=dialect['encoding'],
+                                     header=dialect['header'], skiprows=dialect['skiprows'] or None, nrows=0)
+                columns = header.columns.str.strip()
+                if 'DESCRIPCION' in columns and 'MES' in columns:
+                    return process_asapalsa_stream(file_path, dialect)
+                print("ℹ️ Formato no ASAPALSA, usando procesamiento completo")
             return process_csv_file(file_path)
         else:
             return False, "Solo se admiten archivos CSV"
@@ -358,8 +1888,97 @@ def process_file_data(file_path):
         traceback.print_exc()
         return False, f"Error al procesar el archivo: {str(e)}"
 
-def validate_csv_structure(df, file_path):
-    """Valida la estructura y contenido del CSV usando csvkit y pandas"""
+# Inferencia y conversión de tipos de columna en una sola pasada
+CATEGORICAL_MAX_RATIO = 0.5  # Máxima proporción de valores distintos para tratar texto como categórico
+DATE_MIN_RATIO = 0.9  # Proporción mínima de valores que deben parsear como fecha
+_DATE_LIKE = re.compile(r'^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}')
+
+def coerce_columns(df, min_numeric_ratio=0.0, categorize=True):
+    """Perfila cada columna una vez, decide su tipo (numérico, fecha, categórico o texto) y la convierte.
+    
+    Una columna de texto pasa a numérica si la proporción de valores numéricos supera
+    min_numeric_ratio (por defecto basta con uno, como la limpieza original). Devuelve
+    (df, schema); el schema lo reutilizan validación, reparación y pivot.
+    """
+    schema = {'rows': len(df), 'columns': {}}
+    
+    for col in df.columns:
+        series = df[col]
+        info = {'nulls': 0, 'non_null': 0, 'unique': None, 'numeric_ratio': 0.0}
+        
+        if series.dtype == 'object':
+            series = series.str.strip()
+            non_null = int(series.notna().sum())
+            numeric = pd.to_numeric(series, errors='coerce')
+            
+            # Solo los valores que fallaron se reintentan sin separadores de miles
+            failed = numeric.isna() & series.notna()
+            if failed.any():
+                with_commas = failed & series.str.contains(',', regex=False, na=False)
+                if with_commas.any():
+                    numeric[with_commas] = pd.to_numeric(series[with_commas].str.replace(',', '', regex=False), errors='coerce')
+            
+            parsed = int(numeric.notna().sum())
+            info['numeric_ratio'] = parsed / non_null if non_null else 0.0
+            
+            if parsed > 0 and info['numeric_ratio'] >= min_numeric_ratio:
+                kind, series = 'numeric', numeric
+            else:
+                kind = 'text'
+                sample = series.dropna().head(100)
+                if len(sample) and sample.str.match(_DATE_LIKE).mean() >= DATE_MIN_RATIO:
+                    dates = pd.to_datetime(series, errors='coerce')
+                    if dates.notna().sum() >= DATE_MIN_RATIO * non_null:
+                        kind, series = 'date', dates
+                if kind == 'text' and categorize and non_null:
+                    categorical = series.astype('category')
+                    info['unique'] = len(categorical.cat.categories)
+                    if info['unique'] <= CATEGORICAL_MAX_RATIO * non_null:
+                        kind, series = 'categorical', categorical
+            df[col] = series
+        elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            kind = 'numeric'
+            info['numeric_ratio'] = 1.0
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            kind = 'date'
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            kind = 'categorical'
+            info['unique'] = len(series.cat.categories)
+        else:
+            kind = 'text'
+        
+        info['nulls'] = int(series.isna().sum())
+        info['non_null'] = len(series) - info['nulls']
+        info['kind'] = kind
+        info['dtype'] = str(series.dtype)
+        schema['columns'][col] = info
+    
+    print(f"🧬 Tipos inferidos: { {col: info['kind'] for col, info in schema['columns'].items()} }")
+    return df, schema
+
+def column_kind(df, col, schema=None):
+    """Tipo de una columna según el schema, o según su dtype si no está en él"""
+    if schema and col in schema['columns']:
+        return schema['columns'][col]['kind']
+    dtype = df[col].dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'categorical'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'date'
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+        return 'numeric'
+    return 'text'
+
+def count_matching_values(series, pattern):
+    """Cuenta filas que contienen el patrón; en categóricas solo se evalúan las categorías"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        matches = np.asarray(series.cat.categories.astype(str).str.contains(pattern, na=False), dtype=bool)
+        codes = series.cat.codes.to_numpy()
+        return int(matches[codes[codes >= 0]].sum())
+    return int(series.astype(str).str.contains(pattern, na=False).sum())
+
+def validate_csv_structure(df, file_path, schema=None):
+    """Valida la estructura y contenido del CSV usando pandas"""
     errors = []
     warnings = []
     
@@ -388,41 +2007,19 @@ def validate_csv_structure(df, file_path):
         if duplicate_rows > 0:
             warnings.append(f"Se encontraron {duplicate_rows} filas duplicadas")
         
-        # 6. Validar tipos de datos en columnas numéricas
-        numeric_columns = df.select_dtypes(include=[np.number]).columns
-        for col in numeric_columns:
-            if df[col].isnull().all():
+        # 6. Validar columnas numéricas (los tipos ya vienen decididos por coerce_columns)
+        kinds = {col: column_kind(df, col, schema) for col in df.columns}
+        for col in empty_columns:
+            if kinds[col] == 'numeric':
                 warnings.append(f"Columna numérica '{col}' está completamente vacía")
-            elif df[col].dtype == 'object':
-                # Intentar convertir a numérico
-                non_numeric = pd.to_numeric(df[col], errors='coerce').isnull().sum()
-                if non_numeric > 0:
-                    warnings.append(f"Columna '{col}' tiene {non_numeric} valores no numéricos")
         
         # 7. Detectar caracteres especiales problemáticos
         for col in df.columns:
-            if df[col].dtype == 'object':
-                special_chars = df[col].astype(str).str.contains(r'[^\w\s\-\.\,\;\:\+\-\/]', na=False).sum()
+            if kinds[col] in ('text', 'categorical'):
+                special_chars = count_matching_values(df[col], r'[^\w\s\-\.\,\;\:\+\-\/]')
                 if special_chars > 0:
                     warnings.append(f"Columna '{col}' contiene {special_chars} caracteres especiales")
         
-        # 8. Validación adicional con csvkit si está disponible
-        try:
-            result = safe_subprocess_run([
-                'csvstat', 
-                '--count',
-                file_path
-            ], capture_output=True, text=True, timeout=10)
-            
-            if result and result.returncode == 0:
-                warnings.append("Validación adicional con csvkit completada")
-                print("✅ csvstat ejecutado exitosamente")
-            else:
-                print(f"⚠️ csvstat no disponible: {result.stderr if result else 'Proceso falló'}")
-                
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
-            print(f"⚠️ csvstat no disponible: {e}")
-        
         print(f"✅ Validación completada: {len(errors)} errores, {len(warnings)} advertencias")
         return errors, warnings
         
@@ -430,13 +2027,13 @@ def validate_csv_structure(df, file_path):
         errors.append(f"Error durante la validación: {str(e)}")
         return errors, warnings
 
-def repair_csv_data(df, errors, warnings):
-    """Intenta reparar automáticamente los errores detectados usando csvkit y pandas"""
+def repair_csv_data(df, errors, warnings, schema=None):
+    """Intenta reparar automáticamente los errores detectados usando pandas"""
     repaired_df = df.copy()
     repairs_made = []
     
     try:
-        print(f"🔧 Iniciando reparación automática con csvkit...")
+        print(f"🔧 Iniciando reparación automática...")
         
         # 1. Eliminar columnas completamente vacías
         empty_columns = repaired_df.columns[repaired_df.isnull().all()].tolist()
@@ -456,19 +2053,20 @@ def repair_csv_data(df, errors, warnings):
         repaired_df.columns = repaired_df.columns.str.replace(r'[^\w\s]', '_', regex=True)
         repairs_made.append("Nombres de columnas limpiados")
         
-        # 4. Intentar convertir columnas numéricas
-        for col in repaired_df.columns:
-            if repaired_df[col].dtype == 'object':
-                # Intentar convertir a numérico
-                numeric_converted = pd.to_numeric(repaired_df[col], errors='coerce')
-                if not numeric_converted.isnull().all():
-                    repaired_df[col] = numeric_converted
-                    repairs_made.append(f"Columna '{col}' convertida a numérico")
+        # 4. Intentar convertir columnas numéricas (innecesario si coerce_columns ya decidió los tipos)
+        if schema is None:
+            for col in repaired_df.columns:
+                if repaired_df[col].dtype == 'object':
+                    # Intentar convertir a numérico
+                    numeric_converted = pd.to_numeric(repaired_df[col], errors='coerce')
+                    if not numeric_converted.isnull().all():
+                        repaired_df[col] = numeric_converted
+                        repairs_made.append(f"Columna '{col}' convertida a numérico")
         
         # 5. Rellenar valores faltantes con estrategias apropiadas
         for col in repaired_df.columns:
             if repaired_df[col].isnull().any():
-                if repaired_df[col].dtype in ['int64', 'float64']:
+                if column_kind(repaired_df, col) == 'numeric':
                     # Para columnas numéricas, usar la mediana
                     repaired_df[col] = repaired_df[col].fillna(repaired_df[col].median())
                     repairs_made.append(f"Valores faltantes en '{col}' rellenados con mediana")
@@ -493,205 +2091,292 @@ def repair_csv_data(df, errors, warnings):
         print(f"❌ Error durante la reparación: {e}")
         return df, [f"Error durante la reparación: {str(e)}"]
 
-def repair_csv_with_csvkit(file_path):
-    """Repara un CSV usando csvkit para problemas más complejos"""
-    try:
-        print(f"🔧 Iniciando reparación con csvkit para: {file_path}")
-        
-        # Crear archivo temporal para la reparación
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.csv', delete=False) as temp_file:
-            temp_path = temp_file.name
-        
-        repairs_made = []
+# Diagnóstico y limpieza en proceso (sustituyen a csvstat y csvclean)
+CSV_FREQ_TOP = 5  # Valores más frecuentes por columna, como csvstat --freq
+
+def _json_value(value):
+    """Convierte escalares de numpy/pandas a tipos serializables"""
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value.item() if hasattr(value, 'item') else value
+
+def profile_csv_frame(df, schema=None, top=CSV_FREQ_TOP):
+    """Estadísticas por columna al estilo csvstat (nulos, únicos, frecuencias y longitudes) sobre el DataFrame ya parseado"""
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        kind = column_kind(df, col, schema)
+        counts = series.value_counts()
+        counts = counts[counts > 0]  # Las categóricas listan también categorías sin filas
         
-        # 1. Usar csvclean para limpiar el archivo
-        try:
-            result = subprocess.run([
-                'csvclean', 
-                '--encoding', 'utf-8',
-                '--output', temp_path,
-                file_path
-            ], capture_output=True, text=True, timeout=30,
-               creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            
-            if result.returncode == 0:
-                repairs_made.append("Archivo limpiado con csvclean")
-                print("✅ csvclean ejecutado exitosamente")
-            else:
-                print(f"⚠️ csvclean falló: {result.stderr}")
-                # Continuar con pandas si csvclean falla
-                return None, ["csvclean no disponible, usando pandas"]
-                
-        except subprocess.TimeoutExpired:
-            print("⏰ csvclean timeout, usando pandas")
-            return None, ["csvclean timeout, usando pandas"]
-        except FileNotFoundError:
-            print("⚠️ csvclean no encontrado, usando pandas")
-            return None, ["csvclean no disponible, usando pandas"]
-        except Exception as e:
-            print(f"❌ Error con csvclean: {e}")
-            return None, [f"Error con csvclean: {str(e)}"]
+        stats = {
+            'type': kind,
+            'nulls': int(series.isna().sum()),
+            'unique': len(counts),
+            'most_common': [{'value': _json_value(value), 'count': int(count)} for value, count in counts.head(top).items()]
+        }
         
-        # 2. Leer el archivo reparado
-        try:
-            repaired_df = pd.read_csv(temp_path, encoding='utf-8')
-            repairs_made.append(f"Archivo reparado leído exitosamente: {len(repaired_df)} filas")
-            
-            # 3. Validar el resultado
-            if len(repaired_df) == 0:
-                repairs_made.append("⚠️ Archivo reparado está vacío")
-                return None, repairs_made
-            
-            # 4. Limpiar archivo temporal
-            os.unlink(temp_path)
-            
-            print(f"✅ Reparación con csvkit completada: {len(repairs_made)} reparaciones")
-            return repaired_df, repairs_made
-            
-        except Exception as e:
-            print(f"❌ Error leyendo archivo reparado: {e}")
-            # Limpiar archivo temporal en caso de error
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-            return None, [f"Error leyendo archivo reparado: {str(e)}"]
-            
-    except Exception as e:
-        print(f"❌ Error general en repair_csv_with_csvkit: {e}")
-        return None, [f"Error general: {str(e)}"]
+        if kind in ('text', 'categorical') and len(counts):
+            # Longitudes calculadas sobre los valores distintos, no fila por fila
+            lengths = pd.Series(counts.index).astype(str).str.len()
+            stats['min_length'] = int(lengths.min())
+            stats['max_length'] = int(lengths.max())
+        elif kind in ('numeric', 'date') and len(counts):
+            stats['min'] = _json_value(series.min())
+            stats['max'] = _json_value(series.max())
+            if kind == 'numeric':
+                stats['mean'] = float(series.mean())
+        columns[col] = stats
+    
+    return {'row_count': len(df), 'column_count': len(df.columns), 'columns': columns}
+
+def clean_csv_frame(df):
+    """Limpieza estructural equivalente a csvclean: encabezados, filas vacías y encabezados repetidos"""
+    repairs_made = []
+    cleaned = df
+    
+    # 1. Encabezados sin espacios sobrantes
+    stripped = [str(col).strip() for col in cleaned.columns]
+    if stripped != list(cleaned.columns):
+        cleaned = cleaned.set_axis(stripped, axis=1)
+        repairs_made.append("Espacios eliminados de los encabezados")
+    
+    # 2. Filas sin ningún valor
+    blank_rows = cleaned.isna().all(axis=1)
+    if blank_rows.any():
+        cleaned = cleaned[~blank_rows]
+        repairs_made.append(f"Eliminadas {int(blank_rows.sum())} filas vacías")
+    
+    # 3. Filas que repiten el encabezado (archivos concatenados)
+    text_columns = [col for col in cleaned.columns if column_kind(cleaned, col) in ('text', 'categorical')]
+    if text_columns and len(text_columns) == len(cleaned.columns):
+        header_rows = (cleaned.astype(str) == pd.Series(cleaned.columns, index=cleaned.columns)).all(axis=1)
+        if header_rows.any():
+            cleaned = cleaned[~header_rows]
+            repairs_made.append(f"Eliminadas {int(header_rows.sum())} filas de encabezado repetidas")
+    
+    if cleaned is not df:
+        cleaned = cleaned.reset_index(drop=True)
+    print(f"🧹 Limpieza estructural completada: {len(repairs_made)} reparaciones")
+    return cleaned, repairs_made
 
-def diagnose_csv_with_csvkit(file_path):
-    """Diagnostica un CSV usando csvkit para obtener información detallada"""
+def diagnose_csv(file_path):
+    """Diagnostica un CSV con una sola lectura: dialecto, conteo de filas y estadísticas por columna"""
     try:
-        print(f"🔍 Iniciando diagnóstico con csvkit para: {file_path}")
+        print(f"🔍 Iniciando diagnóstico para: {file_path}")
+        
+        df, dialect = read_csv_sniffed(file_path)
+        df, schema = coerce_columns(df)
+        profile = profile_csv_frame(df, schema)
         
         diagnosis = {
-            'csvkit_available': False,
-            'file_info': {},
-            'statistics': {},
+            'file_info': {
+                'row_count': profile['row_count'],
+                'column_count': profile['column_count'],
+                'columns': [str(col) for col in df.columns],
+                'encoding': dialect['encoding'],
+                'separator': dialect['sep']
+            },
+            'statistics': profile['columns'],
             'warnings': []
         }
+        if dialect['confidence'] < 0.9:
+            diagnosis['warnings'].append(f"Separador detectado con baja confianza ({dialect['confidence']:.2f})")
         
-        # 1. Verificar si csvkit está disponible
-        try:
-            result = subprocess.run(['csvstat', '--version'], 
-                                  capture_output=True, text=True, timeout=5,
-                                  creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            if result.returncode == 0:
-                diagnosis['csvkit_available'] = True
-                diagnosis['csvkit_version'] = result.stdout.strip()
-                print("✅ csvkit disponible")
-            else:
-                print("⚠️ csvkit no disponible")
-                return diagnosis
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
-            print(f"⚠️ csvkit no disponible: {e}")
-            return diagnosis
-        
-        # 2. Obtener información básica del archivo
-        try:
-            result = subprocess.run([
-                'csvstat', 
-                '--count',
-                '--columns',
-                file_path
-            ], capture_output=True, text=True, timeout=10,
-               creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            
-            if result.returncode == 0:
-                diagnosis['file_info'] = {
-                    'row_count': result.stdout.strip(),
-                    'columns_detected': True
-                }
-                print("✅ Información básica obtenida")
-            else:
-                diagnosis['warnings'].append(f"Error obteniendo información básica: {result.stderr}")
-        except Exception as e:
-            diagnosis['warnings'].append(f"Error en diagnóstico básico: {str(e)}")
-        
-        # 3. Obtener estadísticas detalladas
-        try:
-            result = subprocess.run([
-                'csvstat', 
-                '--freq',
-                '--len',
-                file_path
-            ], capture_output=True, text=True, timeout=15,
-               creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            
-            if result.returncode == 0:
-                diagnosis['statistics'] = {
-                    'frequency_analysis': result.stdout.strip(),
-                    'length_analysis': True
-                }
-                print("✅ Estadísticas detalladas obtenidas")
-            else:
-                diagnosis['warnings'].append(f"Error obteniendo estadísticas: {result.stderr}")
-        except Exception as e:
-            diagnosis['warnings'].append(f"Error en estadísticas: {str(e)}")
-        
-        print(f"✅ Diagnóstico con csvkit completado")
+        print("✅ Diagnóstico completado")
         return diagnosis
         
     except Exception as e:
-        print(f"❌ Error general en diagnose_csv_with_csvkit: {e}")
+        print(f"❌ Error general en diagnose_csv: {e}")
         return {
-            'csvkit_available': False,
             'error': str(e),
             'warnings': [f"Error general: {str(e)}"]
         }
 
+# Detección de dialecto CSV: una sola lectura de muestra y un solo parseo completo
+CSV_SNIFF_BYTES = 64 * 1024  # Tamaño máximo de la muestra inicial
+CSV_SNIFF_LINES = 200  # Líneas de la muestra usadas para puntuar separadores
+CSV_ENCODINGS = ['utf-8', 'cp1252', 'latin1']
+CSV_SEPARATORS = [';', ',', '\t', '|']
+
+_NUMERIC_TOKEN = re.compile(r'^-?[\d.,]*\d$')
+_COMMA_DECIMAL = re.compile(r'^-?(\d{1,3}(\.\d{3})+(,\d+)?|\d+,\d{1,2})$')
+_DOT_DECIMAL = re.compile(r'^-?(\d{1,3}(,\d{3})+(\.\d+)?|\d+\.\d{1,2}|\d+\.\d{4,})$')
+_SINGLE_GROUP = re.compile(r'^-?\d{1,3}[.,]\d{3}$')  # 1.250 o 1,250: miles o tres decimales
+
+def _decode_sample(raw):
+    """Decodifica la muestra probando los encodings en orden de preferencia"""
+    if raw.startswith(b'\xef\xbb\xbf'):
+        return raw[3:].decode('utf-8', errors='replace'), 'utf-8-sig', 1.0
+    for encoding, certainty in zip(CSV_ENCODINGS, (1.0, 0.8, 0.6)):
+        try:
+            return raw.decode(encoding), encoding, certainty
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('latin1', errors='replace'), 'latin1', 0.5
+
+def _score_separator(lines, sep):
+    """Devuelve (consistencia, campos) de un separador sobre las líneas de muestra"""
+    rows = list(csv.reader(lines, delimiter=sep))
+    counts = [len(row) for row in rows if row]
+    if not counts:
+        return 0.0, 0, rows
+    modal = max(set(counts), key=counts.count)
+    if modal < 2:
+        return 0.0, modal, rows
+    return counts.count(modal) / len(counts), modal, rows
+
+def _detect_number_format(rows, sep):
+    """Infiere separador de miles y decimal a partir de los valores numéricos.
+    
+    Un valor con un solo grupo de tres dígitos (1.250, 1,250) puede ser de miles o tener tres decimales:
+    no vota por sí mismo y sigue a los demás valores de su columna; sin contexto no cuenta.
+    """
+    votes = defaultdict(lambda: [0, 0])  # Columna -> [coma decimal, punto decimal]
+    single_group = defaultdict(int)
+    for row in rows:
+        for col, field in enumerate(row):
+            token = field.strip()
+            if not token or not _NUMERIC_TOKEN.match(token):
+                continue
+            if _SINGLE_GROUP.match(token):
+                single_group[col] += 1
+            elif _COMMA_DECIMAL.match(token):
+                votes[col][0] += 1
+            elif _DOT_DECIMAL.match(token):
+                votes[col][1] += 1
+    for col, count in single_group.items():
+        comma, dot = votes[col]
+        if comma != dot:
+            votes[col][0 if comma > dot else 1] += count
+    comma_votes = sum(vote[0] for vote in votes.values())
+    dot_votes = sum(vote[1] for vote in votes.values())
+    total = comma_votes + dot_votes
+    if comma_votes > dot_votes and sep != ',':
+        return '.', ',', comma_votes / total
+    return ',', '.', (dot_votes / total) if total else 1.0
+
+def sniff_csv_dialect(file_path, sample_bytes=CSV_SNIFF_BYTES):
+    """Detecta encoding, separador, formato numérico y fila de encabezado leyendo solo una muestra"""
+    with open(file_path, 'rb') as f:
+        raw = f.read(sample_bytes + 1)
+    
+    truncated = len(raw) > sample_bytes
+    if truncated:
+        # Descartar la última línea incompleta para no cortar caracteres multibyte
+        raw = raw[:sample_bytes]
+        last_newline = raw.rfind(b'\n')
+        if last_newline > 0:
+            raw = raw[:last_newline + 1]
+    
+    text, encoding, encoding_certainty = _decode_sample(raw)
+    lines = text.splitlines()[:CSV_SNIFF_LINES]
+    
+    best = None
+    for sep in CSV_SEPARATORS:
+        consistency, fields, rows = _score_separator(lines, sep)
+        if best is None or (consistency, fields) > (best[0], best[1]):
+            best = (consistency, fields, rows, sep)
+    consistency, fields, rows, sep = best
+    
+    # Las líneas previas a la primera fila con el número de campos esperado son preámbulo;
+    # esa fila es el encabezado salvo que todos sus valores sean numéricos
+    header, skiprows = 0, 0
+    for i, row in enumerate(rows[:50]):
+        if len(row) == fields:
+            skiprows = i
+            if all(not v.strip() or _NUMERIC_TOKEN.match(v.strip()) for v in row):
+                header = None
+            break
+    
+    first_data_row = skiprows + (1 if header is not None else 0)
+    data_rows = [row for row in rows[first_data_row:] if len(row) == fields]
+    thousands, decimal, number_certainty = _detect_number_format(data_rows[:500], sep)
+    
+    dialect = {
+        'encoding': encoding,
+        'sep': sep,
+        'thousands': thousands,
+        'decimal': decimal,
+        'header': header,
+        'skiprows': skiprows,
+        'fields': fields,
+        'sample_rows': len(rows),
+        'sample_truncated': truncated,
+        'confidence': round(encoding_certainty * consistency * (0.5 + 0.5 * number_certainty), 3)
+    }
+    print(f"🔎 Dialecto detectado: encoding='{encoding}', sep='{sep}', miles='{thousands}', "
+          f"decimal='{decimal}', encabezado={header}, preámbulo={skiprows}, confianza={dialect['confidence']}")
+    return dialect
+
+def read_csv_sniffed(file_path, dialect=None, **kwargs):
+    """Lee un CSV completo una sola vez usando el dialecto detectado por sniff_csv_dialect"""
+    if dialect is None:
+        dialect = sniff_csv_dialect(file_path)
+    
+    options = {
+        'sep': dialect['sep'],
+        'encoding': dialect['encoding'],
+        'thousands': dialect['thousands'],
+        'decimal': dialect['decimal'],
+        'header': dialect['header'],
+        'skiprows': dialect['skiprows'] or None,
+    }
+    options.update(kwargs)
+    
+    try:
+        df = pd.read_csv(file_path, **options)
+    except UnicodeDecodeError:
+        # La muestra era UTF-8 válido pero el resto del archivo no; latin1 nunca falla
+        print(f"⚠️ Encoding '{dialect['encoding']}' inválido fuera de la muestra, releyendo con latin1")
+        dialect['encoding'] = 'latin1'
+        dialect['confidence'] = round(dialect['confidence'] * 0.6, 3)
+        options['encoding'] = 'latin1'
+        df = pd.read_csv(file_path, **options)
+    
+    return df, dialect
+
 def process_csv_file(file_path):
     """Procesa archivos CSV con el formato original y reparación automática"""
-    global current_data, processed_data, original_data
-    
     try:
         print(f"📄 Procesando CSV: {file_path}")
         
-        # Intentar diferentes separadores y encodings
-        df = None
-        encodings = ['utf-8', 'latin1', 'cp1252', 'iso-8859-1']
-        separators = [';', ',', '\t']
-        
-        for encoding in encodings:
-            for sep in separators:
-                try:
-                    # Leer CSV con configuración específica para manejar comas en números
-                    df = pd.read_csv(file_path, sep=sep, encoding=encoding, thousands=',', decimal='.')
-                    if len(df.columns) > 1:  # Si tiene más de una columna, probablemente es correcto
-                        print(f"✅ CSV leído con separador '{sep}' y encoding '{encoding}'")
-                        break
-                except Exception as e:
-                    print(f"❌ Error con separador '{sep}' y encoding '{encoding}': {e}")
-                    continue
-            if df is not None and len(df.columns) > 1:
-                break
+        # Detectar dialecto con una muestra y leer el archivo una sola vez
+        try:
+            df, dialect = read_csv_sniffed(file_path)
+        except Exception as e:
+            print(f"❌ Error leyendo CSV: {e}")
+            return False, "No se pudo leer el archivo CSV con ningún separador o encoding"
         
-        if df is None:
+        if len(df.columns) < 2:
             return False, "No se pudo leer el archivo CSV con ningún separador o encoding"
+        print(f"✅ CSV leído con separador '{dialect['sep']}' y encoding '{dialect['encoding']}'")
+        report_progress('lectura', 30, rows=len(df))
         
-        # Limpiar datos: remover espacios en blanco y convertir tipos de datos
-        df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
+        # Limpiar espacios e inferir y convertir tipos en una sola pasada por columna
+        df, schema = coerce_columns(df)
+        return process_parsed_frame(df, schema, file_path)
         
-        # Intentar convertir columnas numéricas que puedan tener comas
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                try:
-                    # Intentar convertir a numérico, manejando comas como separadores de miles
-                    numeric_series = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-                    # Solo reemplazar si la conversión fue exitosa para la mayoría de valores
-                    if not numeric_series.isna().all():
-                        df[col] = numeric_series
-                except Exception as e:
-                    print(f"⚠️ No se pudo convertir columna '{col}' a numérico: {e}")
-                    pass
+    except Exception as e:
+        print(f"❌ Error crítico en process_csv_file: {e}")
+        import traceback
+        traceback.print_exc()
+        return False, f"Error al procesar CSV: {str(e)}"
+
+def process_parsed_frame(df, schema, file_path):
+    """Valida, repara y transforma un DataFrame ya parseado (desde archivo o desde una sesión de carga)"""
+    try:
+        set_ingest_notes()
+        report_progress('validación', 40, rows=len(df))
         
         # Validar estructura del CSV
-        errors, warnings = validate_csv_structure(df, file_path)
+        errors, warnings = validate_csv_structure(df, file_path, schema)
         
         # Si hay errores críticos, intentar reparar
         if errors:
             print(f"⚠️ Errores críticos detectados: {errors}")
-            repaired_df, repairs_made = repair_csv_data(df, errors, warnings)
+            report_progress('reparación', 55)
+            repaired_df, repairs_made = repair_csv_data(df, errors, warnings, schema)
             
             # Validar nuevamente después de la reparación
             new_errors, new_warnings = validate_csv_structure(repaired_df, file_path)
@@ -705,6 +2390,7 @@ def process_csv_file(file_path):
                 return False, error_msg
             else:
                 df = repaired_df
+                set_ingest_notes(new_warnings, repairs_made)
                 repair_msg = f"Archivo reparado automáticamente:\n"
                 repair_msg += "\n".join(f"• {repair}" for repair in repairs_made)
                 if new_warnings:
@@ -714,7 +2400,9 @@ def process_csv_file(file_path):
         elif warnings:
             print(f"⚠️ Advertencias detectadas: {warnings}")
             # Aplicar reparaciones menores para advertencias
-            repaired_df, repairs_made = repair_csv_data(df, [], warnings)
+            report_progress('reparación', 55)
+            repaired_df, repairs_made = repair_csv_data(df, [], warnings, schema)
+            set_ingest_notes(warnings, repairs_made)
             if repairs_made:
                 df = repaired_df
                 print(f"✅ Reparaciones menores aplicadas: {repairs_made}")
@@ -738,27 +2426,113 @@ def process_csv_file(file_path):
             return process_generic_format(df)
         
     except Exception as e:
-        print(f"❌ Error crítico en process_csv_file: {e}")
+        print(f"❌ Error crítico en process_parsed_frame: {e}")
         import traceback
         traceback.print_exc()
         return False, f"Error al procesar CSV: {str(e)}"
 
 
+# Mapeo de nombres de mes a número
+MESES_MAP = {
+    'enero': '01', 'febrero': '02', 'marzo': '03', 'abril': '04',
+    'mayo': '05', 'junio': '06', 'julio': '07', 'agosto': '08',
+    'septiembre': '09', 'setiembre': '09',
+    'octubre': '10', 'noviembre': '11', 'diciembre': '12'
+}
+
+# Reglas de normalización de tipos de movimiento, ordenadas por especificidad.
+# Cada regla es (patrón regex sobre el nombre en minúsculas, nombre canónico).
+MOVEMENT_TYPE_RULES = [
+    (r'proyeccion compra de fruta ajustada', 'Proyeccion Compra de Fruta Ajustada'),
+    (r'recibida', 'Fruta Recibida'),
+    (r'proyectada', 'Fruta Proyectada'),
+    (r'procesada', 'Fruta Procesada'),
+    (r'exportada', 'Fruta Exportada'),
+    (r'importada', 'Fruta Importada'),
+    (r'vendida', 'Fruta Vendida'),
+    (r'comprada', 'Fruta Comprada'),
+]
+_compiled_movement_rules = []
+
+def compile_movement_rules():
+    """Compila la tabla de reglas; llamar tras modificar MOVEMENT_TYPE_RULES"""
+    global _compiled_movement_rules
+    _compiled_movement_rules = [(re.compile(pattern), name) for pattern, name in MOVEMENT_TYPE_RULES]
+
+def register_movement_rule(pattern, name, position=0):
+    """Agrega una regla de normalización; por defecto con la máxima prioridad"""
+    MOVEMENT_TYPE_RULES.insert(position, (pattern, name))
+    compile_movement_rules()
+
+def load_movement_rules(path):
+    """Carga reglas adicionales desde un JSON: [{"pattern": "...", "name": "..."}, ...]"""
+    with open(path, encoding='utf-8') as f:
+        rules = json.load(f)
+    for position, rule in enumerate(rules):
+        MOVEMENT_TYPE_RULES.insert(position, (rule['pattern'], rule['name']))
+    compile_movement_rules()
+    print(f"✅ {len(rules)} reglas de tipos de movimiento cargadas desde {path}")
+
+compile_movement_rules()
+if os.getenv('MOVEMENT_RULES_FILE'):
+    try:
+        load_movement_rules(os.getenv('MOVEMENT_RULES_FILE'))
+    except Exception as e:
+        print(f"⚠️ Error cargando reglas de tipos de movimiento: {e}")
+
+def normalize_movement_name(name):
+    """Normaliza el nombre del movimiento para evitar duplicados"""
+    if pd.isna(name) or name == '':
+        return name
+    
+    name_lower = name.lower().strip()
+    for pattern, canonical in _compiled_movement_rules:
+        if pattern.search(name_lower):
+            return canonical
+    # Si no coincide con ningún patrón conocido, usar el nombre original con formato estándar
+    return name.title()
+
+def normalize_movement_types(descriptions):
+    """Extrae y normaliza el tipo de movimiento trabajando solo sobre los valores distintos.
+    
+    Devuelve (serie normalizada, tabla {descripción original: nombre normalizado}).
+    """
+    categorical = descriptions.astype('category')
+    categories = categorical.cat.categories.to_series(index=range(len(categorical.cat.categories)))
+    
+    # Extraer el nombre sin el prefijo numérico y aplicar las reglas sobre las categorías
+    extracted = categories.astype(str).str.extract(r'\d*\s*(.*)', expand=False).str.strip()
+    lowered = extracted.str.lower()
+    normalized = pd.Series(np.nan, index=extracted.index, dtype=object)
+    pending = extracted.notna() & (extracted != '')
+    for pattern, canonical in _compiled_movement_rules:
+        matches = pending & lowered.str.contains(pattern, regex=True)
+        normalized[matches] = canonical
+        pending &= ~matches
+    normalized[pending] = extracted[pending].str.title()
+    normalized[extracted == ''] = ''
+    
+    # Un solo take vectorizado devuelve el resultado a todas las filas; el código -1 (NaN) apunta al final
+    lookup = np.append(normalized.to_numpy(dtype=object), np.nan)
+    result = pd.Series(lookup[categorical.cat.codes.to_numpy()], index=descriptions.index, dtype=object)
+    return result, dict(zip(categories, normalized))
+
+def find_tm_column(columns):
+    """Busca la columna T.M., que puede haberse convertido a T_M_ durante la limpieza"""
+    for col in columns:
+        if 'T.M.' in col or 'T_M_' in col:
+            return col
+    return None
+
 def process_asapalsa_format(df):
     """Procesa el formato específico de ASAPALSA"""
-    global current_data, processed_data, original_data
-    
     try:
+        report_progress('pivot', 75, rows=len(df))
         print(f"🔍 Columnas disponibles: {list(df.columns)}")
         print(f"🔍 Tipos de datos: {df.dtypes.to_dict()}")
         
         # Verificar que las columnas necesarias existen
-        # Buscar columna T.M. que puede haberse convertido a T_M_ durante la limpieza
-        tm_column = None
-        for col in df.columns:
-            if 'T.M.' in col or 'T_M_' in col:
-                tm_column = col
-                break
+        tm_column = find_tm_column(df.columns)
         
         if tm_column is None:
             return False, f"Columna T.M. no encontrada. Columnas disponibles: {list(df.columns)}"
@@ -775,63 +2549,19 @@ def process_asapalsa_format(df):
             # Usar año actual como fallback
             df['year'] = pd.Timestamp.now().year
         
-        # Extraer tipo de movimiento de la descripción manteniendo nombres originales importantes
-        df['TipoMovimiento'] = df['DESCRIPCION'].str.extract(r'\d*\s*(.*)', expand=False).str.strip()
-        
-        # Normalizar nombres de columnas para evitar duplicados por diferencias de mayúsculas/minúsculas
-        def normalize_movement_name(name):
-            """Normaliza el nombre del movimiento para evitar duplicados"""
-            if pd.isna(name) or name == '':
-                return name
-            
-            # Convertir a minúsculas para comparación
-            name_lower = name.lower().strip()
-            
-            # Mapeo de normalización - ordenado por especificidad
-            if 'proyeccion compra de fruta ajustada' in name_lower:
-                return 'Proyeccion Compra de Fruta Ajustada'
-            elif 'fruta recibida' in name_lower or 'recibida' in name_lower:
-                return 'Fruta Recibida'
-            elif 'fruta proyectada' in name_lower or 'proyectada' in name_lower:
-                return 'Fruta Proyectada'
-            elif 'fruta procesada' in name_lower or 'procesada' in name_lower:
-                return 'Fruta Procesada'
-            elif 'fruta exportada' in name_lower or 'exportada' in name_lower:
-                return 'Fruta Exportada'
-            elif 'fruta importada' in name_lower or 'importada' in name_lower:
-                return 'Fruta Importada'
-            elif 'fruta vendida' in name_lower or 'vendida' in name_lower:
-                return 'Fruta Vendida'
-            elif 'fruta comprada' in name_lower or 'comprada' in name_lower:
-                return 'Fruta Comprada'
-            else:
-                # Si no coincide con ningún patrón conocido, usar el nombre original con formato estándar
-                return name.title()
-        
-        # Aplicar normalización
-        df['TipoMovimiento'] = df['TipoMovimiento'].apply(normalize_movement_name)
+        # Extraer y normalizar el tipo de movimiento sobre las descripciones distintas
+        df['TipoMovimiento'], type_mapping = normalize_movement_types(df['DESCRIPCION'])
         
-        print(f"🔍 Tipos de movimiento únicos después de normalización: {df['TipoMovimiento'].unique()}")
+        print(f"🔍 Tipos de movimiento únicos después de normalización: {sorted(set(type_mapping.values()), key=str)}")
         
         # Mostrar ejemplos de normalización para debugging
-        original_types = df['DESCRIPCION'].str.extract(r'\d*\s*(.*)', expand=False).str.strip().unique()
         print(f"🔍 Ejemplos de normalización:")
-        for orig_type in original_types[:5]:  # Mostrar solo los primeros 5
-            if pd.notna(orig_type) and orig_type != '':
-                normalized = normalize_movement_name(orig_type)
-                if orig_type != normalized:
-                    print(f"   '{orig_type}' → '{normalized}'")
-        
-        # Mapeo de nombres de mes a número
-        meses_map = {
-            'enero': '01', 'febrero': '02', 'marzo': '03', 'abril': '04',
-            'mayo': '05', 'junio': '06', 'julio': '07', 'agosto': '08',
-            'septiembre': '09', 'setiembre': '09',
-            'octubre': '10', 'noviembre': '11', 'diciembre': '12'
-        }
+        for orig_type, normalized in list(type_mapping.items())[:5]:  # Mostrar solo los primeros 5
+            if orig_type != normalized:
+                print(f"   '{orig_type}' → '{normalized}'")
         
         # Convertir nombres de mes a número
-        df['MES'] = df['MES'].str.strip().str.lower().map(meses_map)
+        df['MES'] = df['MES'].str.strip().str.lower().map(MESES_MAP)
         
         # Verificar que el mapeo funcionó
         if df['MES'].isna().any():
@@ -840,8 +2570,11 @@ def process_asapalsa_format(df):
         # Crear columna de fecha
         df['Fecha'] = pd.to_datetime(df['year'].astype(str) + '-' + df['MES'] + '-01')
         
-        # Limpiar y convertir T.M. a numérico
-        df[tm_column] = df[tm_column].replace(',', '', regex=True).astype(float)
+        # Limpiar y convertir T.M. a numérico (si coerce_columns no lo hizo ya)
+        if column_kind(df, tm_column) == 'numeric':
+            df[tm_column] = df[tm_column].astype(float)
+        else:
+            df[tm_column] = df[tm_column].replace(',', '', regex=True).astype(float)
         
         # Seleccionar solo columnas necesarias
         df_clean = df[['Fecha', 'TipoMovimiento', tm_column]]
@@ -853,17 +2586,13 @@ def process_asapalsa_format(df):
             values=tm_column, 
             fill_value=0
         )
-        
-        # Normalizar nombres de columnas después del pivot para asegurar consistencia
-        df_pivot.columns = [normalize_movement_name(str(col)) for col in df_pivot.columns]
+        df_pivot.columns = list(df_pivot.columns)  # Los nombres ya vienen normalizados
         
         # Mantener el índice de fecha para el resumen
         # No resetear el índice para preservar las fechas
         
         # Almacenar datos
-        current_data = df_clean
-        processed_data = df_pivot
-        original_data = df
+        set_active_dataset(df_clean, df_pivot, df)
         
         print(f"✅ ASAPALSA procesado: {len(df)} filas, {len(df_clean['TipoMovimiento'].unique())} tipos de movimiento")
         print(f"📊 Columnas finales después de normalización: {list(df_pivot.columns)}")
@@ -875,6 +2604,373 @@ def process_asapalsa_format(df):
         traceback.print_exc()
         return False, f"Error al procesar formato ASAPALSA: {str(e)}"
 
+def process_asapalsa_stream(file_path, dialect=None, chunk_rows=None):
+    """Procesa un CSV ASAPALSA por bloques, acumulando (Fecha, TipoMovimiento) → T.M. sin cargar el archivo completo"""
+    handle = None
+    try:
+        notes = set_ingest_notes()
+        if dialect is None:
+            dialect = sniff_csv_dialect(file_path)
+        chunk_rows = chunk_rows or app.config['STREAMING_CHUNK_ROWS']
+        dedup = app.config['STREAMING_DEDUP']
+        dedup_limit = app.config['STREAMING_DEDUP_MAX_ROWS']
+        
+        print(f"🌊 Procesando ASAPALSA por bloques de {chunk_rows} filas: {file_path}")
+        
+        # Se abre el archivo aquí para estimar el avance por la posición de lectura
+        file_size = os.path.getsize(file_path)
+        handle = open(file_path, 'rb')
+        reader = pd.read_csv(
+            handle,
+            sep=dialect['sep'],
+            encoding=dialect['encoding'],
+            thousands=dialect['thousands'],
+            decimal=dialect['decimal'],
+            header=dialect['header'],
+            skiprows=dialect['skiprows'] or None,
+            chunksize=chunk_rows
+        )
+        
+        # Acumuladores: suma y conteo por celda para reproducir el promedio de pivot_table
+        totals = None
+        seen_hashes = np.empty(0, dtype=np.uint64)  # 8 bytes por fila distinta, solo si hay deduplicación
+        total_rows = kept_rows = duplicate_rows = incomplete_rows = 0
+        tm_column = None
+        column_count = 0
+        
+        for chunk_number, chunk in enumerate(reader, start=1):
+            chunk.columns = chunk.columns.str.strip()
+            if tm_column is None:
+                tm_column = find_tm_column(chunk.columns)
+                missing_columns = [col for col in ['DESCRIPCION', 'MES'] if col not in chunk.columns]
+                if tm_column is None or missing_columns:
+                    return False, f"Columnas faltantes en formato ASAPALSA: {missing_columns or ['T.M.']}. Columnas disponibles: {list(chunk.columns)}"
+                column_count = len(chunk.columns)
+            
+            total_rows += len(chunk)
+            chunk = chunk.dropna(how='all')
+            
+            for col in chunk.columns:
+                if chunk[col].dtype == 'object':
+                    chunk[col] = chunk[col].str.strip()
+            if chunk[tm_column].dtype == 'object':
+                chunk[tm_column] = pd.to_numeric(chunk[tm_column].str.replace(',', '', regex=False), errors='coerce')
+            
+            # Eliminar filas duplicadas exactas, también entre bloques
+            if dedup and len(chunk) > 0:
+                row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+                unique_hashes, first_positions = np.unique(row_hashes, return_index=True)
+                positions = np.searchsorted(seen_hashes, unique_hashes)
+                found = positions < len(seen_hashes)
+                is_new = np.ones(len(unique_hashes), dtype=bool)
+                is_new[found] = seen_hashes[positions[found]] != unique_hashes[found]
+                keep = np.zeros(len(chunk), dtype=bool)
+                keep[first_positions[is_new]] = True
+                duplicate_rows += int(len(chunk) - keep.sum())
+                chunk = chunk[keep]
+                # Los nuevos ya vienen ordenados y searchsorted dio su lugar: mezcla lineal, sin reordenar todo
+                seen_hashes = np.insert(seen_hashes, positions[is_new], unique_hashes[is_new])
+                if len(seen_hashes) > dedup_limit:
+                    # Memoria acotada: a partir de aquí los bloques se acumulan sin buscar duplicados
+                    dedup, seen_hashes = False, None
+                    notes['warnings'].append(f"Más de {dedup_limit} filas distintas: los duplicados solo se buscaron "
+                                             f"en las primeras {total_rows} filas")
+            
+            # Filas sin descripción, mes o tonelaje no se pueden ubicar en el pivot
+            complete = chunk['DESCRIPCION'].notna() & chunk['MES'].notna() & chunk[tm_column].notna()
+            incomplete_rows += int((~complete).sum())
+            chunk = chunk[complete]
+            if chunk.empty:
+                continue
+            
+            year = chunk['year'] if 'year' in chunk.columns else pd.Series(pd.Timestamp.now().year, index=chunk.index)
+            months = chunk['MES'].str.lower().map(MESES_MAP)
+            if months.isna().any():
+                return False, f"Error al mapear meses. Valores únicos en MES: {chunk.loc[months.isna(), 'MES'].unique()}"
+            
+            frame = pd.DataFrame({
+                'Fecha': pd.to_datetime(year.astype(str) + '-' + months + '-01'),
+                'TipoMovimiento': normalize_movement_types(chunk['DESCRIPCION'])[0],
+                'valor': chunk[tm_column].astype(float)
+            })
+            partial = frame.groupby(['Fecha', 'TipoMovimiento'])['valor'].agg(['sum', 'count'])
+            totals = partial if totals is None else totals.add(partial, fill_value=0)
+            kept_rows += len(frame)
+            print(f"🌊 Bloque {chunk_number}: {total_rows} filas leídas, {len(totals)} celdas acumuladas")
+            report_progress('lectura por bloques', 5 + 85 * handle.tell() / max(file_size, 1), rows=total_rows)
+        
+        if totals is None or totals.empty:
+            return False, "El archivo CSV no contiene filas válidas"
+        
+        # Promedio por celda, igual que pivot_table(aggfunc='mean', fill_value=0)
+        report_progress('pivot', 90, rows=total_rows)
+        means = (totals['sum'] / totals['count']).rename(tm_column)
+        df_pivot = means.unstack('TipoMovimiento', fill_value=0).sort_index()
+        df_pivot.columns = list(df_pivot.columns)
+        df_pivot.index.name = 'Fecha'
+        
+        # Sin el archivo completo en memoria, los datos de detalle son el agregado por celda
+        df_clean = means.reset_index()
+        set_active_dataset(df_clean, df_pivot, df_clean)
+        
+        print(f"✅ ASAPALSA procesado por bloques: {kept_rows} filas útiles de {total_rows}, "
+              f"{duplicate_rows} duplicadas, {incomplete_rows} incompletas")
+        message = f"Archivo procesado correctamente. {total_rows} filas, {column_count} columnas"
+        if duplicate_rows:
+            notes['repairs'].append(f"Eliminadas {duplicate_rows} filas duplicadas")
+        if incomplete_rows:
+            notes['warnings'].append(f"Omitidas {incomplete_rows} filas sin descripción, mes o T.M.")
+        if duplicate_rows or incomplete_rows:
+            message += f" ({duplicate_rows} filas duplicadas y {incomplete_rows} incompletas omitidas)"
+        return True, message
+        
+    except Exception as e:
+        print(f"❌ Error detallado en process_asapalsa_stream: {e}")
+        import traceback
+        traceback.print_exc()
+        return False, f"Error al procesar formato ASAPALSA por bloques: {str(e)}"
+    finally:
+        if handle is not None:
+            handle.close()
+
+# Carga por lotes: varios CSV ASAPALSA procesados en paralelo y combinados en un solo pivot.
+# Política de conflictos cuando una celda (Fecha, TipoMovimiento) aparece en más de un archivo;
+# dentro de cada archivo la celda es el promedio, igual que en la carga individual.
+BATCH_CONFLICT_POLICIES = {
+    'last': 'gana el último archivo del lote (exportaciones más recientes reemplazan a las anteriores)',
+    'first': 'gana el primer archivo del lote',
+    'sum': 'se suman los valores de todos los archivos (como el concat + groupby del notebook)',
+    'mean': 'se promedian los valores de los archivos',
+    'max': 'se conserva el valor máximo'
+}
+BATCH_DEFAULT_POLICY = 'last'
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def _get_batch_executor():
+    """Pool de procesos para lotes y backtests de pronóstico; se crea una vez y se reutiliza entre cargas"""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            # 'spawn' evita heredar locks tomados por otros hilos del servidor al hacer fork
+            _batch_executor = ProcessPoolExecutor(max_workers=app.config['BATCH_WORKERS'],
+                                                  mp_context=multiprocessing.get_context('spawn'))
+        return _batch_executor
+
+def ingest_file_cells(file_path, upload_session=None, stage='parsed'):
+    """Procesa un archivo sin tocar el dataset activo y devuelve sus celdas (Fecha, TipoMovimiento) → T.M.
+    
+    Se usa en los procesos del pool de lotes y en la carga incremental; con upload_session se procesa el
+    DataFrame ya parseado de la sesión en lugar de volver a leer el archivo.
+    """
+    collector = {'percent': 0, 'stage': None, 'rows_processed': 0}
+    previous_job = _current_job()  # En modo serie se ejecuta dentro del trabajo del lote
+    _ingest_context.job = collector  # Recoge el resultado sin tocar el dataset activo
+    try:
+        if upload_session:
+            df, schema = get_session_frame(upload_session, stage)
+            success, message = process_parsed_frame(df, schema, file_path)
+        else:
+            success, message = process_file_data(file_path)
+    finally:
+        _ingest_context.job = previous_job
+    
+    frames = collector.get('frames') or {}
+    long_data = frames.get('current_data')
+    if success and (long_data is None or 'TipoMovimiento' not in long_data.columns):
+        success, message = False, "El archivo no tiene formato ASAPALSA (DESCRIPCION, MES, T.M.)"
+    if not success:
+        return {'success': False, 'message': message}
+    
+    # Se reduce a una fila por celda aquí, para devolver al proceso principal solo unos cientos de filas
+    value_column = [col for col in long_data.columns if col not in ('Fecha', 'TipoMovimiento')][0]
+    cells = long_data.groupby(['Fecha', 'TipoMovimiento'], observed=True)[value_column].mean().rename('T.M.')
+    return {'success': True, 'message': message, 'cells': cells, 'notes': collector.get('notes') or {}}
+
+def merge_batch_frames(frames, policy=BATCH_DEFAULT_POLICY):
+    """Combina las celdas (Fecha, TipoMovimiento) → T.M. de varios archivos en un pivot según la política"""
+    cells = pd.concat(frames, keys=range(len(frames)), names=['Archivo'])
+    grouped = cells.groupby(level=['Fecha', 'TipoMovimiento'], sort=True)
+    conflicts = int((grouped.size() > 1).sum())
+    merged = getattr(grouped, policy)()
+    
+    df_pivot = merged.unstack('TipoMovimiento', fill_value=0).sort_index()
+    df_pivot.columns = list(df_pivot.columns)
+    df_pivot.index.name = 'Fecha'
+    return merged.reset_index(), df_pivot, conflicts
+
+def ingest_batch(file_paths, policy=BATCH_DEFAULT_POLICY, names=None):
+    """Procesa los archivos del lote en paralelo y publica el pivot combinado"""
+    names = names or [os.path.basename(path) for path in file_paths]
+    results = {}
+    report_progress('lectura en paralelo', 5)
+    
+    if app.config['BATCH_WORKERS'] > 1 and len(file_paths) > 1:
+        try:
+            executor = _get_batch_executor()
+            futures = {executor.submit(ingest_file_cells, path): name for path, name in zip(file_paths, names)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                report_progress('lectura en paralelo', 5 + 80 * done / len(file_paths))
+        except BrokenProcessPool as e:
+            print(f"⚠️ Pool de procesos no disponible, procesando en serie: {e}")
+    
+    # Procesamiento en serie si el pool está desactivado o falló
+    for done, (path, name) in enumerate(zip(file_paths, names), start=1):
+        if name not in results:
+            results[name] = ingest_file_cells(path)
+            report_progress('lectura en serie', 5 + 80 * done / len(file_paths))
+    
+    warnings, repairs, frames = [], [], []
+    for name in names:
+        result = results[name]
+        if result['success']:
+            frames.append(result['cells'])
+            warnings += [f"{name}: {warning}" for warning in result['notes'].get('warnings', [])]
+            repairs += [f"{name}: {repair}" for repair in result['notes'].get('repairs', [])]
+        else:
+            warnings.append(f"{name}: omitido ({result['message']})")
+    
+    if not frames:
+        return False, "Ningún archivo del lote se pudo procesar:\n" + "\n".join(f"• {warning}" for warning in warnings)
+    
+    report_progress('combinando', 90)
+    merged, df_pivot, conflicts = merge_batch_frames(frames, policy)
+    if conflicts:
+        repairs.append(f"{conflicts} celdas presentes en varios archivos resueltas con la política '{policy}'")
+    set_active_dataset(merged, df_pivot, merged)
+    set_ingest_notes(warnings, repairs)
+    
+    print(f"✅ Lote combinado: {len(frames)}/{len(file_paths)} archivos, {len(df_pivot)} fechas, {conflicts} conflictos ({policy})")
+    return True, f"Lote procesado correctamente. {len(frames)} de {len(file_paths)} archivos, {len(df_pivot)} fechas, {len(df_pivot.columns)} tipos de movimiento"
+
+# Carga incremental: fusiona las celdas de un archivo nuevo (p. ej. un mes) con el pivot activo.
+# El pivot rellena con 0 las celdas ausentes, así que una celda en 0 se trata como vacía.
+INCREMENTAL_MODES = {
+    'append': 'solo agrega celdas nuevas; las existentes no se modifican',
+    'upsert': 'agrega celdas nuevas y reemplaza las existentes con el valor del archivo nuevo'
+}
+INCREMENTAL_MAX_REBASES = 3  # Veces que se rehace una fusión cuya base cambió antes de promoverla
+
+def merge_incremental(pivot, cells, mode='upsert'):
+    """Fusiona celdas (Fecha, TipoMovimiento) → T.M. con el pivot; devuelve (pivot, cambios, celdas escritas)
+    
+    Solo se escriben las celdas que cambian. El pivot publicado es de solo lectura, así que se copia una vez,
+    y solo se amplía si el archivo trae fechas o tipos de movimiento nuevos; si nada cambia se devuelve tal cual.
+    """
+    dates = cells.index.get_level_values('Fecha')
+    types = cells.index.get_level_values('TipoMovimiento')
+    new_dates = pd.DatetimeIndex(dates.unique()).difference(pivot.index)
+    new_types = pd.Index(types.unique()).difference(pivot.columns)
+    
+    # Valor previo de cada celda entrante (0 si la fecha o el tipo no existían)
+    base_rows = pivot.index.get_indexer(dates)
+    base_cols = pivot.columns.get_indexer(types)
+    known = (base_rows >= 0) & (base_cols >= 0)
+    previous = np.zeros(len(cells))
+    previous[known] = pivot.to_numpy(dtype=float)[base_rows[known], base_cols[known]]
+    new_values = cells.to_numpy(dtype=float)
+    
+    exists = previous != 0
+    differs = ~np.isclose(previous, new_values)
+    added = ~exists & (new_values != 0)
+    updated = exists & differs if mode == 'upsert' else np.zeros(len(cells), dtype=bool)
+    skipped = exists & differs if mode == 'append' else np.zeros(len(cells), dtype=bool)
+    write = added | updated
+    
+    if len(new_dates) or len(new_types):
+        index = pivot.index.union(new_dates)
+        columns = pivot.columns.union(new_types)
+        values = np.zeros((len(index), len(columns)))
+        values[np.ix_(index.get_indexer(pivot.index), columns.get_indexer(pivot.columns))] = pivot.to_numpy(dtype=float)
+    elif write.any():
+        index, columns = pivot.index, pivot.columns
+        values = pivot.to_numpy(dtype=float, copy=True)
+    else:
+        index = columns = values = None
+    
+    if values is None:
+        merged = pivot
+    else:
+        values[index.get_indexer(dates[write]), columns.get_indexer(types[write])] = new_values[write]
+        merged = pd.DataFrame(values, index=index, columns=list(columns))
+        merged.index.name = 'Fecha'
+    
+    changed_dates = pd.DatetimeIndex(dates[write]).unique().sort_values()
+    changes = {
+        'mode': mode,
+        'cells_added': int(added.sum()),
+        'cells_updated': int(updated.sum()),
+        'cells_unchanged': int((exists & ~differs).sum()),
+        'cells_skipped': int(skipped.sum()),
+        'new_dates': [date.strftime('%Y-%m-%d') for date in new_dates],
+        'new_movement_types': [str(col) for col in new_types],
+        'changed_dates': [date.strftime('%Y-%m-%d') for date in changed_dates]
+    }
+    return merged, changes, cells[write]
+
+def merge_incremental_detail(detail, base, written):
+    """Datos de detalle (una fila por celda) tras la fusión: quita las celdas reescritas y agrega las nuevas"""
+    if detail is None or not detail.attrs.get('pivot_cells'):
+        # Primera carga incremental sobre una carga completa, o sobre un pivot de otro proceso: se parte del pivot
+        detail = base.rename_axis(columns='TipoMovimiento').stack().rename('T.M.')
+        detail = detail[detail != 0].reset_index()
+    if not written.empty:
+        keys = pd.MultiIndex.from_frame(detail[['Fecha', 'TipoMovimiento']])
+        detail = pd.concat([detail[~keys.isin(written.index)], written[written != 0].reset_index()], ignore_index=True)
+    detail.attrs['pivot_cells'] = True  # Una fila por celda distinta de 0: la siguiente carga la actualiza sin rehacerla
+    return detail
+
+def apply_incremental(base_frames, result, mode='upsert'):
+    """Fusiona las celdas de un archivo con los frames base y deja el resultado pendiente de promoción;
+    devuelve los cambios, o None si la base no es un dataset ASAPALSA"""
+    base = base_frames['processed_data']
+    if base is None or base.empty or not isinstance(base.index, pd.DatetimeIndex):
+        return None
+    merged, changes, written = merge_incremental(base, result['cells'], mode)
+    
+    # Igual que en la carga por bloques, los datos de detalle son las celdas del pivot
+    long_data = merge_incremental_detail(base_frames['current_data'], base, written)
+    set_active_dataset(long_data, merged, long_data)
+    
+    notes = set_ingest_notes(result['notes'].get('warnings'), result['notes'].get('repairs'))
+    if changes['cells_skipped']:
+        notes['warnings'].append(f"{changes['cells_skipped']} celdas ya existentes con otro valor no se modificaron (modo append)")
+    notes['changes'] = changes
+    
+    job = _current_job()
+    if job is not None:
+        # La promoción solo se hace si el dataset sigue en esta versión (compare-and-swap);
+        # si otro trabajo lo cambió entretanto, rebase rehace la fusión sobre la versión nueva
+        job['base_version_id'] = base_frames['version_id']
+        job['rebase'] = lambda: apply_incremental(get_active_frames(filtered=False), result, mode) is not None
+    return changes
+
+def ingest_incremental(file_path, mode='upsert', session_id=None, stage=None):
+    """Procesa solo el archivo nuevo (o el DataFrame de su sesión de carga) y fusiona sus celdas con el dataset ASAPALSA activo"""
+    upload_session = get_upload_session(session_id) if session_id else None
+    if session_id and upload_session is None:
+        return False, "La sesión de carga expiró, vuelve a enviar el archivo"
+    base_frames = get_active_frames(filtered=False)
+    base = base_frames['processed_data']
+    if base is None or base.empty or not isinstance(base.index, pd.DatetimeIndex):
+        return False, "No hay un dataset ASAPALSA cargado al que agregar datos; realiza primero una carga completa"
+    
+    report_progress('lectura', 5)
+    result = ingest_file_cells(file_path, upload_session, stage or 'parsed')
+    if not result['success']:
+        return False, result['message']
+    if upload_session:
+        drop_upload_session(session_id)  # Las celdas ya están extraídas; la sesión no se vuelve a usar
+    
+    report_progress('fusionando', 85)
+    changes = apply_incremental(base_frames, result, mode)
+    
+    print(f"✅ Carga incremental ({mode}): {changes['cells_added']} celdas nuevas, {changes['cells_updated']} actualizadas, "
+          f"{len(changes['changed_dates'])} fechas afectadas")
+    return True, (f"Datos incorporados correctamente. {changes['cells_added']} celdas nuevas, "
+                  f"{changes['cells_updated']} actualizadas en {len(changes['changed_dates'])} fechas")
+
 def split_concatenated_columns(df):
     """Separa columnas concatenadas con punto y coma"""
     try:
@@ -955,9 +3051,8 @@ def get_date_range(data):
 
 def process_generic_format(df):
     """Procesa formato genérico de archivos CSV/XLSX"""
-    global current_data, processed_data, original_data
-    
     try:
+        report_progress('pivot', 75, rows=len(df))
         # Verificar que el archivo no esté vacío
         if df.empty:
             return False, "El archivo está vacío"
@@ -1025,33 +3120,142 @@ def process_generic_format(df):
         processed_df = processed_df.set_index('Fecha')
         
         # Almacenar datos
-        current_data = df
-        processed_data = processed_df
-        original_data = df
+        set_active_dataset(df, processed_df, df)
         
         return True, f"Archivo procesado correctamente. {len(df)} filas, {len(numeric_columns)} columnas numéricas"
         
     except Exception as e:
         return False, f"Error al procesar formato genérico: {str(e)}"
 
-def get_chart_data(chart_type):
-    """Prepara los datos para diferentes tipos de gráficos"""
-    global processed_data
+@cached_operation('chart_axes')
+def get_chart_axes(processed_data=None, data_hash=None):
+    """Partes comunes a todos los gráficos de una versión: etiquetas de fecha y columnas con datos"""
+    if processed_data is None:
+        return {'error': 'No hay datos procesados'}
+    totals = processed_data.drop(columns=['diferencia_ajustada', 'precision_proy'], errors='ignore').sum()
+    return {
+        'dates': pd.DatetimeIndex(processed_data.index).strftime('%b-%Y').tolist(),
+        'valid_columns': [col for col in totals.index if totals[col] > 0]
+    }
+
+@cached_operation('column_profile')
+def profile_columns(processed_data=None, data_hash=None):
+    """Perfil de cada columna numérica en una sola pasada sobre la matriz: conteo, momentos y estadísticos de orden.
+    
+    Un único ordenamiento por columna sirve a las estadísticas descriptivas, las anomalías, el gráfico de caja,
+    las alertas y los reportes. Los cuartiles interpolan como pandas y los momentos siguen sus fórmulas.
+    """
+    if processed_data is None or processed_data.empty:
+        return {'error': 'No hay datos para analizar'}
+    columns = [col for col in processed_data.columns if processed_data[col].dtype in ['float64', 'int64']]
+    if not columns:
+        return {'columns': {}}
+    
+    values = processed_data[columns].to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    ordered = np.sort(values, axis=0)  # Los NaN quedan al final de cada columna
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, values, 0).sum(axis=0) / count
+        adjusted = np.where(valid, values - mean, 0)
+        squared = adjusted ** 2
+        m2 = squared.sum(axis=0)
+        m3 = (squared * adjusted).sum(axis=0)
+        m4 = (squared ** 2).sum(axis=0)
+        m2[np.abs(m2) < 1e-14] = 0  # Ruido de coma flotante, como en pandas
+        m3[np.abs(m3) < 1e-14] = 0
+        std = np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+        skewness = np.where(m2 == 0, 0, count * (count - 1) ** 0.5 / (count - 2) * (m3 / m2 ** 1.5))
+        skewness[count < 3] = np.nan
+        denominator = (count - 2) * (count - 3) * m2 ** 2
+        denominator[np.abs(denominator) < 1e-14] = 0
+        kurtosis = count * (count + 1) * (count - 1) * m4 / denominator - 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        kurtosis = np.where(denominator == 0, 0, kurtosis)
+        kurtosis[count < 4] = np.nan
+    
+    def order_statistic(q):
+        # Interpolación lineal entre los dos valores ordenados más cercanos (método por defecto de pandas)
+        position = q * np.maximum(count - 1, 0)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.ceil(position).astype(np.intp)
+        low = np.take_along_axis(ordered, lower[np.newaxis, :], axis=0)[0]
+        high = np.take_along_axis(ordered, upper[np.newaxis, :], axis=0)[0]
+        return low + (high - low) * (position - lower)
+    
+    q1, median, q3 = order_statistic(0.25), order_statistic(0.5), order_statistic(0.75)
+    maximum = np.take_along_axis(ordered, np.maximum(count - 1, 0)[np.newaxis, :], axis=0)[0]
+    iqr = q3 - q1
+    
+    profile = {}
+    for i, col in enumerate(columns):
+        profile[col] = {
+            'count': int(count[i]),
+            'mean': float(mean[i]),
+            'std': float(std[i]),
+            'min': float(ordered[0, i]),
+            'q1': float(q1[i]),
+            'median': float(median[i]),
+            'q3': float(q3[i]),
+            'max': float(maximum[i]),
+            'iqr': float(iqr[i]),
+            'lower_bound': float(q1[i] - 1.5 * iqr[i]),
+            'upper_bound': float(q3[i] + 1.5 * iqr[i]),
+            'skewness': float(skewness[i]),
+            'kurtosis': float(kurtosis[i])
+        }
+    return {'columns': profile}
+
+def chart_operation(chart_type, rolling_window=None):
+    """Nombre en caché de un gráfico ('chart_line', o 'chart_line_rolling3' con media móvil)"""
+    return f"chart_{chart_type}" + (f"_rolling{rolling_window}" if rolling_window else '')
+
+@cached_operation(chart_operation, cache_errors=True)
+def get_chart_data(chart_type, rolling_window=None, processed_data=None, data_hash=None):
+    """Prepara los datos para diferentes tipos de gráficos.
+    
+    El resultado (también los errores por datos insuficientes) queda en caché por versión del dataset
+    y tipo de gráfico, así que cambiar de gráfico en la interfaz no recalcula nada. Con rolling_window,
+    el gráfico de líneas agrega la media móvil de cada serie.
+    """
     
     if processed_data is None:
         return {'error': 'No hay datos procesados'}
     
+    if rolling_window:
+        chart = get_chart_data(chart_type, processed_data=processed_data, data_hash=data_hash)
+        if chart_type != 'line' or not chart or 'error' in chart:
+            return chart
+        rolling = compute_rolling(rolling_window, ('mean',), rolling_window, processed_data=processed_data, data_hash=data_hash)
+        means = rolling['series']['mean']
+        overlays = []
+        for dataset, column in zip(chart['data']['datasets'], get_chart_axes(processed_data=processed_data, data_hash=data_hash)['valid_columns']):
+            if column not in means:
+                continue  # compute_rolling solo calcula las columnas float64/int64
+            overlays.append({
+                'label': f"{dataset['label']} (media móvil {rolling_window})",
+                'data': means[column],
+                'borderColor': dataset['borderColor'],
+                'backgroundColor': 'transparent',
+                'borderDash': [6, 4],
+                'pointRadius': 0,
+                'tension': 0.1
+            })
+        # Copia: el gráfico base queda intacto en la caché
+        return {**chart, 'data': {**chart['data'], 'datasets': chart['data']['datasets'] + overlays}}
+    
     # Verificar que hay datos suficientes
     if len(processed_data) == 0:
         return {'error': 'No hay datos suficientes para generar gráficos'}
     
-    # Formatear fechas para el eje X
-    dates = [date.strftime('%b-%Y') for date in processed_data.index]
+    # Fechas formateadas y columnas válidas se calculan una vez por versión
+    axes = get_chart_axes(processed_data=processed_data, data_hash=data_hash)
+    dates = axes['dates']
     
     if chart_type == 'line':
         # Gráfico de líneas - evolución temporal
         # Verificar que hay al menos una columna de datos válida
-        valid_columns = [col for col in processed_data.columns if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].sum() > 0]
+        valid_columns = axes['valid_columns']
         
         if not valid_columns:
             return {'error': 'No hay datos válidos para generar el gráfico de líneas'}
@@ -1097,7 +3301,7 @@ def get_chart_data(chart_type):
     elif chart_type == 'bar':
         # Gráfico de barras apiladas
         # Verificar que hay al menos una columna de datos válida
-        valid_columns = [col for col in processed_data.columns if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].sum() > 0]
+        valid_columns = axes['valid_columns']
         
         if not valid_columns:
             return {'error': 'No hay datos válidos para generar el gráfico de barras'}
@@ -1142,10 +3346,12 @@ def get_chart_data(chart_type):
     
     elif chart_type == 'comparison':
         # Comparación fruta proyectada vs recibida
-        if 'fruta proyectada' not in processed_data.columns or 'fruta recibida' not in processed_data.columns:
+        projected = find_column(processed_data.columns, 'fruta proyectada')
+        received = find_column(processed_data.columns, 'fruta recibida')
+        if projected is None or received is None:
             return {'error': 'Se requieren datos de fruta proyectada y recibida para este gráfico'}
         
-        if processed_data['fruta proyectada'].sum() == 0 or processed_data['fruta recibida'].sum() == 0:
+        if processed_data[projected].sum() == 0 or processed_data[received].sum() == 0:
             return {'error': 'No hay datos válidos de fruta proyectada o recibida'}
         
         return {
@@ -1155,14 +3361,14 @@ def get_chart_data(chart_type):
                     'datasets': [
                         {
                             'label': 'Fruta Proyectada',
-                            'data': processed_data['fruta proyectada'].tolist(),
+                            'data': processed_data[projected].tolist(),
                             'borderColor': '#36A2EB',
                             'backgroundColor': '#36A2EB20',
                             'tension': 0.1
                         },
                         {
                             'label': 'Fruta Recibida',
-                            'data': processed_data['fruta recibida'].tolist(),
+                            'data': processed_data[received].tolist(),
                             'borderColor': '#FF6384',
                             'backgroundColor': '#FF638420',
                             'tension': 0.1
@@ -1185,132 +3391,148 @@ def get_chart_data(chart_type):
                                 'text': 'Fecha'
                             }
                         }
+                    },
+                    'plugins': {
+                        'title': {
+                            'display': True,
+                            'text': 'Fruta Proyectada vs Fruta Recibida'
+                        }
                     }
                 }
             }
         return None
     
     elif chart_type == 'precision':
-        # Gráfico de precisión de proyección
-        if 'fruta proyectada' not in processed_data.columns or 'fruta recibida' not in processed_data.columns:
+        # Gráfico de precisión de proyección: cumplimiento mensual de cada proyección
+        accuracy = compute_projection_accuracy(processed_data=processed_data, data_hash=data_hash)
+        if 'error' in accuracy:
             return {'error': 'Se requieren datos de fruta proyectada y recibida para calcular precisión'}
         
-        if processed_data['fruta proyectada'].sum() == 0 or processed_data['fruta recibida'].sum() == 0:
+        pairs = [pair for pair in accuracy['pairs'] if pair['periods'] > 0]
+        if not pairs:
             return {'error': 'No hay datos válidos para calcular precisión de proyección'}
         
-        if 'precision_proy' in processed_data.columns:
-            # Filtrar valores válidos
-            valid_data = processed_data.dropna(subset=['precision_proy'])
-            valid_dates = [date.strftime('%b-%Y') for date in valid_data.index]
-            
-            return {
-                'type': 'bar',
-                'data': {
-                    'labels': valid_dates,
-                    'datasets': [{
-                        'label': 'Precisión de Proyección (%)',
-                        'data': valid_data['precision_proy'].tolist(),
-                        'backgroundColor': '#4BC0C0',
-                        'borderColor': '#4BC0C0'
-                    }]
-                },
-                'options': {
-                    'responsive': True,
-                    'scales': {
-                        'y': {
-                            'beginAtZero': True,
-                            'max': 120,
-                            'title': {
-                                'display': True,
-                                'text': 'Porcentaje de Cumplimiento'
-                            }
-                        },
-                        'x': {
-                            'title': {
-                                'display': True,
-                                'text': 'Fecha'
-                            }
+        # Solo los meses con al menos una proyección comparable
+        rows = [i for i in range(len(dates)) if any(pair['series']['ratio'][i] is not None for pair in pairs)]
+        colors = ['#4BC0C0', '#9966FF']
+        return {
+            'type': 'bar',
+            'data': {
+                'labels': [dates[i] for i in rows],
+                'datasets': [{
+                    'label': f"Cumplimiento {pair['projection']} (%)",
+                    'data': [pair['series']['ratio'][i] for i in rows],
+                    'backgroundColor': colors[n % len(colors)],
+                    'borderColor': colors[n % len(colors)]
+                } for n, pair in enumerate(pairs)]
+            },
+            'options': {
+                'responsive': True,
+                'scales': {
+                    'y': {
+                        'beginAtZero': True,
+                        'title': {
+                            'display': True,
+                            'text': 'Porcentaje de Cumplimiento'
+                        }
+                    },
+                    'x': {
+                        'title': {
+                            'display': True,
+                            'text': 'Fecha'
                         }
+                    }
+                },
+                'plugins': {
+                    'title': {
+                        'display': True,
+                        'text': 'Precisión Mensual de Proyección (%)'
                     },
-                    'plugins': {
-                        'annotation': {
-                            'annotations': {
-                                'line1': {
-                                    'type': 'line',
-                                    'yMin': 100,
-                                    'yMax': 100,
-                                    'borderColor': 'gray',
-                                    'borderDash': [5, 5],
-                                    'label': {
-                                        'content': 'Proyección Exacta',
-                                        'enabled': True
-                                    }
+                    'annotation': {
+                        'annotations': {
+                            'line1': {
+                                'type': 'line',
+                                'yMin': 100,
+                                'yMax': 100,
+                                'borderColor': 'gray',
+                                'borderDash': [5, 5],
+                                'label': {
+                                    'content': 'Proyección Exacta',
+                                    'enabled': True
                                 }
                             }
                         }
                     }
                 }
-            }
-        return None
+            },
+            'metrics': {pair['projection']: pair['metrics'] for pair in pairs}
+        }
     
     elif chart_type == 'difference':
-        # Gráfico de diferencia entre proyección ajustada y recibida
-        if 'proyeccion ajustada' not in processed_data.columns or 'fruta recibida' not in processed_data.columns:
+        # Gráfico de diferencia entre cada proyección y la fruta recibida
+        accuracy = compute_projection_accuracy(processed_data=processed_data, data_hash=data_hash)
+        if 'error' in accuracy:
             return {'error': 'Se requieren datos de proyección ajustada y fruta recibida para este gráfico'}
         
-        if processed_data['proyeccion ajustada'].sum() == 0 or processed_data['fruta recibida'].sum() == 0:
+        pairs = [pair for pair in accuracy['pairs'] if pair['periods'] > 0]
+        if not pairs:
             return {'error': 'No hay datos válidos para calcular diferencias'}
         
-        if 'diferencia_ajustada' in processed_data.columns:
-            return {
-                'type': 'line',
-                'data': {
-                    'labels': dates,
-                    'datasets': [{
-                        'label': 'Diferencia (Ajustada - Recibida)',
-                        'data': processed_data['diferencia_ajustada'].tolist(),
-                        'borderColor': '#FF6384',
-                        'backgroundColor': '#FF638420',
-                        'tension': 0.1,
-                        'fill': False
-                    }]
-                },
-                'options': {
-                    'responsive': True,
-                    'scales': {
-                        'y': {
-                            'title': {
-                                'display': True,
-                                'text': 'Toneladas (positiva = sobreproyección)'
-                            }
-                        },
-                        'x': {
-                            'title': {
-                                'display': True,
-                                'text': 'Fecha'
-                            }
+        colors = ['#FF6384', '#FF9F40']
+        return {
+            'type': 'line',
+            'data': {
+                'labels': dates,
+                'datasets': [{
+                    'label': f"Diferencia ({pair['projection']} - {pair['actual']})",
+                    'data': pair['series']['error'],
+                    'borderColor': colors[n % len(colors)],
+                    'backgroundColor': colors[n % len(colors)] + '20',
+                    'tension': 0.1,
+                    'fill': False,
+                    'spanGaps': False
+                } for n, pair in enumerate(pairs)]
+            },
+            'options': {
+                'responsive': True,
+                'scales': {
+                    'y': {
+                        'title': {
+                            'display': True,
+                            'text': 'Toneladas (positiva = sobreproyección)'
                         }
                     },
-                    'plugins': {
-                        'annotation': {
-                            'annotations': {
-                                'line1': {
-                                    'type': 'line',
-                                    'yMin': 0,
-                                    'yMax': 0,
-                                    'borderColor': 'gray',
-                                    'borderDash': [5, 5],
-                                    'label': {
-                                        'content': 'Línea de Referencia',
-                                        'enabled': True
-                                    }
+                    'x': {
+                        'title': {
+                            'display': True,
+                            'text': 'Fecha'
+                        }
+                    }
+                },
+                'plugins': {
+                    'title': {
+                        'display': True,
+                        'text': 'Diferencia entre Proyección y Fruta Recibida'
+                    },
+                    'annotation': {
+                        'annotations': {
+                            'line1': {
+                                'type': 'line',
+                                'yMin': 0,
+                                'yMax': 0,
+                                'borderColor': 'gray',
+                                'borderDash': [5, 5],
+                                'label': {
+                                    'content': 'Línea de Referencia',
+                                    'enabled': True
                                 }
                             }
                         }
                     }
                 }
-            }
-        return None
+            },
+            'metrics': {pair['projection']: pair['metrics'] for pair in pairs}
+        }
 
     elif chart_type == 'scatter':
         # Gráfico de dispersión - correlación entre variables
@@ -1318,7 +3540,7 @@ def get_chart_data(chart_type):
             return {'error': 'Se requieren al menos 2 variables para el gráfico de dispersión'}
         
         # Buscar dos columnas con datos válidos
-        valid_columns = [col for col in processed_data.columns if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].sum() > 0]
+        valid_columns = axes['valid_columns']
         
         if len(valid_columns) < 2:
             return {'error': 'No hay suficientes variables válidas para el gráfico de dispersión'}
@@ -1370,7 +3592,7 @@ def get_chart_data(chart_type):
             return {'error': 'Se requieren al menos 3 variables para el gráfico de radar'}
         
         # Obtener las primeras 6 columnas con datos válidos
-        valid_columns = [col for col in processed_data.columns if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].sum() > 0][:6]
+        valid_columns = axes['valid_columns'][:6]
         
         if len(valid_columns) < 3:
             return {'error': 'No hay suficientes variables válidas para el gráfico de radar'}
@@ -1421,29 +3643,24 @@ def get_chart_data(chart_type):
             return {'error': 'Se requieren datos para el gráfico de caja'}
         
         # Obtener columnas con datos válidos
-        valid_columns = [col for col in processed_data.columns if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].sum() > 0][:5]
+        valid_columns = axes['valid_columns'][:5]
         
         if len(valid_columns) < 1:
             return {'error': 'No hay variables válidas para el gráfico de caja'}
         
-        # Calcular estadísticas de caja para cada columna
+        # Estadísticas de caja del perfil de columnas de esta versión
+        profile = profile_columns(processed_data=processed_data, data_hash=data_hash)['columns']
         box_data = []
         for col in valid_columns:
-            values = processed_data[col].dropna()
-            if len(values) > 0:
-                q1 = values.quantile(0.25)
-                q3 = values.quantile(0.75)
-                median = values.median()
-                min_val = values.min()
-                max_val = values.max()
-                
+            column = profile.get(col)
+            if column and column['count'] > 0:
                 box_data.append({
                     'label': col,
-                    'min': float(min_val),
-                    'q1': float(q1),
-                    'median': float(median),
-                    'q3': float(q3),
-                    'max': float(max_val)
+                    'min': column['min'],
+                    'q1': column['q1'],
+                    'median': column['median'],
+                    'q3': column['q3'],
+                    'max': column['max']
                 })
         
         if len(box_data) < 1:
@@ -1474,6 +3691,95 @@ def get_chart_data(chart_type):
             }
         }
     
+    elif chart_type == 'forecast':
+        # Pronóstico de los próximos meses con su intervalo de predicción
+        forecast = compute_forecast('holt_winters', FORECAST_DEFAULT_HORIZON, 95, processed_data=processed_data, data_hash=data_hash)
+        if 'error' in forecast:
+            return forecast
+        
+        valid_columns = [col for col in axes['valid_columns'] if col in forecast['forecasts']]
+        if not valid_columns:
+            return {'error': 'No hay datos suficientes para el pronóstico'}
+        
+        # Eje mensual con la historia y los meses pronosticados; cada variable pronostica desde su último dato
+        monthly = _forecast_matrix(processed_data)
+        timeline = monthly.index.union(
+            pd.DatetimeIndex(sorted({date for col in valid_columns for date in forecast['forecasts'][col]['dates']})))
+        datasets = []
+        colors = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
+        
+        for i, column in enumerate(valid_columns):
+            color = colors[i % len(colors)]
+            entry = forecast['forecasts'][column]
+            anchor = timeline.get_loc(pd.Timestamp(entry['last_observed']))
+            history = [None if value != value else value for value in monthly[column].reindex(timeline).tolist()]
+            history[anchor + 1:] = [None] * (len(timeline) - anchor - 1)  # Meses aún sin dato: los cubre el pronóstico
+            predicted, lower, upper = ([None] * len(timeline) for _ in range(3))
+            predicted[anchor] = history[anchor]  # La línea del pronóstico parte del último dato real
+            for position, mean, low, high in zip(timeline.get_indexer(pd.DatetimeIndex(entry['dates'])),
+                                                  entry['forecast'], entry['lower'], entry['upper']):
+                predicted[position], lower[position], upper[position] = mean, low, high
+            
+            datasets += [{
+                'label': column.title(),
+                'data': history,
+                'borderColor': color,
+                'backgroundColor': color + '20',
+                'tension': 0.1
+            }, {
+                'label': f"{column.title()} (pronóstico)",
+                'data': predicted,
+                'borderColor': color,
+                'backgroundColor': color + '20',
+                'borderDash': [6, 4],
+                'tension': 0.1
+            }, {
+                'label': f"{column.title()} (límite inferior {forecast['confidence']}%)",
+                'data': lower,
+                'borderColor': 'transparent',
+                'pointRadius': 0,
+                'fill': False
+            }, {
+                'label': f"{column.title()} (límite superior {forecast['confidence']}%)",
+                'data': upper,
+                'borderColor': 'transparent',
+                'backgroundColor': color + '20',
+                'pointRadius': 0,
+                'fill': '-1'
+            }]
+        
+        return {
+            'type': 'line',
+            'data': {
+                'labels': timeline.strftime('%b-%Y').tolist(),
+                'datasets': datasets
+            },
+            'options': {
+                'responsive': True,
+                'plugins': {
+                    'title': {
+                        'display': True,
+                        'text': f"Pronóstico a {forecast['horizon']} meses (Holt-Winters, intervalo {forecast['confidence']}%)"
+                    }
+                },
+                'scales': {
+                    'y': {
+                        'beginAtZero': True,
+                        'title': {
+                            'display': True,
+                            'text': 'Toneladas'
+                        }
+                    },
+                    'x': {
+                        'title': {
+                            'display': True,
+                            'text': 'Fecha'
+                        }
+                    }
+                }
+            }
+        }
+    
     return None
 
 @app.route('/')
@@ -1506,141 +3812,274 @@ def favicon():
                              'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
 
+def ingest_upload(file_path, content_hash, streaming, session_id=None, stage=None):
+    """Procesa un archivo subido (o el DataFrame de su sesión de carga) usando la caché de datasets"""
+    upload_session = get_upload_session(session_id) if session_id else None
+    if session_id and upload_session is None:
+        return False, "La sesión de carga expiró, vuelve a enviar el archivo", False
+    
+    if upload_session:
+        # Una versión reparada no corresponde al hash del archivo original
+        repaired = stage == 'repaired' and 'repaired' in upload_session['frames']
+        cache_key = None if repaired else get_parsed_cache_key(content_hash, 'full')
+    else:
+        cache_key = get_parsed_cache_key(content_hash, 'stream' if streaming else 'full')
+    
+    # Un archivo idéntico ya procesado se carga desde la caché sin volver a parsear
+    cached = load_parsed_dataset(cache_key) if cache_key else None
+    if cached:
+        frames, message, cached_notes = cached
+        set_active_dataset(frames.get('current_data'), frames.get('processed_data'), frames.get('original_data'))
+        set_ingest_notes(cached_notes.get('warnings'), cached_notes.get('repairs'))
+        print(f"📤 [Upload] Dataset cargado desde caché: {cache_key}")
+        success = True
+    else:
+        print(f"📤 [Upload] Procesando archivo...")
+        if upload_session:
+            df, schema = get_session_frame(upload_session, stage or 'parsed')
+            success, message = process_parsed_frame(df, schema, file_path)
+        else:
+            success, message = process_file_data(file_path, streaming)
+        if success and cache_key:
+            report_progress('guardando en caché', 95)
+            try:
+                frames, notes = get_ingest_result()
+                store_parsed_dataset(cache_key, frames, message, notes)
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar el dataset en caché: {e}")
+    
+    print(f"📤 [Upload] Resultado del procesamiento: success={success}, message={message}")
+    if upload_session and success:
+        drop_upload_session(session_id)
+    return success, message, bool(cached)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    """Recibe un CSV (o un id de sesión de carga) y encola su procesamiento"""
     try:
         print(f"📤 [Upload] Petición recibida desde: {request.remote_addr}")
         print(f"📤 [Upload] Headers: {dict(request.headers)}")
         print(f"📤 [Upload] Archivos en request: {list(request.files.keys())}")
         
-        if 'file' not in request.files:
-            print("📤 [Upload] Error: No se encontró 'file' en request.files")
-            return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
+        # Con un id de sesión de /api/csv-validation no se reenvía ni se vuelve a parsear el archivo
+        session_id = request.form.get('session_id')
+        upload_session = get_upload_session(session_id) if session_id else None
+        if session_id and upload_session is None:
+            print(f"📤 [Upload] Sesión de carga expirada: {session_id}")
+            return session_expired_response()
         
-        file = request.files['file']
-        print(f"📤 [Upload] Archivo recibido: {file.filename}, tamaño: {file.content_length}")
+        ingest_mode = request.form.get('ingest', 'replace')
+        if ingest_mode != 'replace' and ingest_mode not in INCREMENTAL_MODES:
+            return jsonify({
+                'success': False,
+                'message': f"Modo de carga no válido: {ingest_mode}",
+                'modes': {'replace': 'reemplaza el dataset activo', **INCREMENTAL_MODES}
+            }), 400
+        
+        if upload_session:
+            file_path = upload_session['file_path']
+            content_hash = upload_session['content_hash']
+            print(f"📤 [Upload] Usando sesión de carga {session_id}")
+        else:
+            if 'file' not in request.files:
+                print("📤 [Upload] Error: No se encontró 'file' en request.files")
+                return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
+            
+            file = request.files['file']
+            print(f"📤 [Upload] Archivo recibido: {file.filename}, tamaño: {file.content_length}")
+            
+            if file.filename == '':
+                print("📤 [Upload] Error: Nombre de archivo vacío")
+                return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
+            
+            if file and file.filename.lower().endswith('.csv'):
+                filename = secure_filename(file.filename)
+                # Prefijo único por subida: dos archivos con el mismo nombre en cola no se pisan
+                file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:8]}_{filename}")
+                
+                # Crear directorio si no existe
+                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+            else:
+                return jsonify({'success': False, 'message': 'Formato de archivo no válido. Solo se permiten archivos CSV.'})
+            
+            print(f"📤 [Upload] Guardando archivo en: {file_path}")
+            content_hash = save_upload_hashed(file, file_path)
+            print(f"📤 [Upload] Archivo guardado exitosamente (sha256={content_hash[:12]})")
+        
+        # Carga incremental: solo el archivo nuevo se procesa y se fusiona con el pivot activo
+        if ingest_mode in INCREMENTAL_MODES:
+            stage = request.form.get('session_stage', 'parsed')
+            task = lambda: ingest_incremental(file_path, ingest_mode, session_id if upload_session else None, stage) + (False,)
+            if not upload_session:
+                task = removing_upload(task, file_path)
+            job = submit_ingestion_job(task, upload_session['filename'] if upload_session else filename)
+            if job is None:
+                if not upload_session:
+                    remove_upload_file(file_path)
+                return jsonify({'success': False, 'message': 'Hay demasiados archivos en proceso, intenta de nuevo en unos segundos'}), 429
+            return jsonify({
+                'success': True,
+                'message': f'Archivo recibido, incorporando datos en modo {ingest_mode}',
+                'job_id': job['id'],
+                'status_url': url_for('get_job_status', job_id=job['id'])
+            }), 202
+        if upload_session:
+            stage = request.form.get('session_stage', 'parsed')
+            filename = upload_session['filename']
+            streaming = False  # El DataFrame de la sesión ya está completo en memoria
+        else:
+            mode = request.form.get('mode')
+            streaming = True if mode == 'stream' else False if mode == 'full' else None
+            if streaming is None:
+                streaming = os.path.getsize(file_path) > app.config['STREAMING_THRESHOLD']
+            stage = None
+        
+        # El procesamiento corre en el pool de ingesta; el cliente consulta /api/jobs/<id>
+        task = lambda: ingest_upload(file_path, content_hash, streaming, session_id if upload_session else None, stage)
+        if not upload_session:
+            task = removing_upload(task, file_path)  # El archivo de una sesión lo borra drop_upload_session
+        job = submit_ingestion_job(task, filename)
+        if job is None:
+            print("📤 [Upload] Cola de ingesta llena")
+            if not upload_session:
+                remove_upload_file(file_path)
+            return jsonify({'success': False, 'message': 'Hay demasiados archivos en proceso, intenta de nuevo en unos segundos'}), 429
+        
+        print(f"📤 [Upload] Trabajo {job['id']} encolado")
+        return jsonify({
+            'success': True,
+            'message': 'Archivo recibido, procesando en segundo plano',
+            'job_id': job['id'],
+            'status_url': url_for('get_job_status', job_id=job['id'])
+        }), 202
         
-        if file.filename == '':
-            print("📤 [Upload] Error: Nombre de archivo vacío")
+    except Exception as e:
+        print(f"📤 [Upload] Error crítico en upload_file: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Error interno del servidor: {str(e)}'}), 500
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """Recibe varios CSV ASAPALSA y encola su procesamiento en paralelo y combinación en un solo pivot"""
+    try:
+        files = [file for file in request.files.getlist('files') if file and file.filename]
+        if not files:
             return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
+        if len(files) > app.config['BATCH_MAX_FILES']:
+            return jsonify({'success': False, 'message': f"Máximo {app.config['BATCH_MAX_FILES']} archivos por lote"}), 400
+        if not all(file.filename.lower().endswith('.csv') for file in files):
+            return jsonify({'success': False, 'message': 'Formato de archivo no válido. Solo se permiten archivos CSV.'})
         
-        if file and file.filename.lower().endswith('.csv'):
-            filename = secure_filename(file.filename)
+        policy = request.form.get('conflict', BATCH_DEFAULT_POLICY)
+        if policy not in BATCH_CONFLICT_POLICIES:
+            return jsonify({
+                'success': False,
+                'message': f"Política de conflicto no válida: {policy}",
+                'policies': BATCH_CONFLICT_POLICIES
+            }), 400
+        
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        file_paths, names = [], []
+        for position, file in enumerate(files):
+            # Prefijo por lote y posición: dos archivos con el mismo nombre no se pisan
+            filename = f"lote_{uuid.uuid4().hex[:8]}_{position:03d}_{secure_filename(file.filename)}"
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            # Crear directorio si no existe
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            
-            # Manejar archivos duplicados
-            if os.path.exists(file_path):
-                try:
-                    # Intentar eliminar archivo existente
-                    os.remove(file_path)
-                except PermissionError:
-                    # Si no se puede eliminar, usar nombre con timestamp
-                    name, ext = os.path.splitext(filename)
-                    timestamp = int(time.time())
-                    filename = f"{name}_{timestamp}{ext}"
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-        print(f"📤 [Upload] Guardando archivo en: {file_path}")
-        file.save(file_path)
-        print(f"📤 [Upload] Archivo guardado exitosamente")
+            file.save(file_path)
+            file_paths.append(file_path)
+            names.append(f"{position + 1}. {secure_filename(file.filename)}")
+        print(f"📤 [Batch] {len(file_paths)} archivos recibidos, política de conflicto '{policy}'")
         
-        print(f"📤 [Upload] Procesando archivo...")
-        success, message = process_file_data(file_path)
-        print(f"📤 [Upload] Resultado del procesamiento: success={success}, message={message}")
+        job = submit_ingestion_job(lambda: ingest_batch(file_paths, policy, names) + (False,), f"{len(file_paths)} archivos")
+        if job is None:
+            return jsonify({'success': False, 'message': 'Hay demasiados archivos en proceso, intenta de nuevo en unos segundos'}), 429
         
-        if success:
-            # Obtener información del dataset de forma segura
-            try:
-                info = {
-                    'total_records': len(processed_data) if processed_data is not None else 0,
-                    'date_range': get_date_range(processed_data),
-                    'movement_types': list(processed_data.columns) if processed_data is not None else [],
-                    'total_tonnage': float(processed_data.sum().sum()) if processed_data is not None and not processed_data.empty else 0
-                }
-            except Exception as e:
-                print(f"Error obteniendo info del dataset: {e}")
-                info = {
-                    'total_records': 0,
-                    'date_range': 'N/A',
-                    'movement_types': [],
-                    'total_tonnage': 0
-                }
-            
-            response_data = {
-                'success': True, 
-                'message': message,
-                'info': info
-            }
-            print(f"📤 [Upload] Enviando respuesta exitosa: {response_data}")
-            return jsonify(response_data)
-        else:
-            print(f"📤 [Upload] Enviando respuesta de error: {message}")
-            return jsonify({'success': False, 'message': message})
-    
-        return jsonify({'success': False, 'message': 'Formato de archivo no válido. Solo se permiten archivos CSV.'})
+        return jsonify({
+            'success': True,
+            'message': f'{len(file_paths)} archivos recibidos, procesando en segundo plano',
+            'job_id': job['id'],
+            'status_url': url_for('get_job_status', job_id=job['id']),
+            'conflict_policy': policy
+        }), 202
         
     except Exception as e:
-        print(f"📤 [Upload] Error crítico en upload_file: {e}")
+        print(f"📤 [Batch] Error crítico en upload_batch: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'message': f'Error interno del servidor: {str(e)}'}), 500
 
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """Estado de un trabajo de ingesta: etapa, filas procesadas, porcentaje y resultado"""
+    job = get_ingestion_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/chart/<chart_type>')
+@conditional_get
 def get_chart(chart_type):
-    chart_data = get_chart_data(chart_type)
+    rolling_window = request.args.get('rolling')  # Media móvil superpuesta (gráfico de líneas)
+    if rolling_window is not None:
+        if not rolling_window.isdigit() or not 1 <= int(rolling_window) <= ROLLING_MAX_WINDOW:
+            return jsonify({'error': f'La ventana móvil debe ser un entero entre 1 y {ROLLING_MAX_WINDOW}'}), 400
+        rolling_window = int(rolling_window)
+    chart_data = get_chart_data(chart_type, rolling_window) if rolling_window else get_chart_data(chart_type)
     if chart_data:
         return jsonify(chart_data)
     else:
         return jsonify({'error': 'Tipo de gráfico no válido o datos insuficientes'}), 400
 
+@cached_operation('summary')
+def build_data_summary(processed_data=None, data_hash=None):
+    """Resumen del dataset para el panel principal"""
+    if processed_data is not None and not processed_data.empty:
+        print(f"processed_data shape: {processed_data.shape}")
+        print(f"processed_data columns: {list(processed_data.columns)}")
+        print(f"processed_data index: {processed_data.index}")
+        
+        try:
+            # Filtrar solo columnas numéricas para cálculos
+            numeric_cols = [col for col in processed_data.columns if processed_data[col].dtype in ['float64', 'int64']]
+            numeric_data = processed_data[numeric_cols] if numeric_cols else processed_data.select_dtypes(include=[np.number])
+            
+            summary = {
+                'total_records': len(processed_data),
+                'columns': list(processed_data.columns),
+                'date_range': {
+                    'start': processed_data.index.min().strftime('%Y-%m-%d') if hasattr(processed_data.index.min(), 'strftime') else str(processed_data.index.min()),
+                    'end': processed_data.index.max().strftime('%Y-%m-%d') if hasattr(processed_data.index.max(), 'strftime') else str(processed_data.index.max())
+                },
+                'total_tonnage': float(numeric_data.sum().sum()) if not numeric_data.empty else 0,
+                'monthly_average': float(numeric_data.sum(axis=1).mean()) if len(numeric_data) > 0 else 0,
+                'movement_types': len(processed_data.columns),
+                'numeric_columns': len(numeric_cols)
+            }
+            print(f"summary: {summary}")
+            return summary
+        except Exception as e:
+            print(f"Error creando summary: {e}")
+            # Filtrar solo columnas numéricas para el fallback
+            numeric_cols = [col for col in processed_data.columns if processed_data[col].dtype in ['float64', 'int64']]
+            return {
+                'total_records': len(processed_data),
+                'columns': list(processed_data.columns),
+                'date_range': 'N/A',
+                'total_tonnage': 0,
+                'monthly_average': 0,
+                'movement_types': len(processed_data.columns),
+                'numeric_columns': len(numeric_cols)
+            }
+    else:
+        return {'error': 'No hay datos disponibles'}
+
 @app.route('/data/summary')
+@conditional_get
 def get_data_summary():
     try:
-        global processed_data
-        print(f"get_data_summary called, processed_data is None: {processed_data is None}")
-        
-        if processed_data is not None and not processed_data.empty:
-            print(f"processed_data shape: {processed_data.shape}")
-            print(f"processed_data columns: {list(processed_data.columns)}")
-            print(f"processed_data index: {processed_data.index}")
-            
-            try:
-                # Filtrar solo columnas numéricas para cálculos
-                numeric_cols = [col for col in processed_data.columns if processed_data[col].dtype in ['float64', 'int64']]
-                numeric_data = processed_data[numeric_cols] if numeric_cols else processed_data.select_dtypes(include=[np.number])
-                
-                summary = {
-                    'total_records': len(processed_data),
-                    'columns': list(processed_data.columns),
-                    'date_range': {
-                        'start': processed_data.index.min().strftime('%Y-%m-%d') if hasattr(processed_data.index.min(), 'strftime') else str(processed_data.index.min()),
-                        'end': processed_data.index.max().strftime('%Y-%m-%d') if hasattr(processed_data.index.max(), 'strftime') else str(processed_data.index.max())
-                    },
-                    'total_tonnage': float(numeric_data.sum().sum()) if not numeric_data.empty else 0,
-                    'monthly_average': float(numeric_data.sum(axis=1).mean()) if len(numeric_data) > 0 else 0,
-                    'movement_types': len(processed_data.columns),
-                    'numeric_columns': len(numeric_cols)
-                }
-                print(f"summary: {summary}")
-                return summary
-            except Exception as e:
-                print(f"Error creando summary: {e}")
-                # Filtrar solo columnas numéricas para el fallback
-                numeric_cols = [col for col in processed_data.columns if processed_data[col].dtype in ['float64', 'int64']]
-                return {
-                    'total_records': len(processed_data),
-                    'columns': list(processed_data.columns),
-                    'date_range': 'N/A',
-                    'total_tonnage': 0,
-                    'monthly_average': 0,
-                    'movement_types': len(processed_data.columns),
-                    'numeric_columns': len(numeric_cols)
-                }
-        else:
-            return {'error': 'No hay datos disponibles'}
+        frames = get_active_frames()
+        print(f"get_data_summary called, processed_data is None: {frames['processed_data'] is None}")
+        return build_data_summary(processed_data=frames['processed_data'], data_hash=frames['version_id'])
         
     except Exception as e:
         print(f"Error crítico en get_data_summary: {e}")
@@ -1651,7 +4090,8 @@ def get_data_summary():
 @app.route('/api/save-analysis', methods=['POST'])
 def save_analysis_api():
     """Guardar el análisis actual en el historial"""
-    global processed_data, current_data
+    frames = get_active_frames()
+    processed_data, current_data = frames['processed_data'], frames['current_data']
     
     if processed_data is None:
         return jsonify({'success': False, 'message': 'No hay datos para guardar'})
@@ -1741,327 +4181,971 @@ def delete_analysis(analysis_id):
 @app.route('/api/filters/options')
 def get_filter_options():
     """Obtener opciones disponibles para los filtros"""
-    global processed_data
+    processed_data = get_active_frames(filtered=False)['processed_data']
     try:
         if processed_data is None or processed_data.empty:
             return jsonify({'error': 'No hay datos cargados'}), 400
         
-        # Obtener tipos de movimiento únicos
-        movement_types = []
-        for col in processed_data.columns:
-            if col not in ['fecha', 'mes', 'año']:
-                movement_types.append(col)
+        # Tipos de movimiento: columnas del pivot
+        movement_types = [str(col) for col in processed_data.columns]
         
-        # Obtener rango de fechas
+        # Rango de fechas del índice
+        has_dates = isinstance(processed_data.index, pd.DatetimeIndex)
         date_range = {
-            'min': processed_data['fecha'].min().strftime('%Y-%m-%d') if 'fecha' in processed_data.columns else None,
-            'max': processed_data['fecha'].max().strftime('%Y-%m-%d') if 'fecha' in processed_data.columns else None
+            'min': processed_data.index.min().strftime('%Y-%m-%d') if has_dates else None,
+            'max': processed_data.index.max().strftime('%Y-%m-%d') if has_dates else None
         }
         
         return jsonify({
             'movement_types': movement_types,
-            'date_range': date_range
+            'date_range': date_range,
+            'active_filters': get_active_filters()
         })
     except Exception as e:
         return jsonify({'error': f'Error al obtener opciones de filtros: {str(e)}'}), 500
 
 @app.route('/api/filters/apply', methods=['POST'])
 def apply_filters():
-    """Aplicar filtros a los datos"""
-    global processed_data
-    
+    """Aplicar un filtro sobre los datos (se apila sobre los filtros anteriores)"""
     try:
-        if processed_data is None or processed_data.empty:
+        filtered_data, depth = push_filter(request.json or {})
+        if filtered_data is None:
             return jsonify({'error': 'No hay datos cargados'}), 400
         
-        filters = request.json
-        filtered_data = processed_data.copy()
-        
-        # Filtro por fecha
-        if filters.get('date_from'):
-            date_from = pd.to_datetime(filters['date_from'])
-            filtered_data = filtered_data[filtered_data['fecha'] >= date_from]
-        
-        if filters.get('date_to'):
-            date_to = pd.to_datetime(filters['date_to'])
-            filtered_data = filtered_data[filtered_data['fecha'] <= date_to]
-        
-        # Filtro por tipo de movimiento
-        if filters.get('movement_type'):
-            movement_type = filters['movement_type']
-            if movement_type in filtered_data.columns:
-                # Filtrar solo las filas donde este tipo de movimiento tiene valores
-                filtered_data = filtered_data[filtered_data[movement_type].notna() & (filtered_data[movement_type] > 0)]
-        
-        # Actualizar datos procesados globalmente
-        processed_data = filtered_data
-        
         return jsonify({
             'success': True,
             'message': f'Filtros aplicados. {len(filtered_data)} registros encontrados.',
-            'filtered_count': len(filtered_data)
+            'filtered_count': len(filtered_data),
+            'filters': get_active_filters(),
+            'depth': depth
         })
-        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Error al aplicar filtros: {str(e)}'}), 500
 
+@app.route('/api/filters/undo', methods=['POST'])
+def undo_filter():
+    """Quitar el último filtro aplicado"""
+    try:
+        restored_data, depth = pop_filters(1)
+        if restored_data is None:
+            return jsonify({'error': 'No hay datos cargados'}), 400
+        return jsonify({
+            'success': True,
+            'message': f'Último filtro deshecho. {len(restored_data)} registros.',
+            'restored_count': len(restored_data),
+            'filters': get_active_filters(),
+            'depth': depth
+        })
+    except Exception as e:
+        return jsonify({'error': f'Error al deshacer el filtro: {str(e)}'}), 500
+
 @app.route('/api/filters/clear', methods=['POST'])
 def clear_filters():
-    """Limpiar filtros y restaurar datos originales"""
+    """Limpiar filtros y volver al pivot completo"""
     try:
-        global processed_data, original_data
-        if not original_data.empty:
-            processed_data = original_data.copy()
-            return jsonify({
-                'success': True,
-                'message': 'Filtros limpiados. Datos originales restaurados.',
-                'restored_count': len(processed_data)
-            })
-        else:
+        restored_data, depth = pop_filters(None)
+        if restored_data is None:
             return jsonify({'error': 'No hay datos originales para restaurar'}), 400
+        return jsonify({
+            'success': True,
+            'message': 'Filtros limpiados. Datos originales restaurados.',
+            'restored_count': len(restored_data)
+        })
     except Exception as e:
         return jsonify({'error': f'Error al limpiar filtros: {str(e)}'}), 500
 
-# Rutas de análisis estadístico
-@app.route('/api/statistics/correlations')
-def get_correlations():
-    """Obtener matriz de correlaciones entre variables"""
-    global processed_data
+# Rutas de análisis estadístico
+@cached_operation('correlations')
+def compute_correlations(processed_data=None, data_hash=None):
+    """Matriz de correlaciones entre las variables numéricas"""
+    # Obtener solo columnas numéricas
+    numeric_columns = []
+    for col in processed_data.columns:
+        if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
+            numeric_columns.append(col)
+    
+    if len(numeric_columns) < 2:
+        return {'error': 'Se requieren al menos 2 variables numéricas para calcular correlaciones'}
+    
+    # Calcular matriz de correlaciones
+    correlation_matrix = processed_data[numeric_columns].corr()
+    
+    # Convertir a formato JSON
+    correlations = {}
+    for i, col1 in enumerate(numeric_columns):
+        correlations[col1] = {}
+        for j, col2 in enumerate(numeric_columns):
+            correlations[col1][col2] = float(correlation_matrix.iloc[i, j])
+    
+    return {
+        'correlations': correlations,
+        'variables': numeric_columns
+    }
+
+@app.route('/api/statistics/correlations')
+@conditional_get
+def get_correlations():
+    """Obtener matriz de correlaciones entre variables"""
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
+    try:
+        if processed_data is None or processed_data.empty:
+            return jsonify({'error': 'No hay datos para analizar'}), 400
+        
+        # Resultado en caché por versión del dataset (precalculado tras la carga)
+        result = compute_correlations(processed_data=processed_data, data_hash=frames['version_id'])
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'error': f'Error al calcular correlaciones: {str(e)}'}), 500
+
+# Motor de tendencias
+TREND_METHODS = ('ols', 'theil_sen')
+TREND_STABLE_CHANGE = 0.05  # Cambio ajustado en el período, relativo a la media, por debajo del cual la serie es estable
+THEIL_SEN_MAX_PAIRS = 2_000_000  # Pendientes (pares × columnas) evaluadas a la vez; con más se usa una muestra fija de pares
+SEASONAL_MIN_POINTS = 24  # Dos años de meses para estimar la estacionalidad
+
+def _least_squares(x, values, valid):
+    """Ecuaciones normales de la recta para todas las columnas a la vez (los NaN no cuentan)"""
+    weights = valid.astype('float64')
+    filled = np.where(valid, values, 0)
+    n = weights.sum(axis=0)
+    sum_x, sum_xx = x @ weights, (x * x) @ weights
+    sum_y, sum_xy = filled.sum(axis=0), x @ filled
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x)
+        intercept = (sum_y - slope * sum_x) / n
+    return slope, intercept
+
+def _theil_sen(x, values, valid):
+    """Mediana de las pendientes entre pares de puntos y mediana de los interceptos, para todas las columnas"""
+    first, second = np.triu_indices(len(x), 1)
+    limit = max(THEIL_SEN_MAX_PAIRS // values.shape[1], 1)
+    if len(first) > limit:
+        pick = np.random.default_rng(0).choice(len(first), size=limit, replace=False)
+        first, second = first[pick], second[pick]
+    slopes = (values[second] - values[first]) / (x[second] - x[first])[:, np.newaxis]  # NaN si falta algún punto
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Columnas sin pares válidos en la muestra
+        slope = np.nanmedian(slopes, axis=0)
+        intercept = np.nanmedian(np.where(valid, values - slope * x[:, np.newaxis], np.nan), axis=0)
+    return slope, intercept
+
+def _seasonal_component(months, residuals, valid):
+    """Media de los residuos de cada mes del año, centrada, para todas las columnas"""
+    one_hot = np.eye(12)[months]
+    month_sum = one_hot.T @ np.where(valid, residuals, 0)
+    month_count = one_hot.T @ valid.astype('float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        component = np.nan_to_num(month_sum / month_count)
+    component -= (component * month_count).sum(axis=0) / month_count.sum(axis=0)
+    return component[months]
+
+def fit_trends(processed_data, method='ols', seasonal=False):
+    """Tendencia lineal de todas las variables numéricas en una sola operación sobre la matriz del pivot.
+    
+    method='ols' resuelve mínimos cuadrados para todas las columnas a la vez; 'theil_sen' usa la mediana de las
+    pendientes entre pares (robusta a valores atípicos). Con seasonal=True y fechas mensuales se descuenta la
+    media de cada mes del año antes de ajustar. La clase de tendencia compara el cambio ajustado en el período
+    con la media de la serie, así que no depende de la escala (toneladas, kilos, ...).
+    """
+    columns = [col for col, dtype in processed_data.dtypes.items()
+               if col not in ['diferencia_ajustada', 'precision_proy'] and dtype in ['float64', 'int64']]
+    values = processed_data[columns].to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    keep = valid.sum(axis=0) > 1
+    columns = [col for col, kept in zip(columns, keep) if kept]
+    if not columns:
+        return {}
+    values, valid = values[:, keep], valid[:, keep]
+    original = values
+    count = valid.sum(axis=0)
+    x = np.arange(len(values), dtype='float64')
+    
+    # Estacionalidad solo en las columnas con al menos SEASONAL_MIN_POINTS meses observados
+    seasonal_applied = np.zeros(len(columns), dtype=bool)
+    if seasonal and isinstance(processed_data.index, pd.DatetimeIndex):
+        seasonal_applied = count >= SEASONAL_MIN_POINTS
+    if seasonal_applied.any():
+        slope, intercept = _least_squares(x, values, valid)
+        months = processed_data.index.month.to_numpy() - 1
+        component = _seasonal_component(months, values - (intercept + slope * x[:, np.newaxis]), valid)
+        values = values - component * seasonal_applied
+    
+    slope, intercept = _least_squares(x, values, valid)
+    if method == 'theil_sen':
+        robust_slope, robust_intercept = _theil_sen(x, values, valid)
+        sampled = np.isfinite(robust_slope)  # Con muestra de pares, una columna casi vacía puede quedar sin pares
+        slope = np.where(sampled, robust_slope, slope)
+        intercept = np.where(sampled, robust_intercept, intercept)
+    
+    # Bondad del ajuste y error estándar de la pendiente
+    weights = valid.astype('float64')
+    mean = np.where(valid, values, 0).sum(axis=0) / count
+    residuals = np.where(valid, values - (intercept + slope * x[:, np.newaxis]), 0)
+    sse = (residuals ** 2).sum(axis=0)
+    sst = (np.where(valid, values - mean, 0) ** 2).sum(axis=0)
+    spread_x = (x * x) @ weights - (x @ weights) ** 2 / count
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r_squared = np.where(sst > 0, 1 - sse / sst, 0.0)
+        std_error = np.sqrt(sse / (count - 2) / spread_x)
+    
+    # Primer y último valor observados y cambio ajustado relativo a la media
+    first_row = valid.argmax(axis=0)
+    last_row = len(values) - 1 - valid[::-1].argmax(axis=0)
+    columns_range = np.arange(len(columns))
+    first_value = original[first_row, columns_range]
+    last_value = original[last_row, columns_range]
+    level = np.abs(np.where(valid, original, 0).sum(axis=0) / count)
+    fitted_change = slope * (last_row - first_row)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relative_change = np.where(level > 0, fitted_change / level, np.sign(fitted_change) * np.inf)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        change_pct = np.where(first_value != 0, (last_value - first_value) / first_value * 100, 0.0)
+    stable = np.abs(relative_change) < TREND_STABLE_CHANGE
+    std_error = np.where(np.isfinite(std_error), std_error, np.nan)
+    relative_change = np.where(np.isfinite(relative_change), relative_change, np.nan)
+    
+    # Valores de Python de una vez: el armado del resultado no recorre escalares de numpy
+    rows = zip(columns, np.isfinite(slope).tolist(), stable.tolist(), slope.tolist(), intercept.tolist(),
+               r_squared.tolist(), std_error.tolist(), relative_change.tolist(), change_pct.tolist(),
+               first_value.tolist(), last_value.tolist(), seasonal_applied.tolist())
+    trends = {}
+    for col, fitted, is_stable, col_slope, col_intercept, r2, error, relative, change, first, last, adjusted in rows:
+        if not fitted:
+            continue
+        if is_stable:
+            trend_type, trend_color = "Estable", "info"
+        elif col_slope > 0:
+            trend_type, trend_color = "Creciente", "success"
+        else:
+            trend_type, trend_color = "Decreciente", "danger"
+        trends[col] = {
+            'slope': col_slope,
+            'intercept': col_intercept,
+            'r_squared': r2,
+            'std_error': None if error != error else error,  # NaN -> null en el JSON
+            'relative_change': None if relative != relative else relative,
+            'trend_type': trend_type,
+            'trend_color': trend_color,
+            'change_pct': change,
+            'first_value': first,
+            'last_value': last,
+            'method': method,
+            'seasonal': adjusted
+        }
+    return trends
+
+def trend_operation(method='ols', seasonal=False):
+    """Nombre en caché de una variante de tendencias ('trends' para la de por defecto)"""
+    return 'trends' + ('' if method == 'ols' else f'_{method}') + ('_seasonal' if seasonal else '')
+
+@cached_operation(trend_operation)
+def compute_trends(method='ols', seasonal=False, processed_data=None, data_hash=None):
+    """Tendencia lineal, ajuste y clase de tendencia de cada variable"""
+    return {'trends': fit_trends(processed_data, method, seasonal), 'method': method, 'seasonal': seasonal}
+
+@app.route('/api/statistics/trends')
+@conditional_get
+def get_trends():
+    """Obtener análisis de tendencias temporales (?method=ols|theil_sen, ?seasonal=1 para descontar la estacionalidad)"""
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
+    try:
+        if processed_data is None or processed_data.empty:
+            return jsonify({'error': 'No hay datos para analizar'}), 400
+        
+        method = request.args.get('method', 'ols')
+        if method not in TREND_METHODS:
+            return jsonify({'error': f"Método de tendencia no válido. Use uno de: {', '.join(TREND_METHODS)}"}), 400
+        seasonal = request.args.get('seasonal', '0').lower() in ('1', 'true', 'si', 'sí')
+        
+        # Resultado en caché por versión del dataset (la variante por defecto se precalcula tras la carga)
+        result = compute_trends(method, seasonal, processed_data=processed_data, data_hash=frames['version_id'])
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'error': f'Error al calcular tendencias: {str(e)}'}), 500
+
+# Estadísticas en ventana móvil
+ROLLING_STATISTICS = ('mean', 'sum', 'std', 'min', 'max', 'accuracy')
+ROLLING_MAX_WINDOW = 120  # Meses
+
+def find_column(columns, name):
+    """Columna cuyo nombre coincide sin distinguir mayúsculas ni espacios extremos, o None"""
+    for col in columns:
+        if str(col).strip().lower() == name:
+            return col
+    return None
+
+def _window_sums(values, window):
+    """Suma de cada ventana [i - window + 1, i] con sumas acumuladas: O(1) por posición y columna"""
+    cumulative = np.zeros((len(values) + 1, values.shape[1]))
+    np.cumsum(values, axis=0, out=cumulative[1:])
+    start = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    return cumulative[1:] - cumulative[start]
+
+def _window_extreme(values, window, reduce, fill):
+    """Mínimo o máximo móvil (van Herk/Gil-Werman): acumulados por bloques de tamaño window hacia adelante y
+    hacia atrás; cada ventana combina el sufijo de su primer bloque con el prefijo del segundo"""
+    n, k = values.shape
+    filled = np.where(np.isnan(values), fill, values)
+    blocks = np.vstack([filled, np.full(((-n) % window, k), fill)]).reshape(-1, window, k)
+    prefix = reduce.accumulate(blocks, axis=1).reshape(-1, k)[:n]
+    suffix = reduce.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, k)[:n]
+    result = prefix.copy()  # Las ventanas incompletas del inicio caen dentro del primer bloque
+    if window <= n:
+        result[window - 1:] = reduce(suffix[:n - window + 1], prefix[window - 1:])
+    return result
+
+def rolling_window_stats(values, window, statistics, min_periods):
+    """Estadísticas móviles de todas las columnas de una matriz (filas = meses) sin recalcular cada ventana.
+    
+    Suma, media y desviación salen de sumas acumuladas (centradas en la media de la columna para no perder
+    precisión); mínimo y máximo, del algoritmo por bloques. Una ventana con menos de min_periods valores es NaN.
+    """
+    valid = ~np.isnan(values)
+    count = _window_sums(valid.astype('float64'), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        center = np.nan_to_num(np.where(valid, values, 0).sum(axis=0) / valid.sum(axis=0))
+        shifted = np.where(valid, values - center, 0)
+        first = _window_sums(shifted, window)
+        results = {}
+        if 'sum' in statistics:
+            results['sum'] = first + center * count
+        if 'mean' in statistics:
+            results['mean'] = first / count + center
+        if 'std' in statistics:
+            second = _window_sums(shifted ** 2, window)
+            results['std'] = np.sqrt(np.maximum(second - first ** 2 / count, 0) / (count - 1))
+            results['std'][count < 2] = np.nan
+    if 'min' in statistics:
+        results['min'] = _window_extreme(values, window, np.minimum, np.inf)
+    if 'max' in statistics:
+        results['max'] = _window_extreme(values, window, np.maximum, -np.inf)
+    for name in results:
+        results[name][count < min_periods] = np.nan
+    return results
+
+def rolling_operation(window, statistics, min_periods):
+    """Nombre en caché de una especificación de ventana"""
+    return f"rolling_{window}_{min_periods}_{'-'.join(statistics)}"
+
+@cached_operation(rolling_operation)
+def compute_rolling(window, statistics, min_periods, processed_data=None, data_hash=None):
+    """Estadísticas móviles de las variables numéricas y, con 'accuracy', precisión móvil de la proyección"""
+    columns = [col for col, dtype in processed_data.dtypes.items()
+               if col not in ['diferencia_ajustada', 'precision_proy'] and dtype in ['float64', 'int64']]
+    values = processed_data[columns].to_numpy(dtype='float64')
+    results = rolling_window_stats(values, window, statistics, min_periods)
+    
+    def as_list(array):
+        return [None if value != value else value for value in array.tolist()]  # NaN -> null en el JSON
+    
+    series = {name: {col: as_list(result[:, i]) for i, col in enumerate(columns)} for name, result in results.items()}
+    
+    if 'accuracy' in statistics:
+        # Precisión de la ventana: 100 * (1 - suma |proyectada - recibida| / suma recibida)
+        projected = find_column(processed_data.columns, 'fruta proyectada')
+        received = find_column(processed_data.columns, 'fruta recibida')
+        if projected is None or received is None:
+            return {'error': 'Se requieren datos de fruta proyectada y recibida para calcular la precisión móvil'}
+        pair = processed_data[[projected, received]].to_numpy(dtype='float64')
+        both = ~np.isnan(pair).any(axis=1)
+        sums = _window_sums(np.column_stack([np.where(both, np.abs(pair[:, 0] - pair[:, 1]), 0),
+                                             np.where(both, pair[:, 1], 0),
+                                             both.astype('float64')]), window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            accuracy = np.where(sums[:, 1] > 0, 100 * (1 - sums[:, 0] / sums[:, 1]), np.nan)
+        accuracy[sums[:, 2] < min_periods] = np.nan
+        series['accuracy'] = {'precision_proyeccion': as_list(accuracy)}
+    
+    index = processed_data.index
+    dates = index.strftime('%Y-%m-%d').tolist() if isinstance(index, pd.DatetimeIndex) else [str(value) for value in index]
+    return {
+        'window': window,
+        'min_periods': min_periods,
+        'statistics': list(statistics),
+        'dates': dates,
+        'series': series
+    }
+
+@app.route('/api/statistics/rolling')
+@conditional_get
+def get_rolling_statistics():
+    """Estadísticas en ventana móvil: ?window=3&stats=mean,std,min,max,sum,accuracy&min_periods=3"""
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
     try:
         if processed_data is None or processed_data.empty:
             return jsonify({'error': 'No hay datos para analizar'}), 400
         
-        # Verificar caché
-        data_hash = get_data_hash(processed_data)
-        cached_result = get_from_cache(data_hash, 'correlations')
-        if cached_result:
-            return jsonify(cached_result)
-        
-        # Obtener solo columnas numéricas
-        numeric_columns = []
-        for col in processed_data.columns:
-            if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                numeric_columns.append(col)
-        
-        if len(numeric_columns) < 2:
-            return jsonify({'error': 'Se requieren al menos 2 variables numéricas para calcular correlaciones'}), 400
-        
-        # Calcular matriz de correlaciones
-        correlation_matrix = processed_data[numeric_columns].corr()
-        
-        # Convertir a formato JSON
-        correlations = {}
-        for i, col1 in enumerate(numeric_columns):
-            correlations[col1] = {}
-            for j, col2 in enumerate(numeric_columns):
-                correlations[col1][col2] = float(correlation_matrix.iloc[i, j])
-        
-        result = {
-            'correlations': correlations,
-            'variables': numeric_columns
-        }
-        
-        # Guardar en caché
-        set_cache(data_hash, 'correlations', result)
+        try:
+            window = int(request.args.get('window', 3))
+            min_periods = int(request.args.get('min_periods', window))
+        except ValueError:
+            return jsonify({'error': 'window y min_periods deben ser números enteros'}), 400
+        if not 1 <= window <= ROLLING_MAX_WINDOW:
+            return jsonify({'error': f'La ventana debe ser un entero entre 1 y {ROLLING_MAX_WINDOW}'}), 400
+        if not 1 <= min_periods <= window:
+            return jsonify({'error': 'min_periods debe ser un entero entre 1 y el tamaño de la ventana'}), 400
+        requested = [name.strip() for name in request.args.get('stats', 'mean').split(',') if name.strip()]
+        unknown = [name for name in requested if name not in ROLLING_STATISTICS]
+        if not requested or unknown:
+            return jsonify({'error': f"Estadísticas no válidas. Use: {', '.join(ROLLING_STATISTICS)}"}), 400
+        statistics = tuple(name for name in ROLLING_STATISTICS if name in requested)  # Orden canónico para la caché
+        
+        result = compute_rolling(window, statistics, min_periods, processed_data=processed_data, data_hash=frames['version_id'])
+        if 'error' in result:
+            return jsonify(result), 400
         
         return jsonify(result)
         
     except Exception as e:
-        return jsonify({'error': f'Error al calcular correlaciones: {str(e)}'}), 500
+        return jsonify({'error': f'Error al calcular estadísticas móviles: {str(e)}'}), 500
 
-@app.route('/api/statistics/trends')
-def get_trends():
-    """Obtener análisis de tendencias temporales"""
-    global processed_data
+# Precisión de las proyecciones contra la fruta recibida
+PROJECTION_PAIRS = (
+    ('fruta proyectada', 'fruta recibida'),
+    ('proyeccion compra de fruta ajustada', 'fruta recibida')
+)
+
+@cached_operation('accuracy')
+def compute_projection_accuracy(processed_data=None, data_hash=None):
+    """Error de cada par proyección/recibida en una sola pasada sobre todos los pares.
+    
+    Un mes cuenta solo si la proyección y la recibida son positivas: el pivot rellena con 0 los meses
+    sin dato. El error es proyección - recibida (positivo = sobreproyección) y el cumplimiento es
+    recibida / proyección en porcentaje.
+    """
+    pairs = []
+    for projected_name, actual_name in PROJECTION_PAIRS:
+        projected = find_column(processed_data.columns, projected_name)
+        actual = find_column(processed_data.columns, actual_name)
+        if projected is not None and actual is not None:
+            pairs.append((projected, actual))
+    if not pairs:
+        return {'error': 'Se requieren datos de fruta recibida y de al menos una proyección para calcular la precisión'}
+    
+    projected = processed_data[[p for p, _ in pairs]].to_numpy(dtype='float64')
+    actual = processed_data[[a for _, a in pairs]].to_numpy(dtype='float64')
+    valid = (projected > 0) & (actual > 0)  # NaN también queda fuera
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        error = np.where(valid, projected - actual, np.nan)
+        abs_error = np.abs(error)
+        pct_error = error / actual * 100
+        ratio = np.where(valid, actual / projected * 100, np.nan)
+        cumulative = np.where(valid, np.cumsum(np.where(valid, error, 0), axis=0), np.nan)
+        
+        periods = valid.sum(axis=0)
+        actual_total = np.where(valid, actual, 0).sum(axis=0)
+        error_total = np.nansum(error, axis=0)
+        mape = np.nansum(np.abs(pct_error), axis=0) / periods
+        wape = np.nansum(abs_error, axis=0) / actual_total * 100
+        bias = error_total / actual_total * 100
+        mean_error = error_total / periods
+    
+    def as_list(array):
+        return [None if value != value else value for value in array.tolist()]  # NaN -> null en el JSON
+    
+    def as_number(value):
+        return None if value != value else float(value)
+    
+    index = processed_data.index
+    dates = index.strftime('%Y-%m-%d').tolist() if isinstance(index, pd.DatetimeIndex) else [str(value) for value in index]
+    return {
+        'dates': dates,
+        'pairs': [{
+            'projection': str(projected_col),
+            'actual': str(actual_col),
+            'periods': int(periods[i]),
+            'metrics': {
+                'mape': as_number(mape[i]),
+                'wape': as_number(wape[i]),
+                'bias_pct': as_number(bias[i]),
+                'mean_error': as_number(mean_error[i]),
+                'cumulative_error': float(error_total[i])
+            },
+            'series': {
+                'ratio': as_list(ratio[:, i]),
+                'error': as_list(error[:, i]),
+                'abs_error': as_list(abs_error[:, i]),
+                'pct_error': as_list(pct_error[:, i]),
+                'cumulative_error': as_list(cumulative[:, i])
+            }
+        } for i, (projected_col, actual_col) in enumerate(pairs)]
+    }
+
+@app.route('/api/statistics/accuracy')
+@conditional_get
+def get_projection_accuracy():
+    """Precisión de las proyecciones: MAPE, WAPE, sesgo y error acumulado por par proyección/recibida"""
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
     try:
         if processed_data is None or processed_data.empty:
             return jsonify({'error': 'No hay datos para analizar'}), 400
         
-        # Verificar caché
-        data_hash = get_data_hash(processed_data)
-        cached_result = get_from_cache(data_hash, 'trends')
-        if cached_result:
-            return jsonify(cached_result)
-        
-        trends = {}
+        result = compute_projection_accuracy(processed_data=processed_data, data_hash=frames['version_id'])
+        if 'error' in result:
+            return jsonify(result), 400
         
-        # Analizar tendencias para cada columna numérica
-        for col in processed_data.columns:
-            if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                values = processed_data[col].dropna()
-                if len(values) > 1:
-                    # Calcular tendencia simple (pendiente de regresión lineal)
-                    x = np.arange(len(values))
-                    y = values.values
-                    
-                    # Regresión lineal simple
-                    n = len(x)
-                    sum_x = np.sum(x)
-                    sum_y = np.sum(y)
-                    sum_xy = np.sum(x * y)
-                    sum_x2 = np.sum(x * x)
-                    
-                    slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x)
-                    
-                    # Determinar tipo de tendencia
-                    if abs(slope) < 0.1:
-                        trend_type = "Estable"
-                        trend_color = "info"
-                    elif slope > 0:
-                        trend_type = "Creciente"
-                        trend_color = "success"
-                    else:
-                        trend_type = "Decreciente"
-                        trend_color = "danger"
-                    
-                    # Calcular cambio porcentual
-                    first_value = values.iloc[0]
-                    last_value = values.iloc[-1]
-                    if first_value != 0:
-                        change_pct = ((last_value - first_value) / first_value) * 100
-                    else:
-                        change_pct = 0
-                    
-                    trends[col] = {
-                        'slope': float(slope),
-                        'trend_type': trend_type,
-                        'trend_color': trend_color,
-                        'change_pct': float(change_pct),
-                        'first_value': float(first_value),
-                        'last_value': float(last_value)
-                    }
+        return jsonify(result)
         
-        result = {'trends': trends}
+    except Exception as e:
+        return jsonify({'error': f'Error al calcular la precisión de las proyecciones: {str(e)}'}), 500
+
+# Pronóstico de los próximos meses por tipo de movimiento
+FORECAST_METHODS = ('holt_winters', 'seasonal_naive')
+FORECAST_SEASON = 12  # Meses
+FORECAST_DEFAULT_HORIZON = 12
+FORECAST_MAX_HORIZON = 36
+FORECAST_BACKTEST_FOLDS = 3
+FORECAST_Z = {80: 1.2816, 90: 1.6449, 95: 1.9600, 99: 2.5758}  # Nivel de confianza -> cuantil de la normal
+# Combinaciones (alpha, beta, gamma) de Holt-Winters que se ajustan a la vez; cada columna se queda con la de menor error
+HOLT_WINTERS_GRID = np.array(np.meshgrid([0.1, 0.3, 0.5, 0.8], [0.01, 0.1, 0.3], [0.05, 0.2, 0.5], indexing='ij')).reshape(3, -1).T
+
+def observed_span(values):
+    """Primer mes con dato y mes siguiente al último de cada columna.
+    
+    El pivot rellena con 0 los meses sin registro, así que los ceros antes del primer dato y después del
+    último (meses aún no recibidos) no son historia.
+    """
+    has_data = values != 0
+    observed = has_data.any(axis=0)
+    n = len(values)
+    return (np.where(observed, has_data.argmax(axis=0), n),
+            np.where(observed, n - has_data[::-1].argmax(axis=0), n))
+
+def _residual_sigma(residuals, valid):
+    """Desviación de los residuos válidos de cada columna (NaN si no hay ninguno)"""
+    count = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt((np.where(valid, residuals, 0) ** 2).sum(axis=0) / count)
+
+def fit_forecast_batch(values, method, season=FORECAST_SEASON):
+    """Ajusta un modelo por columna de una matriz (filas = meses consecutivos) y devuelve sus estados finales.
+    
+    Cada columna se ajusta sobre su tramo observado. Con dos temporadas o más, holt_winters ajusta el modelo
+    aditivo de todas las columnas y todas las combinaciones de HOLT_WINTERS_GRID en un solo recorrido; con una
+    temporada se usa el estacional ingenuo y con menos, el último valor.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype='float64'))
+    n, k = values.shape
+    start, end = observed_span(values)
+    length = end - start
+    kind = np.where(length >= season, 'seasonal_naive', np.where(length > 0, 'naive', 'empty'))
+    if method == 'holt_winters':
+        kind = np.where(length >= 2 * season, 'holt_winters', kind)
+    
+    level = np.zeros(k)
+    trend = np.zeros(k)
+    seasonal = np.zeros((k, season))
+    sigma = np.full(k, np.nan)
+    params = np.full((k, 3), np.nan)
+    rows = np.arange(n)[:, np.newaxis]
+    
+    # Último valor: paseo aleatorio, el error crece con cada mes
+    naive = np.flatnonzero(kind == 'naive')
+    level[naive] = values[end[naive] - 1, naive]
+    sigma[naive] = _residual_sigma(np.diff(values, axis=0), (rows[1:] > start) & (rows[1:] < end))[naive]
+    
+    # Estacional ingenuo: repite la última temporada observada
+    snaive = np.flatnonzero(kind == 'seasonal_naive')
+    if len(snaive):
+        seasonal[snaive] = values[end[snaive, np.newaxis] - season + np.arange(season), snaive[:, np.newaxis]]
+        residual_rows = (rows[season:] >= start + season) & (rows[season:] < end)
+        sigma[snaive] = _residual_sigma(values[season:] - values[:-season], residual_rows)[snaive]
+    
+    hw = np.flatnonzero(kind == 'holt_winters')
+    if len(hw):
+        y = values[:, hw]
+        first, last = start[hw], end[hw]
+        cols = np.arange(len(hw))
+        alpha, beta, gamma = (HOLT_WINTERS_GRID[:, i, np.newaxis] for i in range(3))
+        
+        # Estados iniciales con las dos primeras temporadas de cada columna
+        first_season = y[first[:, np.newaxis] + np.arange(season), cols[:, np.newaxis]]
+        second_season = y[first[:, np.newaxis] + np.arange(season, 2 * season), cols[:, np.newaxis]]
+        level0 = first_season.mean(axis=1)
+        grid_size = len(HOLT_WINTERS_GRID)
+        hw_level = np.tile(level0, (grid_size, 1))
+        hw_trend = np.tile((second_season.mean(axis=1) - level0) / season, (grid_size, 1))
+        hw_season = np.tile(first_season - level0[:, np.newaxis], (grid_size, 1, 1))
+        sse = np.zeros((grid_size, len(hw)))
+        steps = np.zeros(len(hw))
+        
+        for t in range(int(first.min()) + season, int(last.max())):
+            active = (t >= first + season) & (t < last)
+            phase = (t - first) % season
+            current = hw_season[:, cols, phase]
+            error = y[t] - (hw_level + hw_trend + current)
+            new_level = alpha * (y[t] - current) + (1 - alpha) * (hw_level + hw_trend)
+            new_trend = beta * (new_level - hw_level) + (1 - beta) * hw_trend
+            hw_season[:, cols, phase] = np.where(active, gamma * (y[t] - new_level) + (1 - gamma) * current, current)
+            hw_level = np.where(active, new_level, hw_level)
+            hw_trend = np.where(active, new_trend, hw_trend)
+            sse += np.where(active, error ** 2, 0)
+            steps += active
+        
+        best = sse.argmin(axis=0)
+        level[hw] = hw_level[best, cols]
+        trend[hw] = hw_trend[best, cols]
+        # Índices estacionales en el orden de los meses por venir
+        seasonal[hw] = hw_season[best[:, np.newaxis], cols[:, np.newaxis], ((last - first)[:, np.newaxis] + np.arange(season)) % season]
+        sigma[hw] = np.sqrt(sse[best, cols] / steps)
+        params[hw] = HOLT_WINTERS_GRID[best]
+    
+    return {'kind': kind, 'end': end, 'level': level, 'trend': trend, 'seasonal': seasonal, 'sigma': sigma, 'params': params}
+
+def forecast_batch(model, horizon, z):
+    """Pronóstico e intervalo de predicción de todas las columnas para los meses 1..horizon tras su último dato.
+    
+    La varianza a h pasos es sigma² por h (último valor), por las temporadas completas que abarca
+    (estacional ingenuo) o por 1 + Σ cj² con cj = alpha (1 + j beta) + gamma [j múltiplo de la temporada]
+    (Holt-Winters aditivo). El tonelaje no es negativo, así que todo se recorta en 0.
+    """
+    kind = model['kind']
+    season = model['seasonal'].shape[1]
+    steps = np.arange(1, horizon + 1)[:, np.newaxis]
+    mean = model['level'] + steps * model['trend'] + model['seasonal'][:, (steps[:, 0] - 1) % season].T
+    
+    multiplier = np.where(kind == 'naive', steps, (steps - 1) // season + 1).astype('float64')
+    if (kind == 'holt_winters').any():
+        alpha, beta, gamma = model['params'].T
+        lags = steps[:-1]
+        weights = alpha * (1 + lags * beta) + gamma * (lags % season == 0)
+        hw_multiplier = 1 + np.vstack([np.zeros((1, len(kind))), np.cumsum(weights ** 2, axis=0)])
+        multiplier = np.where(kind == 'holt_winters', hw_multiplier, multiplier)
+    
+    width = z * model['sigma'] * np.sqrt(multiplier)
+    return {
+        'mean': np.maximum(mean, 0),
+        'lower': np.maximum(mean - width, 0),
+        'upper': np.maximum(mean + width, 0)
+    }
+
+def backtest_forecast_batch(values, method, horizon, folds, season=FORECAST_SEASON):
+    """Backtest de origen móvil: en cada corte ajusta con la historia previa y compara los meses siguientes.
+    
+    Los cortes se cuentan desde el último dato de cada columna. Devuelve MAE, RMSE y MAPE (sobre meses con
+    recibido positivo) de cada columna en todos los cortes. Se ejecuta en serie: con las pocas columnas de un
+    pivot real tarda decenas de milisegundos, menos de lo que cuesta enviar los datos al pool de procesos.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype='float64'))
+    n, k = values.shape
+    _, end = observed_span(values)
+    rows = np.arange(n)[:, np.newaxis]
+    columns = np.arange(k)
+    totals = np.zeros((4, k))  # Suma de |error|, de error², de |error| / real y meses con real positivo
+    evaluated = np.zeros(k)
+    periods = np.zeros(k)
+    for fold in range(1, folds + 1):
+        # Lo posterior al corte se borra: para el ajuste son meses aún sin dato
+        model = fit_forecast_batch(np.where(rows < end - fold * horizon, values, 0), method, season)
+        targets = model['end'] + np.arange(horizon)[:, np.newaxis]
+        known = (targets < end) & (model['kind'] != 'empty')
+        actual = values[np.minimum(targets, n - 1), columns]
+        error = np.where(known, forecast_batch(model, horizon, 0)['mean'] - actual, 0)
+        positive = known & (actual > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            totals += [np.abs(error).sum(axis=0), (error ** 2).sum(axis=0),
+                       np.where(positive, np.abs(error) / actual, 0).sum(axis=0), positive.sum(axis=0)]
+        evaluated += known.any(axis=0)
+        periods += known.sum(axis=0)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'mae': totals[0] / periods,
+            'rmse': np.sqrt(totals[1] / periods),
+            'mape': totals[2] / totals[3] * 100,
+            'folds': evaluated
+        }
+
+def _forecast_matrix(processed_data):
+    """Variables numéricas sumadas por mes calendario, en meses consecutivos.
+    
+    En el pivot ASAPALSA cada mes ya es una fila y un mes ausente queda en 0, igual que su fill_value;
+    con fechas diarias o repetidas de otros archivos se suma todo lo del mes.
+    """
+    columns = [col for col, dtype in processed_data.dtypes.items()
+               if col not in ['diferencia_ajustada', 'precision_proy'] and dtype in ['float64', 'int64']]
+    return processed_data[columns].resample('MS').sum()
+
+@cached_operation('forecast_models_{0}')
+def forecast_models(method, processed_data=None, data_hash=None):
+    """Modelos ajustados de todas las variables; se reutilizan para cualquier horizonte y nivel de confianza"""
+    if not isinstance(processed_data.index, pd.DatetimeIndex):
+        return {'error': 'El pronóstico requiere datos mensuales con fecha'}
+    data = _forecast_matrix(processed_data)
+    if data.empty or len(data.columns) == 0:
+        return {'error': 'No hay datos suficientes para pronosticar'}
+    
+    model = fit_forecast_batch(data.to_numpy(dtype='float64'), method)
+    last_dates = data.index.strftime('%Y-%m-%d')
+    return {
+        'columns': [str(col) for col in data.columns],
+        'last_observed': [last_dates[end - 1] if end > 0 else None for end in model.pop('end')],
+        **{name: array.tolist() for name, array in model.items()}
+    }
+
+@cached_operation('forecast_{0}_{1}_{2}')
+def compute_forecast(method, horizon, confidence, processed_data=None, data_hash=None):
+    """Pronóstico de los meses siguientes al último dato de cada variable, con su intervalo de predicción"""
+    models = forecast_models(method, processed_data=processed_data, data_hash=data_hash)
+    if 'error' in models:
+        return models
+    model = {name: np.asarray(models[name], dtype=None if name == 'kind' else 'float64')
+             for name in ('kind', 'level', 'trend', 'seasonal', 'sigma', 'params')}
+    result = forecast_batch(model, horizon, FORECAST_Z[confidence])
+    
+    def as_list(array):
+        return [None if value != value else value for value in array.tolist()]  # NaN -> null en el JSON
+    
+    forecasts = {}
+    for i, col in enumerate(models['columns']):
+        kind = models['kind'][i]
+        if kind == 'empty':
+            continue
+        forecasts[col] = {
+            'model': kind,
+            'params': dict(zip(('alpha', 'beta', 'gamma'), models['params'][i])) if kind == 'holt_winters' else None,
+            'sigma': None if models['sigma'][i] != models['sigma'][i] else models['sigma'][i],
+            'last_observed': models['last_observed'][i],
+            'dates': pd.date_range(models['last_observed'][i], periods=horizon + 1, freq='MS')[1:].strftime('%Y-%m-%d').tolist(),
+            'forecast': as_list(result['mean'][:, i]),
+            'lower': as_list(result['lower'][:, i]),
+            'upper': as_list(result['upper'][:, i])
+        }
+    
+    return {
+        'method': method,
+        'horizon': horizon,
+        'confidence': confidence,
+        'season': FORECAST_SEASON,
+        'forecasts': forecasts
+    }
+
+@cached_operation('forecast_backtest_{0}_{1}_{2}')
+def compute_forecast_backtest(method, horizon, folds, processed_data=None, data_hash=None):
+    """Error de pronóstico fuera de muestra de cada variable en sus últimos cortes de horizon meses"""
+    if not isinstance(processed_data.index, pd.DatetimeIndex):
+        return {'error': 'El pronóstico requiere datos mensuales con fecha'}
+    data = _forecast_matrix(processed_data)
+    metrics = backtest_forecast_batch(data.to_numpy(dtype='float64'), method, horizon, folds)
+    
+    def as_number(value):
+        return None if value != value else float(value)
+    
+    return {
+        'method': method,
+        'horizon': horizon,
+        'folds': folds,
+        'metrics': {
+            str(col): {
+                'mae': as_number(metrics['mae'][i]),
+                'rmse': as_number(metrics['rmse'][i]),
+                'mape': as_number(metrics['mape'][i]),
+                'folds': int(metrics['folds'][i])
+            } for i, col in enumerate(data.columns)
+        }
+    }
+
+@app.route('/api/statistics/forecast')
+@conditional_get
+def get_forecast():
+    """Pronóstico por tipo de movimiento: ?horizon=12&method=holt_winters|seasonal_naive&confidence=95&backtest=1"""
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
+    try:
+        if processed_data is None or processed_data.empty:
+            return jsonify({'error': 'No hay datos para analizar'}), 400
         
-        # Guardar en caché
-        set_cache(data_hash, 'trends', result)
+        try:
+            horizon = int(request.args.get('horizon', FORECAST_DEFAULT_HORIZON))
+            confidence = int(request.args.get('confidence', 95))
+        except ValueError:
+            return jsonify({'error': 'horizon y confidence deben ser números enteros'}), 400
+        if not 1 <= horizon <= FORECAST_MAX_HORIZON:
+            return jsonify({'error': f'El horizonte debe ser un entero entre 1 y {FORECAST_MAX_HORIZON} meses'}), 400
+        if confidence not in FORECAST_Z:
+            return jsonify({'error': f"Nivel de confianza no válido. Use: {', '.join(str(level) for level in FORECAST_Z)}"}), 400
+        method = request.args.get('method', 'holt_winters')
+        if method not in FORECAST_METHODS:
+            return jsonify({'error': f"Método no válido. Use: {', '.join(FORECAST_METHODS)}"}), 400
+        
+        result = compute_forecast(method, horizon, confidence, processed_data=processed_data, data_hash=frames['version_id'])
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        if request.args.get('backtest', '').lower() in ('1', 'true', 'yes'):
+            backtest = compute_forecast_backtest(method, horizon, FORECAST_BACKTEST_FOLDS,
+                                                 processed_data=processed_data, data_hash=frames['version_id'])
+            result = {**result, 'backtest': backtest}
         
         return jsonify(result)
         
     except Exception as e:
-        return jsonify({'error': f'Error al calcular tendencias: {str(e)}'}), 500
+        return jsonify({'error': f'Error al calcular el pronóstico: {str(e)}'}), 500
+
+@cached_operation('descriptive')
+def compute_descriptive_stats(processed_data=None, data_hash=None):
+    """Estadísticas descriptivas de cada variable"""
+    stats = {}
+    
+    # Tomar las estadísticas de cada columna numérica del perfil de columnas
+    profile = profile_columns(processed_data=processed_data, data_hash=data_hash)['columns']
+    for col, column in profile.items():
+        if col not in ['diferencia_ajustada', 'precision_proy'] and column['count'] > 0:
+            stats[col] = {
+                'count': column['count'],
+                'mean': column['mean'],
+                'median': column['median'],
+                'std': column['std'],
+                'min': column['min'],
+                'max': column['max'],
+                'q1': column['q1'],
+                'q3': column['q3'],
+                'skewness': column['skewness'] if column['count'] > 2 else 0,
+                'kurtosis': column['kurtosis'] if column['count'] > 2 else 0
+            }
+    
+    return {'statistics': stats}
 
 @app.route('/api/statistics/descriptive')
+@conditional_get
 def get_descriptive_stats():
     """Obtener estadísticas descriptivas"""
-    global processed_data
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
     try:
         if processed_data is None or processed_data.empty:
             return jsonify({'error': 'No hay datos para analizar'}), 400
         
-        # Verificar caché
-        data_hash = get_data_hash(processed_data)
-        cached_result = get_from_cache(data_hash, 'descriptive')
-        if cached_result:
-            return jsonify(cached_result)
-        
-        stats = {}
-        
-        # Calcular estadísticas para cada columna numérica
-        for col in processed_data.columns:
-            if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                values = processed_data[col].dropna()
-                if len(values) > 0:
-                    stats[col] = {
-                        'count': int(len(values)),
-                        'mean': float(values.mean()),
-                        'median': float(values.median()),
-                        'std': float(values.std()),
-                        'min': float(values.min()),
-                        'max': float(values.max()),
-                        'q1': float(values.quantile(0.25)),
-                        'q3': float(values.quantile(0.75)),
-                        'skewness': float(values.skew()) if len(values) > 2 else 0,
-                        'kurtosis': float(values.kurtosis()) if len(values) > 2 else 0
-                    }
-        
-        result = {'statistics': stats}
-        
-        # Guardar en caché
-        set_cache(data_hash, 'descriptive', result)
+        # Resultado en caché por versión del dataset (precalculado tras la carga)
+        result = compute_descriptive_stats(processed_data=processed_data, data_hash=frames['version_id'])
+        if 'error' in result:
+            return jsonify(result), 400
         
         return jsonify(result)
         
     except Exception as e:
         return jsonify({'error': f'Error al calcular estadísticas: {str(e)}'}), 500
 
+@cached_operation('anomalies')
+def compute_anomalies(processed_data=None, data_hash=None):
+    """Valores atípicos (método IQR) de cada variable"""
+    anomalies = {}
+    
+    # Detectar anomalías con los límites IQR del perfil de columnas
+    profile = profile_columns(processed_data=processed_data, data_hash=data_hash)['columns']
+    for col, column in profile.items():
+        if col not in ['diferencia_ajustada', 'precision_proy'] and column['count'] > 4:  # Necesitamos al menos 5 valores para calcular IQR
+            lower_bound = column['lower_bound']
+            upper_bound = column['upper_bound']
+            
+            # Encontrar anomalías (los NaN no cumplen ninguna de las dos condiciones)
+            values = processed_data[col]
+            anomaly_values = values[(values < lower_bound) | (values > upper_bound)]
+            
+            if len(anomaly_values) > 0:
+                # Convertir índices a string para evitar problemas con Timestamps
+                anomaly_data = []
+                for idx, val in anomaly_values.items():
+                    anomaly_data.append({
+                        'index': str(idx),
+                        'value': float(val),
+                        'date': idx.strftime('%Y-%m-%d') if hasattr(idx, 'strftime') else str(idx)
+                    })
+                
+                anomalies[col] = {
+                    'count': len(anomaly_values),
+                    'percentage': (len(anomaly_values) / column['count']) * 100,
+                    'values': anomaly_data,
+                    'bounds': {
+                        'lower': float(lower_bound),
+                        'upper': float(upper_bound)
+                    }
+                }
+    
+    return {'anomalies': anomalies}
+
 @app.route('/api/statistics/anomalies')
+@conditional_get
 def get_anomalies():
     """Detectar anomalías en los datos"""
-    global processed_data
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
     try:
         if processed_data is None or processed_data.empty:
             return jsonify({'error': 'No hay datos para analizar'}), 400
         
-        # Verificar caché
-        data_hash = get_data_hash(processed_data)
-        cached_result = get_from_cache(data_hash, 'anomalies')
-        if cached_result:
-            return jsonify(cached_result)
-        
-        anomalies = {}
-        
-        # Detectar anomalías usando método IQR para cada columna
-        for col in processed_data.columns:
-            if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                values = processed_data[col].dropna()
-                if len(values) > 4:  # Necesitamos al menos 5 valores para calcular IQR
-                    Q1 = values.quantile(0.25)
-                    Q3 = values.quantile(0.75)
-                    IQR = Q3 - Q1
-                    
-                    # Definir límites para anomalías
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    
-                    # Encontrar anomalías
-                    anomaly_indices = values[(values < lower_bound) | (values > upper_bound)].index
-                    anomaly_values = values[anomaly_indices]
-                    
-                    if len(anomaly_values) > 0:
-                        # Convertir índices a string para evitar problemas con Timestamps
-                        anomaly_data = []
-                        for idx, val in anomaly_values.items():
-                            try:
-                                if hasattr(processed_data.index[idx], 'strftime'):
-                                    date_str = processed_data.index[idx].strftime('%Y-%m-%d')
-                                else:
-                                    date_str = str(processed_data.index[idx])
-                                anomaly_data.append({
-                                    'index': str(idx),
-                                    'value': float(val),
-                                    'date': date_str
-                                })
-                            except Exception as e:
-                                print(f"Error procesando anomalía en índice {idx}: {e}")
-                                continue
-                        
-                        anomalies[col] = {
-                            'count': len(anomaly_values),
-                            'percentage': (len(anomaly_values) / len(values)) * 100,
-                            'values': anomaly_data,
-                            'bounds': {
-                                'lower': float(lower_bound),
-                                'upper': float(upper_bound)
-                            }
-                        }
-        
-        result = {'anomalies': anomalies}
-        
-        # Guardar en caché
-        set_cache(data_hash, 'anomalies', result)
+        # Resultado en caché por versión del dataset (precalculado tras la carga)
+        result = compute_anomalies(processed_data=processed_data, data_hash=frames['version_id'])
+        if 'error' in result:
+            return jsonify(result), 400
         
         return jsonify(result)
         
     except Exception as e:
         return jsonify({'error': f'Error al detectar anomalías: {str(e)}'}), 500
 
+# Precálculo tras la carga: los resultados que pide el panel quedan en caché antes de la primera visita
+warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precalculo')
+CHART_TYPES = ('line', 'bar', 'comparison', 'precision', 'difference', 'scatter', 'radar', 'boxplot', 'forecast')
+WARMUP_STEPS = (
+    [('summary', build_data_summary, ())]
+    + [(f'chart_{chart_type}', get_chart_data, (chart_type,)) for chart_type in CHART_TYPES]
+    + [('correlations', compute_correlations, ()), ('trends', compute_trends, ()),
+       ('descriptive', compute_descriptive_stats, ()), ('anomalies', compute_anomalies, ()),
+       ('accuracy', compute_projection_accuracy, ())]
+)
+
+def _update_warmup(job, **fields):
+    with ingestion_jobs_lock:
+        job['warmup'].update(fields)
+    _save_job_snapshot(job)
+
+def _run_cache_warmup(job, version_id):
+    """Precalcula gráficos, resumen y estadísticas de la versión cargada; se cancela si otra carga la reemplaza"""
+    def read_frames(entry):
+        if entry is None or entry.get('version_id') != version_id:
+            return None
+        return dict(entry['frames'])
+    _update_warmup(job, status='running')
+    started = time.time()
+    for done, (name, func, args) in enumerate(WARMUP_STEPS):
+        frames = _read_dataset(job['dataset_id'], read_frames)
+        if frames is None:
+            _update_warmup(job, status='cancelled', current=None)
+            print(f"⏹️ Precálculo del trabajo {job['id']} cancelado: el dataset fue reemplazado")
+            return
+        _update_warmup(job, current=name)
+        try:
+            func(*args, processed_data=frames['processed_data'], data_hash=version_id)
+        except Exception as e:
+            print(f"⚠️ Error precalculando {name}: {e}")
+        _update_warmup(job, completed=done + 1, percent=int((done + 1) * 100 / len(WARMUP_STEPS)))
+    _update_warmup(job, status='done', current=None)
+    print(f"🔥 Caché precalculada para el trabajo {job['id']} en {time.time() - started:.2f}s")
+
 # Rutas de optimización y caché
 @app.route('/api/cache/clear', methods=['POST'])
 def clear_cache_endpoint():
     """Limpiar caché manualmente"""
     try:
-        clear_cache()
+        if not clear_cache():
+            return jsonify({'success': True, 'message': 'Caché en memoria limpiado; las estadísticas persistentes no se pudieron borrar (base de datos ocupada)'})
         return jsonify({'success': True, 'message': 'Caché limpiado exitosamente'})
     except Exception as e:
         return jsonify({'error': f'Error al limpiar caché: {str(e)}'}), 500
@@ -2071,19 +5155,12 @@ def get_cache_stats():
     """Obtener estadísticas del caché"""
     try:
         stats = {
-            'total_entries': len(cache),
-            'cache_ttl': cache_ttl,
-            'entries': []
+            **cache.stats(),
+            'parsed_datasets': get_parsed_cache_info(),
+            'upload_sessions': get_upload_session_info(),
+            'datasets': get_dataset_registry_info(),
+            'persistent': stats_store.stats() if stats_store is not None else None
         }
-        
-        for key, entry in cache.items():
-            age = time.time() - entry['timestamp']
-            stats['entries'].append({
-                'key': key,
-                'age_seconds': round(age, 2),
-                'is_valid': age < cache_ttl
-            })
-        
         return jsonify(stats)
     except Exception as e:
         return jsonify({'error': f'Error al obtener estadísticas de caché: {str(e)}'}), 500
@@ -2208,7 +5285,8 @@ def toggle_alert(alert_id):
 @app.route('/api/alerts/check', methods=['POST'])
 def check_alerts():
     """Verificar alertas activas"""
-    global processed_data
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
     try:
         if processed_data is None or processed_data.empty:
             return jsonify({'alerts': []})
@@ -2221,6 +5299,7 @@ def check_alerts():
         conn.close()
         
         triggered_alerts = []
+        profile = None  # Perfil de columnas, solo si hay alertas de anomalía
         
         for alert in alerts:
             alert_id, alert_type, variable, threshold_value, threshold_condition, frequency, email, enabled, created_at = alert
@@ -2245,14 +5324,13 @@ def check_alerts():
                     message = f"{variable} ({current_value:.2f}) es igual a {threshold_value}"
             
             elif alert_type == 'anomaly':
-                # Usar el mismo método de detección de anomalías
-                values = processed_data[variable].dropna()
-                if len(values) > 4:
-                    Q1 = values.quantile(0.25)
-                    Q3 = values.quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
+                # Usar el mismo método de detección de anomalías (límites IQR del perfil de columnas)
+                if profile is None:
+                    profile = profile_columns(processed_data=processed_data, data_hash=frames['version_id'])['columns']
+                column = profile.get(variable)
+                if column and column['count'] > 4:
+                    lower_bound = column['lower_bound']
+                    upper_bound = column['upper_bound']
                     
                     if current_value < lower_bound or current_value > upper_bound:
                         triggered = True
@@ -2276,7 +5354,7 @@ def check_alerts():
 @app.route('/api/reports/check-data', methods=['GET'])
 def check_data_for_reports():
     """Verificar si hay datos disponibles para generar reportes"""
-    global processed_data
+    processed_data = get_active_frames()['processed_data']
     
     try:
         if processed_data is None:
@@ -2319,7 +5397,7 @@ def check_data_for_reports():
 @app.route('/api/reports/generate', methods=['POST'])
 def generate_report():
     """Generar reporte automático"""
-    global processed_data
+    processed_data = get_active_frames()['processed_data']
     
     try:
         # Evaluar el archivo antes de generar el reporte
@@ -2457,9 +5535,9 @@ def delete_report(report_id):
         conn.close()
 
 
-def get_correlations_data():
+@cached_operation('report_correlations')
+def get_correlations_data(processed_data=None, data_hash=None):
     """Obtener correlaciones como datos (no JSON)"""
-    global processed_data
     
     try:
         if processed_data is None or processed_data.empty:
@@ -2490,9 +5568,9 @@ def get_correlations_data():
         print(f"Error en get_correlations_data: {e}")
         return {'error': f'Error al calcular correlaciones: {str(e)}'}
 
-def get_descriptive_stats_data():
+@cached_operation('report_descriptive')
+def get_descriptive_stats_data(processed_data=None, data_hash=None):
     """Obtener estadísticas descriptivas como datos (no JSON)"""
-    global processed_data
     
     try:
         if processed_data is None or processed_data.empty:
@@ -2500,30 +5578,29 @@ def get_descriptive_stats_data():
         
         stats = {}
         
-        # Calcular estadísticas para cada columna numérica
-        for col in processed_data.columns:
-            if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                values = processed_data[col].dropna()
-                if len(values) > 0:
-                    stats[col] = {
-                        'count': len(values),
-                        'mean': float(values.mean()),
-                        'std': float(values.std()),
-                        'min': float(values.min()),
-                        'max': float(values.max()),
-                        'median': float(values.median()),
-                        'q25': float(values.quantile(0.25)),
-                        'q75': float(values.quantile(0.75))
-                    }
+        # Tomar las estadísticas de cada columna numérica del perfil de columnas
+        profile = profile_columns(processed_data=processed_data, data_hash=data_hash)['columns']
+        for col, column in profile.items():
+            if col not in ['diferencia_ajustada', 'precision_proy'] and column['count'] > 0:
+                stats[col] = {
+                    'count': column['count'],
+                    'mean': column['mean'],
+                    'std': column['std'],
+                    'min': column['min'],
+                    'max': column['max'],
+                    'median': column['median'],
+                    'q25': column['q1'],
+                    'q75': column['q3']
+                }
         
         return {'statistics': stats}
     except Exception as e:
         print(f"Error en get_descriptive_stats_data: {e}")
         return {'error': f'Error al calcular estadísticas: {str(e)}'}
 
-def get_trends_data():
+@cached_operation('report_trends')
+def get_trends_data(processed_data=None, data_hash=None):
     """Obtener análisis de tendencias como datos (no JSON)"""
-    global processed_data
     
     try:
         if processed_data is None or processed_data.empty:
@@ -2531,31 +5608,24 @@ def get_trends_data():
         
         trends = {}
         
-        # Analizar tendencias para cada columna numérica
-        for col in processed_data.columns:
-            if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                values = processed_data[col].dropna()
-                if len(values) > 2:
-                    # Calcular pendiente de la línea de tendencia
-                    x = np.arange(len(values))
-                    slope, intercept, r_value, p_value, std_err = stats.linregress(x, values)
-                    
-                    trends[col] = {
-                        'slope': float(slope),
-                        'r_squared': float(r_value ** 2),
-                        'p_value': float(p_value),
-                        'trend': 'creciente' if slope > 0 else 'decreciente' if slope < 0 else 'estable',
-                        'strength': 'fuerte' if abs(r_value) > 0.7 else 'moderada' if abs(r_value) > 0.3 else 'débil'
-                    }
+        # Tendencias de todas las columnas numéricas con el motor de tendencias
+        for col, trend in fit_trends(processed_data).items():
+            trends[col] = {
+                'slope': trend['slope'],
+                'r_squared': trend['r_squared'],
+                'std_error': trend['std_error'],
+                'trend': trend['trend_type'].lower(),
+                'strength': 'fuerte' if trend['r_squared'] > 0.49 else 'moderada' if trend['r_squared'] > 0.09 else 'débil'
+            }
         
         return {'trends': trends}
     except Exception as e:
         print(f"Error en get_trends_data: {e}")
         return {'error': f'Error al analizar tendencias: {str(e)}'}
 
-def get_anomalies_data():
+@cached_operation('report_anomalies')
+def get_anomalies_data(processed_data=None, data_hash=None):
     """Obtener anomalías como datos (no JSON)"""
-    global processed_data
     
     try:
         if processed_data is None or processed_data.empty:
@@ -2563,50 +5633,36 @@ def get_anomalies_data():
         
         anomalies = {}
         
-        # Detectar anomalías usando método IQR para cada columna
-        for col in processed_data.columns:
-            if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                values = processed_data[col].dropna()
-                if len(values) > 4:  # Necesitamos al menos 5 valores para calcular IQR
-                    Q1 = values.quantile(0.25)
-                    Q3 = values.quantile(0.75)
-                    IQR = Q3 - Q1
-                    
-                    # Definir límites para anomalías
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    
-                    # Encontrar anomalías
-                    anomaly_indices = values[(values < lower_bound) | (values > upper_bound)].index
-                    anomaly_values = values[anomaly_indices]
+        # Detectar anomalías con los límites IQR del perfil de columnas
+        profile = profile_columns(processed_data=processed_data, data_hash=data_hash)['columns']
+        for col, column in profile.items():
+            if col not in ['diferencia_ajustada', 'precision_proy'] and column['count'] > 4:  # Necesitamos al menos 5 valores para calcular IQR
+                lower_bound = column['lower_bound']
+                upper_bound = column['upper_bound']
+                
+                # Encontrar anomalías (los NaN no cumplen ninguna de las dos condiciones)
+                values = processed_data[col]
+                anomaly_values = values[(values < lower_bound) | (values > upper_bound)]
+                
+                if len(anomaly_values) > 0:
+                    # Convertir índices a string para evitar problemas con Timestamps
+                    anomaly_data = []
+                    for idx, val in anomaly_values.items():
+                        anomaly_data.append({
+                            'index': str(idx),
+                            'value': float(val),
+                            'date': idx.strftime('%Y-%m-%d') if hasattr(idx, 'strftime') else str(idx)
+                        })
                     
-                    if len(anomaly_values) > 0:
-                        # Convertir índices a string para evitar problemas con Timestamps
-                        anomaly_data = []
-                        for idx, val in anomaly_values.items():
-                            try:
-                                if hasattr(processed_data.index[idx], 'strftime'):
-                                    date_str = processed_data.index[idx].strftime('%Y-%m-%d')
-                                else:
-                                    date_str = str(processed_data.index[idx])
-                                anomaly_data.append({
-                                    'index': str(idx),
-                                    'value': float(val),
-                                    'date': date_str
-                                })
-                            except Exception as e:
-                                print(f"Error procesando anomalía en índice {idx}: {e}")
-                                continue
-                        
-                        anomalies[col] = {
-                            'count': len(anomaly_values),
-                            'percentage': (len(anomaly_values) / len(values)) * 100,
-                            'values': anomaly_data,
-                            'bounds': {
-                                'lower': float(lower_bound),
-                                'upper': float(upper_bound)
-                            }
+                    anomalies[col] = {
+                        'count': len(anomaly_values),
+                        'percentage': (len(anomaly_values) / column['count']) * 100,
+                        'values': anomaly_data,
+                        'bounds': {
+                            'lower': float(lower_bound),
+                            'upper': float(upper_bound)
                         }
+                    }
         
         return {'anomalies': anomalies}
     except Exception as e:
@@ -2615,7 +5671,7 @@ def get_anomalies_data():
 
 def generate_simple_report(config):
     """Generar reporte de forma simplificada y robusta"""
-    global processed_data
+    processed_data = get_active_frames()['processed_data']
     
     print("=== INICIANDO GENERACIÓN SIMPLE DE REPORTE ===")
     
@@ -2720,7 +5776,8 @@ def generate_simple_report(config):
 
 def generate_report_content(config):
     """Generar contenido del reporte basado en la configuración"""
-    global processed_data
+    frames = get_active_frames()
+    processed_data = frames['processed_data']
     
     print(f"Iniciando generación de reporte con config: {config}")
     
@@ -2749,17 +5806,16 @@ def generate_report_content(config):
         try:
             print("Generando estadísticas...")
             stats = {}
-            for col in processed_data.columns:
-                if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                    values = processed_data[col].dropna()
-                    if len(values) > 0:
-                        stats[col] = {
-                            'count': len(values),
-                            'mean': float(values.mean()),
-                            'std': float(values.std()),
-                            'min': float(values.min()),
-                            'max': float(values.max())
-                        }
+            profile = profile_columns(processed_data=processed_data, data_hash=frames['version_id'])['columns']
+            for col, column in profile.items():
+                if col not in ['diferencia_ajustada', 'precision_proy'] and column['count'] > 0:
+                    stats[col] = {
+                        'count': column['count'],
+                        'mean': column['mean'],
+                        'std': column['std'],
+                        'min': column['min'],
+                        'max': column['max']
+                    }
             
             stats_data = {'statistics': stats}
             print(f"Estadísticas generadas: {type(stats_data)}")
@@ -2775,17 +5831,12 @@ def generate_report_content(config):
         try:
             print("Generando tendencias...")
             trends = {}
-            for col in processed_data.columns:
-                if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                    values = processed_data[col].dropna()
-                    if len(values) > 2:
-                        x = np.arange(len(values))
-                        slope, intercept, r_value, p_value, std_err = stats.linregress(x, values)
-                        trends[col] = {
-                            'slope': float(slope),
-                            'r_squared': float(r_value ** 2),
-                            'trend': 'creciente' if slope > 0 else 'decreciente' if slope < 0 else 'estable'
-                        }
+            for col, trend in compute_trends(processed_data=processed_data, data_hash=frames['version_id'])['trends'].items():
+                trends[col] = {
+                    'slope': trend['slope'],
+                    'r_squared': trend['r_squared'],
+                    'trend': trend['trend_type'].lower()
+                }
             
             trends_data = {'trends': trends}
             print(f"Tendencias generadas: {type(trends_data)}")
@@ -2801,21 +5852,16 @@ def generate_report_content(config):
         try:
             print("Generando anomalías...")
             anomalies = {}
-            for col in processed_data.columns:
-                if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
-                    values = processed_data[col].dropna()
-                    if len(values) > 4:
-                        Q1 = values.quantile(0.25)
-                        Q3 = values.quantile(0.75)
-                        IQR = Q3 - Q1
-                        lower_bound = Q1 - 1.5 * IQR
-                        upper_bound = Q3 + 1.5 * IQR
-                        anomaly_count = len(values[(values < lower_bound) | (values > upper_bound)])
-                        if anomaly_count > 0:
-                            anomalies[col] = {
-                                'count': anomaly_count,
-                                'percentage': (anomaly_count / len(values)) * 100
-                            }
+            profile = profile_columns(processed_data=processed_data, data_hash=frames['version_id'])['columns']
+            for col, column in profile.items():
+                if col not in ['diferencia_ajustada', 'precision_proy'] and column['count'] > 4:
+                    values = processed_data[col]
+                    anomaly_count = int(((values < column['lower_bound']) | (values > column['upper_bound'])).sum())
+                    if anomaly_count > 0:
+                        anomalies[col] = {
+                            'count': anomaly_count,
+                            'percentage': (anomaly_count / column['count']) * 100
+                        }
             
             anomalies_data = {'anomalies': anomalies}
             print(f"Anomalías generadas: {type(anomalies_data)}")
@@ -2894,7 +5940,7 @@ def generate_recommendations():
 @app.route('/export/chart/<format>')
 def export_chart(format):
     """Exportar el gráfico actual en el formato especificado"""
-    global processed_data
+    processed_data = get_active_frames()['processed_data']
     try:
         if processed_data is not None and not processed_data.empty:
             chart_type = request.args.get('type', 'line')
@@ -2962,6 +6008,27 @@ def export_chart(format):
                 ax.set_ylabel('Diferencia (Toneladas)', fontsize=12)
                 ax.legend()
                 ax.grid(True, alpha=0.3)
+                
+            elif chart_type == 'forecast':
+                # Gráfico de pronóstico: historia, pronóstico punteado y banda del intervalo
+                labels = chart_data['data']['labels']
+                positions = np.arange(len(labels))
+                datasets = chart_data['data']['datasets']
+                for i in range(0, len(datasets), 4):
+                    history, forecast, lower, upper = datasets[i:i + 4]  # Cuatro series por variable
+                    line, = ax.plot(positions, np.array(history['data'], dtype=float), label=history['label'], linewidth=2)
+                    ax.plot(positions, np.array(forecast['data'], dtype=float), label=forecast['label'],
+                            linewidth=2, linestyle='--', color=line.get_color())
+                    ax.fill_between(positions, np.array(lower['data'], dtype=float), np.array(upper['data'], dtype=float),
+                                    color=line.get_color(), alpha=0.15)
+                step = max(1, len(labels) // 12)
+                ax.set_xticks(positions[::step])
+                ax.set_xticklabels(labels[::step], rotation=45, ha='right')
+                ax.set_title(chart_data['options']['plugins']['title']['text'], fontsize=16, fontweight='bold')
+                ax.set_xlabel('Fecha', fontsize=12)
+                ax.set_ylabel('Toneladas', fontsize=12)
+                ax.legend()
+                ax.grid(True, alpha=0.3)
             
             plt.tight_layout()
             
@@ -2996,7 +6063,7 @@ def export_chart(format):
 @app.route('/export/data')
 def export_data():
     """Exportar datos procesados como CSV"""
-    global processed_data
+    processed_data = get_active_frames()['processed_data']
     try:
         if processed_data is not None and not processed_data.empty:
             # Crear un DataFrame con los datos procesados
@@ -3023,7 +6090,7 @@ def export_data():
 @app.route('/export/report')
 def export_report():
     """Generar y exportar reporte completo en HTML"""
-    global processed_data
+    processed_data = get_active_frames()['processed_data']
     try:
         if processed_data is not None and not processed_data.empty:
             # Crear reporte HTML
@@ -3114,37 +6181,35 @@ def validate_csv_endpoint():
         if not file.filename.lower().endswith('.csv'):
             return jsonify({'success': False, 'message': 'Solo se admiten archivos CSV'})
         
-        # Guardar archivo temporalmente
+        # Guardar archivo temporalmente; queda asociado a la sesión de carga
         filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{filename}")
-        file.save(temp_path)
+        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{uuid.uuid4().hex[:8]}_{filename}")
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        content_hash = save_upload_hashed(file, temp_path)
         
         try:
-            # Intentar leer el CSV
-            df = None
-            encodings = ['utf-8', 'latin1', 'cp1252', 'iso-8859-1']
-            separators = [';', ',', '\t']
-            
-            for encoding in encodings:
-                for sep in separators:
-                    try:
-                        df = pd.read_csv(temp_path, sep=sep, encoding=encoding)
-                        if len(df.columns) > 1:
-                            break
-                    except:
-                        continue
-                if df is not None and len(df.columns) > 1:
-                    break
+            # Leer el CSV con el dialecto detectado (un solo parseo)
+            try:
+                df, dialect = read_csv_sniffed(temp_path)
+            except Exception:
+                df = None
             
             if df is None:
+                os.remove(temp_path)
                 return jsonify({
                     'success': False,
                     'message': 'Documento dañado - No se pudo leer el archivo',
                     'can_repair': False
                 })
             
-            # Validar estructura
-            errors, warnings = validate_csv_structure(df, temp_path)
+            # Inferir tipos una vez y validar estructura
+            df, schema = coerce_columns(df)
+            errors, warnings = validate_csv_structure(df, temp_path, schema)
+            
+            # Reparación y procesamiento final reutilizan este parseo con el id de sesión
+            session_id = create_upload_session(df, schema, temp_path, filename, content_hash)
+            if session_id is None:
+                os.remove(temp_path)
             
             # Si hay errores o muchas advertencias, intentar reparar
             empty_columns = [col for col in df.columns if df[col].isnull().all()]
@@ -3159,12 +6224,13 @@ def validate_csv_endpoint():
                     'warnings': warnings,
                     'columns': list(df.columns),
                     'rows': len(df),
-                    'empty_columns': empty_columns
+                    'empty_columns': empty_columns,
+                    'session_id': session_id
                 })
             
             # Si solo hay advertencias, aplicar reparaciones menores
             if warnings:
-                repaired_df, repairs_made = repair_csv_data(df, [], warnings)
+                repaired_df, repairs_made = repair_csv_data(df, [], warnings, schema)
                 return jsonify({
                     'success': True,
                     'message': 'Archivo procesado con reparaciones menores',
@@ -3174,7 +6240,8 @@ def validate_csv_endpoint():
                     'repairs_made': repairs_made,
                     'columns': list(repaired_df.columns),
                     'rows': len(repaired_df),
-                    'preview': repaired_df.head(5).to_dict('records') if len(repaired_df) > 0 else []
+                    'preview': repaired_df.head(5).to_dict('records') if len(repaired_df) > 0 else [],
+                    'session_id': session_id
                 })
             
             # Archivo válido sin problemas
@@ -3187,7 +6254,8 @@ def validate_csv_endpoint():
                 'repairs_made': [],
                 'columns': list(df.columns),
                 'rows': len(df),
-                'preview': df.head(5).to_dict('records') if len(df) > 0 else []
+                'preview': df.head(5).to_dict('records') if len(df) > 0 else [],
+                'session_id': session_id
             })
             
         except Exception as e:
@@ -3211,92 +6279,93 @@ def validate_csv_endpoint():
 def repair_csv_endpoint():
     """Endpoint para reparar un CSV dañado"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
-        
-        if not file.filename.lower().endswith('.csv'):
-            return jsonify({'success': False, 'message': 'Solo se admiten archivos CSV'})
-        
-        # Guardar archivo temporalmente
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{filename}")
-        file.save(temp_path)
-        
-        try:
-            # Intentar leer el CSV
-            df = None
-            encodings = ['utf-8', 'latin1', 'cp1252', 'iso-8859-1']
-            separators = [';', ',', '\t']
+        # Con un id de sesión se reutiliza el DataFrame parseado en /api/csv-validation
+        session_id = request.form.get('session_id')
+        upload_session = get_upload_session(session_id) if session_id else None
+        if session_id and upload_session is None:
+            return session_expired_response()
+        
+        if upload_session is None:
+            if 'file' not in request.files:
+                return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
             
-            for encoding in encodings:
-                for sep in separators:
-                    try:
-                        df = pd.read_csv(temp_path, sep=sep, encoding=encoding)
-                        if len(df.columns) > 1:
-                            break
-                    except:
-                        continue
-                if df is not None and len(df.columns) > 1:
-                    break
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
             
-            if df is None:
-                return jsonify({
-                    'success': False,
-                    'message': 'No se pudo leer el archivo CSV con ningún separador o encoding'
-                })
+            if not file.filename.lower().endswith('.csv'):
+                return jsonify({'success': False, 'message': 'Solo se admiten archivos CSV'})
+            
+            # Guardar archivo temporalmente
+            filename = secure_filename(file.filename)
+            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{filename}")
+            file.save(temp_path)
+        else:
+            temp_path = upload_session['file_path']
+        
+        try:
+            if upload_session:
+                df, schema = get_session_frame(upload_session)
+            else:
+                # Leer el CSV con el dialecto detectado (un solo parseo)
+                try:
+                    df, dialect = read_csv_sniffed(temp_path)
+                except Exception:
+                    df = None
+                
+                if df is None:
+                    return jsonify({
+                        'success': False,
+                        'message': 'No se pudo leer el archivo CSV con ningún separador o encoding'
+                    })
+                
+                # Inferir tipos una vez
+                df, schema = coerce_columns(df)
             
             # Validar estructura
-            errors, warnings = validate_csv_structure(df, temp_path)
+            errors, warnings = validate_csv_structure(df, temp_path, schema)
             
             # Detectar columnas vacías
             empty_columns = [col for col in df.columns if df[col].isnull().all()]
             
-            # Intentar reparar con csvkit primero, luego pandas
+            # Limpieza estructural y reparación en proceso sobre el DataFrame ya leído
             repairs_made = []
             if errors or len(empty_columns) > 0:
-                # Primero intentar con csvkit
-                repaired_df_csvkit, csvkit_repairs = repair_csv_with_csvkit(temp_path)
+                df, clean_repairs = clean_csv_frame(df)
+                repairs_made.extend(clean_repairs)
                 
-                if repaired_df_csvkit is not None:
-                    # csvkit funcionó
-                    df = repaired_df_csvkit
-                    repairs_made.extend(csvkit_repairs)
-                    print("✅ Reparación con csvkit exitosa")
+                repaired_df, pandas_repairs = repair_csv_data(df, errors, warnings, schema)
+                repairs_made.extend(pandas_repairs)
+                
+                # Eliminar columnas vacías manualmente
+                if empty_columns:
+                    # Verificar que las columnas existen antes de eliminarlas
+                    existing_empty_columns = [col for col in empty_columns if col in repaired_df.columns]
+                    if existing_empty_columns:
+                        repaired_df = repaired_df.drop(columns=existing_empty_columns)
+                        repairs_made.append(f"Eliminadas {len(existing_empty_columns)} columnas vacías: {existing_empty_columns}")
+                
+                new_errors, new_warnings = validate_csv_structure(repaired_df, temp_path)
+                
+                if new_errors:
+                    return jsonify({
+                        'success': False,
+                        'message': 'No se pudo reparar el archivo automáticamente',
+                        'errors': new_errors,
+                        'warnings': new_warnings,
+                        'repairs_attempted': repairs_made
+                    })
                 else:
-                    # Fallback a pandas
-                    print("⚠️ csvkit falló, usando pandas")
-                    repaired_df, pandas_repairs = repair_csv_data(df, errors, warnings)
-                    repairs_made.extend(pandas_repairs)
-                    
-                    # Eliminar columnas vacías manualmente
-                    if empty_columns:
-                        # Verificar que las columnas existen antes de eliminarlas
-                        existing_empty_columns = [col for col in empty_columns if col in repaired_df.columns]
-                        if existing_empty_columns:
-                            repaired_df = repaired_df.drop(columns=existing_empty_columns)
-                            repairs_made.append(f"Eliminadas {len(existing_empty_columns)} columnas vacías: {existing_empty_columns}")
-                    
-                    new_errors, new_warnings = validate_csv_structure(repaired_df, temp_path)
-                    
-                    if new_errors:
-                        return jsonify({
-                            'success': False,
-                            'message': 'No se pudo reparar el archivo automáticamente',
-                            'errors': new_errors,
-                            'warnings': new_warnings,
-                            'repairs_attempted': repairs_made
-                        })
-                    else:
-                        df = repaired_df
-                        errors = new_errors
-                        warnings = new_warnings
+                    df = repaired_df
+                    errors = new_errors
+                    warnings = new_warnings
             
-            # Limpiar archivo temporal
-            os.remove(temp_path)
+            if upload_session:
+                # El resultado queda en la sesión para el procesamiento final
+                set_session_frame(session_id, 'repaired', *coerce_columns(df.copy()))
+            else:
+                # Limpiar archivo temporal
+                os.remove(temp_path)
             
             return jsonify({
                 'success': True,
@@ -3306,12 +6375,13 @@ def repair_csv_endpoint():
                 'repairs_made': repairs_made,
                 'columns': list(df.columns),
                 'rows': len(df),
-                'preview': df.head(5).to_dict('records') if len(df) > 0 else []
+                'preview': df.head(5).to_dict('records') if len(df) > 0 else [],
+                'session_id': session_id if upload_session else None
             })
             
         except Exception as e:
             # Limpiar archivo temporal en caso de error
-            if os.path.exists(temp_path):
+            if upload_session is None and os.path.exists(temp_path):
                 os.remove(temp_path)
             return jsonify({
                 'success': False,
@@ -3326,7 +6396,7 @@ def repair_csv_endpoint():
 
 @app.route('/api/csv-diagnose', methods=['POST'])
 def diagnose_csv_endpoint():
-    """Endpoint para diagnosticar un CSV usando csvkit"""
+    """Endpoint para diagnosticar un CSV (dialecto, filas y estadísticas por columna)"""
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
@@ -3344,8 +6414,8 @@ def diagnose_csv_endpoint():
         file.save(temp_path)
         
         try:
-            # Diagnosticar con csvkit
-            diagnosis = diagnose_csv_with_csvkit(temp_path)
+            # Diagnosticar en proceso con una sola lectura
+            diagnosis = diagnose_csv(temp_path)
             
             # Limpiar archivo temporal
             os.remove(temp_path)
@@ -3465,20 +6535,14 @@ def test_endpoint():
     })
 
 def read_csv_intelligently(filepath):
-    """Lee un archivo CSV de manera automática, probando diferentes separadores y encodings"""
-    encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-    separators = [';', ',', '\t', '|']
-    
-    for encoding in encodings:
-        for sep in separators:
-            try:
-                df = pd.read_csv(filepath, sep=sep, encoding=encoding, low_memory=False)
-                # Verificar que el DataFrame tiene sentido (más de 1 columna y filas)
-                if len(df.columns) > 1 and len(df) > 0:
-                    print(f"✅ Archivo leído exitosamente con encoding={encoding}, separador='{sep}'")
-                    return df
-            except Exception as e:
-                continue
+    """Lee un archivo CSV de manera automática, detectando separador y encoding con una muestra"""
+    try:
+        df, dialect = read_csv_sniffed(filepath, low_memory=False)
+        if len(df.columns) > 1 and len(df) > 0:
+            print(f"✅ Archivo leído exitosamente con encoding={dialect['encoding']}, separador='{dialect['sep']}'")
+            return df
+    except Exception as e:
+        print(f"⚠️ Lectura con dialecto detectado falló: {e}")
     
     # Si todo falla, intentar con pandas auto-detección
     try:
@@ -3767,24 +6831,38 @@ def validate_repaired_data(df_original, df_repaired):
 def intelligent_repair():
     """Reparación automática avanzada con IA para análisis y decisiones"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No se proporcionó archivo'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No se seleccionó archivo'}), 400
-        
-        # Crear directorio uploads si no existe
-        os.makedirs('uploads', exist_ok=True)
-        
-        # Guardar archivo temporalmente
-        filename = secure_filename(file.filename)
-        filepath = os.path.join('uploads', filename)
-        file.save(filepath)
+        # Con un id de sesión se reutiliza el DataFrame parseado en /api/csv-validation
+        session_id = request.form.get('session_id')
+        upload_session = get_upload_session(session_id) if session_id else None
+        if session_id and upload_session is None:
+            return session_expired_response()
+        
+        if upload_session is None:
+            if 'file' not in request.files:
+                return jsonify({'error': 'No se proporcionó archivo'}), 400
+            
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'error': 'No se seleccionó archivo'}), 400
+            
+            # Crear directorio uploads si no existe
+            os.makedirs('uploads', exist_ok=True)
+            
+            # Guardar archivo temporalmente
+            filename = secure_filename(file.filename)
+            filepath = os.path.join('uploads', filename)
+            file.save(filepath)
+        else:
+            filepath = upload_session['file_path']
         
         try:
             # ===== PASO 1: LECTURA INTELIGENTE DEL ARCHIVO =====
-            df_original = read_csv_intelligently(filepath)
+            if upload_session:
+                # Siempre desde el parseo original, para que llamadas repetidas den el mismo resultado
+                df_original, schema = get_session_frame(upload_session)
+                df_original = df_original.astype({col: object for col in df_original.select_dtypes('category').columns})
+            else:
+                df_original = read_csv_intelligently(filepath)
             original_rows = len(df_original)
             original_cols = len(df_original.columns)
             
@@ -3822,9 +6900,13 @@ def intelligent_repair():
                     'columns_preserved': len(df_repaired.columns) >= original_cols * 0.8,  # Al menos 80% de columnas
                     'quality_score': validation_result['quality_score']
                 },
-                'repaired_file': filepath  # Mantener el mismo archivo, no crear copia
+                'repaired_file': filepath,  # Mantener el mismo archivo, no crear copia
+                'session_id': session_id if upload_session else None
             }
             
+            if upload_session:
+                set_session_frame(session_id, 'repaired', *coerce_columns(df_repaired.copy()))
+            
             return jsonify(repair_result)
                 
         except Exception as e:
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de lectura de CSV: búsqueda exhaustiva de encoding/separador vs detección por muestra
+
+Compara el número de parseos completos (llamadas a pd.read_csv) y el tiempo de pared
+de la lectura anterior (hasta 4 encodings × 3 separadores) contra sniff_csv_dialect +
+read_csv_sniffed sobre los archivos de uploads/ y variantes generadas (coma, tabulador,
+cp1252, decimal con coma).
+
+Uso:
+    python benchmarks/bench_csv_sniffer.py              # Archivos tal cual
+    python benchmarks/bench_csv_sniffer.py --scale 500  # Replicar filas para simular exportaciones grandes
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import pandas as pd  # noqa: E402
+import app  # noqa: E402
+
+_original_read_csv = pd.read_csv
+parse_count = 0
+
+def counting_read_csv(*args, **kwargs):
+    """Envoltorio de pd.read_csv que cuenta parseos completos"""
+    global parse_count
+    parse_count += 1
+    return _original_read_csv(*args, **kwargs)
+
+def legacy_read(file_path):
+    """Lectura anterior de process_csv_file: prueba combinaciones hasta encontrar más de una columna"""
+    df = None
+    for encoding in ['utf-8', 'latin1', 'cp1252', 'iso-8859-1']:
+        for sep in [';', ',', '\t']:
+            try:
+                df = pd.read_csv(file_path, sep=sep, encoding=encoding, thousands=',', decimal='.')
+                if len(df.columns) > 1:
+                    break
+            except Exception:
+                continue
+        if df is not None and len(df.columns) > 1:
+            break
+    return df
+
+def sniffed_read(file_path):
+    """Lectura nueva: una muestra y un parseo"""
+    df, _ = app.read_csv_sniffed(file_path)
+    return df
+
+def build_variants(workdir, scale):
+    """Genera variantes de dialecto a partir de los archivos de uploads/"""
+    variants = {}
+    for source in sorted((ROOT / 'uploads').glob('*.csv')):
+        df, _ = app.read_csv_sniffed(str(source))
+        if scale > 1:
+            df = pd.concat([df] * scale, ignore_index=True)
+        stem = source.stem
+        outputs = {
+            f'{stem}.csv': dict(sep=';', encoding='utf-8'),
+            f'{stem}_coma.csv': dict(sep=',', encoding='utf-8'),
+            f'{stem}_tab.csv': dict(sep='\t', encoding='utf-8'),
+            f'{stem}_cp1252.csv': dict(sep=',', encoding='cp1252'),
+            f'{stem}_decimal_coma.csv': dict(sep=';', encoding='utf-8', decimal=','),
+        }
+        for name, options in outputs.items():
+            data = df
+            if options['encoding'] == 'cp1252' and 'DESCRIPCION' in data.columns:
+                data = data.assign(DESCRIPCION=data['DESCRIPCION'].astype(str) + ' Cosecha año')
+            path = os.path.join(workdir, name)
+            data.to_csv(path, index=False, **options)
+            variants[name] = path
+    return variants
+
+def measure(reader, path, repeat):
+    """Devuelve (parseos por lectura, segundos por lectura, forma)"""
+    global parse_count
+    parse_count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        df = reader(path)
+    elapsed = (time.perf_counter() - start) / repeat
+    return parse_count / repeat, elapsed, df.shape if df is not None else None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de detección de dialecto CSV')
+    parser.add_argument('--scale', type=int, default=1, help='Factor de replicación de filas')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por archivo')
+    args = parser.parse_args()
+
+    pd.read_csv = counting_read_csv
+    app.pd.read_csv = counting_read_csv
+
+    with tempfile.TemporaryDirectory() as workdir:
+        variants = build_variants(workdir, args.scale)
+        print(f"{'archivo':<45} {'parseos ant.':>12} {'parseos nuevo':>13} {'ms ant.':>9} {'ms nuevo':>9} {'forma':>12}")
+        for name, path in variants.items():
+            legacy_parses, legacy_time, legacy_shape = measure(legacy_read, path, args.repeat)
+            new_parses, new_time, new_shape = measure(sniffed_read, path, args.repeat)
+            flag = '' if legacy_shape == new_shape else f'  (anterior: {legacy_shape})'
+            print(f"{name:<45} {legacy_parses:>12.0f} {new_parses:>13.0f} "
+                  f"{legacy_time * 1000:>9.1f} {new_time * 1000:>9.1f} {str(new_shape):>12}{flag}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark del motor de pronóstico
+
+Compara el ajuste de Holt-Winters columna por columna contra fit_forecast_batch, que ajusta todas
+las columnas del pivot y toda la rejilla de parámetros en un solo recorrido, y mide el backtest
+(que se ejecuta en serie).
+
+Uso:
+    python benchmarks/bench_forecast_engine.py
+    python benchmarks/bench_forecast_engine.py --columns 10 100 1000 5000 --folds 3 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import numpy as np  # noqa: E402
+import app  # noqa: E402
+
+def build_matrix(rows, columns, seed=42):
+    """Meses x tipos de movimiento con tendencia, estacionalidad y ruido"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(rows)[:, np.newaxis]
+    level = rng.uniform(1_000, 50_000, columns)
+    season = rng.uniform(0, 0.3, columns) * level * np.sin(2 * np.pi * t / 12)
+    return np.maximum(level + rng.normal(0, 50, columns) * t + season + rng.normal(0, 500, (rows, columns)), 0)
+
+def per_column(values):
+    """Un ajuste por columna, como lo haría un bucle sobre el pivot"""
+    return [app.fit_forecast_batch(values[:, i:i + 1], 'holt_winters') for i in range(values.shape[1])]
+
+def timed(function, repeat):
+    """Mejor tiempo de varias repeticiones"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del motor de pronóstico')
+    parser.add_argument('--columns', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--rows', type=int, default=108, help='Meses de historia (108 = 9 años)')
+    parser.add_argument('--horizon', type=int, default=12)
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'columnas':>9} {'por columna (ms)':>17} {'en lote (ms)':>13} {'aceleración':>12} {'backtest (ms)':>14}")
+    for columns in args.columns:
+        values = build_matrix(args.rows, columns)
+        loop_time, _ = timed(lambda: per_column(values), 1)
+        batch_time, _ = timed(lambda: app.fit_forecast_batch(values, 'holt_winters'), args.repeat)
+        backtest_time, _ = timed(lambda: app.backtest_forecast_batch(values, 'holt_winters', args.horizon, args.folds), args.repeat)
+        print(f"{columns:>9} {loop_time * 1000:>17.1f} {batch_time * 1000:>13.1f} {loop_time / batch_time:>11.1f}x "
+              f"{backtest_time * 1000:>14.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark de normalización de tipos de movimiento
+
+Compara la ruta anterior de process_asapalsa_format (str.extract + .apply de la cadena
+if/elif por fila) contra normalize_movement_types, que aplica las reglas compiladas solo
+sobre los valores distintos de DESCRIPCION y devuelve el resultado con un take vectorizado.
+
+Uso:
+    python benchmarks/bench_movement_normalization.py
+    python benchmarks/bench_movement_normalization.py --sizes 10000 100000 1000000 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import app  # noqa: E402
+
+def legacy_normalize_movement_name(name):
+    """Cadena if/elif anterior, aplicada fila por fila"""
+    if pd.isna(name) or name == '':
+        return name
+    name_lower = name.lower().strip()
+    if 'proyeccion compra de fruta ajustada' in name_lower:
+        return 'Proyeccion Compra de Fruta Ajustada'
+    elif 'fruta recibida' in name_lower or 'recibida' in name_lower:
+        return 'Fruta Recibida'
+    elif 'fruta proyectada' in name_lower or 'proyectada' in name_lower:
+        return 'Fruta Proyectada'
+    elif 'fruta procesada' in name_lower or 'procesada' in name_lower:
+        return 'Fruta Procesada'
+    elif 'fruta exportada' in name_lower or 'exportada' in name_lower:
+        return 'Fruta Exportada'
+    elif 'fruta importada' in name_lower or 'importada' in name_lower:
+        return 'Fruta Importada'
+    elif 'fruta vendida' in name_lower or 'vendida' in name_lower:
+        return 'Fruta Vendida'
+    elif 'fruta comprada' in name_lower or 'comprada' in name_lower:
+        return 'Fruta Comprada'
+    else:
+        return name.title()
+
+def legacy_path(descriptions):
+    """Extracción y normalización fila por fila"""
+    types = descriptions.str.extract(r'\d*\s*(.*)', expand=False).str.strip()
+    return types.apply(legacy_normalize_movement_name)
+
+def engine_path(descriptions):
+    """Normalización sobre categorías distintas"""
+    return app.normalize_movement_types(descriptions)[0]
+
+def build_descriptions(rows, seed=42):
+    """Descripciones con la variedad real de los archivos de uploads/"""
+    source = pd.read_csv(ROOT / 'uploads' / 'Produccion_Detallada.csv', sep=';')['DESCRIPCION']
+    extra = pd.Series(['Proyeccion Compra de Fruta Ajustada', '10 Fruta Exportada', 'Merma de Planta'])
+    pool = pd.concat([source, extra]).str.strip().unique()
+    rng = np.random.default_rng(seed)
+    return pd.Series(rng.choice(pool, size=rows))
+
+def timed(function, descriptions, repeat):
+    """Mejor tiempo de varias repeticiones"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(descriptions)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de normalización de tipos de movimiento')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'.apply (ms)':>12} {'motor (ms)':>11} {'aceleración':>12} {'iguales':>8}")
+    for rows in args.sizes:
+        descriptions = build_descriptions(rows)
+        legacy_time, legacy_result = timed(legacy_path, descriptions, args.repeat)
+        engine_time, engine_result = timed(engine_path, descriptions, args.repeat)
+        same = legacy_result.equals(engine_result)
+        print(f"{rows:>10} {legacy_time * 1000:>12.1f} {engine_time * 1000:>11.1f} "
+              f"{legacy_time / engine_time:>11.1f}x {str(same):>8}")
+
+if __name__ == '__main__':
+    main()
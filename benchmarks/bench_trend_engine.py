@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark del motor de tendencias
+
+Compara el bucle anterior de get_trends (sumas a mano por columna, en Python) contra
+fit_trends, que ajusta todas las columnas del pivot en una sola operación, a medida que
+crece el número de tipos de movimiento. También mide las variantes Theil-Sen y estacional.
+
+Uso:
+    python benchmarks/bench_trend_engine.py
+    python benchmarks/bench_trend_engine.py --columns 3 30 300 1000 --rows 240 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import app  # noqa: E402
+
+def legacy_trends(processed_data):
+    """Bucle anterior de get_trends: pendiente por columna con sumas a mano"""
+    trends = {}
+    for col in processed_data.columns:
+        if col not in ['diferencia_ajustada', 'precision_proy'] and processed_data[col].dtype in ['float64', 'int64']:
+            values = processed_data[col].dropna()
+            if len(values) > 1:
+                x = np.arange(len(values))
+                y = values.values
+                n = len(x)
+                sum_x = np.sum(x)
+                sum_y = np.sum(y)
+                sum_xy = np.sum(x * y)
+                sum_x2 = np.sum(x * x)
+                slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x)
+                first_value = values.iloc[0]
+                last_value = values.iloc[-1]
+                trends[col] = {
+                    'slope': float(slope),
+                    'change_pct': float((last_value - first_value) / first_value * 100) if first_value != 0 else 0,
+                    'first_value': float(first_value),
+                    'last_value': float(last_value)
+                }
+    return trends
+
+def build_pivot(rows, columns, seed=42):
+    """Pivot mensual con tendencia, estacionalidad y ruido por tipo de movimiento"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2000-01-01', periods=rows, freq='MS', name='Fecha')
+    t = np.arange(rows)[:, np.newaxis]
+    level = rng.uniform(1_000, 50_000, columns)
+    slope = rng.normal(0, 50, columns)
+    season = rng.uniform(0, 0.3, columns) * level * np.sin(2 * np.pi * (index.month.to_numpy()[:, np.newaxis] - 1) / 12)
+    values = level + slope * t + season + rng.normal(0, 500, (rows, columns))
+    return pd.DataFrame(values, index=index, columns=[f"Movimiento {i}" for i in range(columns)])
+
+def timed(function, repeat):
+    """Mejor tiempo de varias repeticiones"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del motor de tendencias')
+    parser.add_argument('--columns', type=int, nargs='+', default=[3, 10, 50, 100, 300, 1000])
+    parser.add_argument('--rows', type=int, default=108, help='Meses del pivot (108 = 9 años)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'columnas':>9} {'bucle (ms)':>11} {'ols (ms)':>9} {'aceleración':>12} "
+          f"{'theil-sen (ms)':>15} {'estacional (ms)':>16} {'iguales':>8}")
+    for columns in args.columns:
+        pivot = build_pivot(args.rows, columns)
+        legacy_time, legacy_result = timed(lambda: legacy_trends(pivot), args.repeat)
+        engine_time, engine_result = timed(lambda: app.fit_trends(pivot), args.repeat)
+        robust_time, _ = timed(lambda: app.fit_trends(pivot, 'theil_sen'), args.repeat)
+        seasonal_time, _ = timed(lambda: app.fit_trends(pivot, seasonal=True), args.repeat)
+        same = all(np.isclose(legacy_result[col]['slope'], engine_result[col]['slope']) for col in legacy_result)
+        print(f"{columns:>9} {legacy_time * 1000:>11.1f} {engine_time * 1000:>9.1f} "
+              f"{legacy_time / engine_time:>11.1f}x {robust_time * 1000:>15.1f} {seasonal_time * 1000:>16.1f} {str(same):>8}")
+
+if __name__ == '__main__':
+    main()
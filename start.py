@@ -7,7 +7,8 @@ Este script proporciona una única forma profesional de iniciar el proyecto,
 reemplazando todos los métodos de inicio anteriores.
 
 Uso:
-    python start.py                    # Modo producción
+    python start.py                    # Modo producción (gunicorn con hilos)
+    python start.py --workers 2        # Producción con varios procesos
     python start.py --dev              # Modo desarrollo con auto-reload
     python start.py --help             # Mostrar ayuda
 """
@@ -23,8 +24,11 @@ from pathlib import Path
 # Configuración del proyecto
 PROJECT_NAME = "ASAPALSA Analytics"
 VERSION = "2.0.0"
-DEFAULT_PORT = 5000
+DEFAULT_PORT = int(os.environ.get('PORT', 5000))
 DEFAULT_HOST = "0.0.0.0"
+DEFAULT_WORKERS = int(os.environ.get('WEB_WORKERS', 1))
+DEFAULT_THREADS = int(os.environ.get('WEB_THREADS', 8))
+DEFAULT_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 300))  # Segundos; las cargas grandes responden al terminar de recibir el archivo
 
 def print_banner():
     """Mostrar banner de inicio"""
@@ -89,7 +93,50 @@ def start_development_server(host, port):
         print(f"\n❌ Error al iniciar el servidor: {e}")
         print("💡 Verifica que el puerto no esté en uso y que todas las dependencias estén instaladas")
 
-def start_production_server(host, port):
+def gunicorn_available():
+    """gunicorn solo funciona en sistemas tipo Unix"""
+    if platform.system() == 'Windows':
+        return False
+    try:
+        import gunicorn  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def start_gunicorn_server(host, port, workers, threads, timeout):
+    """Servir la aplicación con gunicorn: procesos con hilos (gthread) y la app precargada"""
+    from gunicorn.app.base import BaseApplication
+    
+    class ASAPALSAServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return self.application
+    
+    # Precarga: la app se importa una vez en el proceso maestro y los workers la heredan
+    from app import app
+    options = {
+        'bind': f"{host}:{port}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': timeout,
+        'graceful_timeout': 30
+    }
+    print(f"🧵 gunicorn: {workers} proceso(s) x {threads} hilo(s)")
+    if workers > 1:
+        print("ℹ️ Los datasets se comparten entre procesos mediante DATASET_STORE_DIR; los filtros aplicados son de cada proceso")
+    ASAPALSAServer(app, options).run()
+
+def start_production_server(host, port, workers=DEFAULT_WORKERS, threads=DEFAULT_THREADS, timeout=DEFAULT_TIMEOUT):
     """Iniciar servidor en modo producción"""
     print("🚀 Iniciando servidor...")
     
@@ -99,9 +146,12 @@ def start_production_server(host, port):
     os.environ['FLASK_APP'] = 'app.py'
     
     try:
-        # Importar y ejecutar la aplicación
-        from app import app
-        app.run(debug=False, host=host, port=port, use_reloader=False)
+        if gunicorn_available():
+            start_gunicorn_server(host, port, workers, threads, timeout)
+        else:
+            # Sin gunicorn (por ejemplo en Windows): servidor de Flask con un hilo por petición
+            from app import app
+            app.run(debug=False, host=host, port=port, use_reloader=False, threaded=True)
     except KeyboardInterrupt:
         pass  # Silenciar mensaje de parada
     except Exception as e:
@@ -123,6 +173,7 @@ Ejemplos de uso:
   python start.py --port 8080        # Puerto personalizado
   python start.py --host 127.0.0.1   # Host personalizado
   python start.py --dev --port 3000  # Desarrollo en puerto 3000
+  python start.py --workers 2 --threads 16  # gunicorn con 2 procesos de 16 hilos
         """
     )
     
@@ -132,6 +183,12 @@ Ejemplos de uso:
                        help=f'Puerto del servidor (default: {DEFAULT_PORT})')
     parser.add_argument('--host', default=DEFAULT_HOST,
                        help=f'Host del servidor (default: {DEFAULT_HOST})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                       help=f'Procesos de gunicorn en producción (default: {DEFAULT_WORKERS}, env WEB_WORKERS)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                       help=f'Hilos por proceso en producción (default: {DEFAULT_THREADS}, env WEB_THREADS)')
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT,
+                       help=f'Segundos máximos por petición en producción (default: {DEFAULT_TIMEOUT})')
     parser.add_argument('--info', action='store_true',
                        help='Mostrar información del sistema y salir')
     parser.add_argument('--version', action='version', version=f'{PROJECT_NAME} v{VERSION}')
@@ -157,7 +214,7 @@ Ejemplos de uso:
     if args.dev:
         start_development_server(args.host, args.port)
     else:
-        start_production_server(args.host, args.port)
+        start_production_server(args.host, args.port, args.workers, args.threads, args.timeout)
 
 if __name__ == '__main__':
     main()
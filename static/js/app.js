@@ -283,6 +283,16 @@ class ASAPALSAnalytics {
             this.refreshData();
         });
 
+        // Media móvil del gráfico de líneas
+        const rollingSelect = document.getElementById('rollingWindowSelect');
+        if (rollingSelect) {
+            rollingSelect.addEventListener('change', () => {
+                if (this.currentChartType === 'line') {
+                    this.loadChart('line');
+                }
+            });
+        }
+
         // Save analysis button
         document.getElementById('saveAnalysisBtn').addEventListener('click', () => {
             this.showSaveModal();
@@ -523,17 +533,69 @@ class ASAPALSAnalytics {
         return hash.toString(16);
     }
 
-    async processValidFile(file) {
+    // Formulario para el servidor: con sesión de carga se envía solo el id, sin volver a subir el archivo
+    buildUploadForm(file) {
         const formData = new FormData();
-        formData.append('file', file);
+        if (file._uploadSessionId) {
+            formData.append('session_id', file._uploadSessionId);
+            if (file._uploadStage) {
+                formData.append('session_stage', file._uploadStage);
+            }
+        } else {
+            formData.append('file', file);
+        }
+        return formData;
+    }
 
-        try {
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
+    // POST usando la sesión de carga; si expiró (410) se reintenta enviando el archivo completo
+    async postWithSession(url, file, options = {}) {
+        let response = await fetch(url, { method: 'POST', body: this.buildUploadForm(file), ...options });
+        if (response.status === 410 && file._uploadSessionId) {
+            file._uploadSessionId = null;
+            response = await fetch(url, { method: 'POST', body: this.buildUploadForm(file), ...options });
+        }
+        return response;
+    }
 
-            const result = await response.json();
+    // Consulta el trabajo de ingesta hasta que termine, mostrando su etapa y porcentaje reales
+    async waitForIngestionJob(jobId) {
+        clearInterval(this.progressInterval);
+        const progressBar = document.getElementById('progressBar');
+        const progressText = document.getElementById('progressText');
+
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const data = await response.json();
+            if (!data.success) {
+                return { status: 'failed', message: data.error };
+            }
+
+            const job = data.job;
+            if (progressBar && progressText) {
+                progressBar.style.width = job.percent + '%';
+                progressText.textContent = job.rows_processed
+                    ? `${job.stage} (${job.rows_processed.toLocaleString()} filas)`
+                    : job.stage;
+            }
+            if (job.status === 'done' || job.status === 'failed') {
+                return job;
+            }
+            await this.delay(500);
+        }
+    }
+
+    async processValidFile(file) {
+        try {
+            const response = await this.postWithSession('/upload', file);
+
+            let result = await response.json();
+            if (result.success && result.job_id) {
+                // El servidor procesa en segundo plano; esperar el resultado del trabajo
+                const job = await this.waitForIngestionJob(result.job_id);
+                result = job.status === 'done'
+                    ? { success: true, message: job.message, ...job.result }
+                    : { success: false, message: job.message };
+            }
 
             if (result.success) {
                 this.currentFileName = file.name;
@@ -548,7 +610,7 @@ class ASAPALSAnalytics {
                     this.loadChart('line');
                 }, 500);
             } else {
-                this.showAlert('Error al procesar el archivo', 'danger');
+                this.showAlert(result.message || 'Error al procesar el archivo', 'danger');
             }
         } catch (error) {
             this.showAlert('Error al procesar el archivo', 'danger');
@@ -567,7 +629,10 @@ class ASAPALSAnalytics {
             body: formData
         });
 
-        return await response.json();
+        const result = await response.json();
+        // Reparación y procesamiento reutilizan el archivo ya parseado en el servidor
+        file._uploadSessionId = result.session_id || null;
+        return result;
     }
 
     // Función para generar el HTML reorganizado de la pantalla de reparación
@@ -1003,14 +1068,7 @@ class ASAPALSAnalytics {
     }
 
     async repairFile(file) {
-        const formData = new FormData();
-        formData.append('file', file);
-
-        const response = await fetch('/api/intelligent-repair', {
-            method: 'POST',
-            body: formData
-        });
-
+        const response = await this.postWithSession('/api/intelligent-repair', file);
         return await response.json();
     }
 
@@ -1164,6 +1222,11 @@ class ASAPALSAnalytics {
             const csvContent = this.convertRepairedDataToCSV(repairedData);
             const blob = new Blob([csvContent], { type: 'text/csv' });
             const file = new File([blob], 'archivo_reparado.csv', { type: 'text/csv' });
+            if (repairedData.session_id) {
+                // El servidor ya tiene los datos reparados en la sesión de carga
+                file._uploadSessionId = repairedData.session_id;
+                file._uploadStage = 'repaired';
+            }
             
             // Procesar el archivo reparado
             await this.processValidFile(file);
@@ -1541,17 +1604,19 @@ class ASAPALSAnalytics {
             
             // Simulate progress
             let progress = 0;
-            const interval = setInterval(() => {
+            clearInterval(this.progressInterval);
+            this.progressInterval = setInterval(() => {
                 progress += Math.random() * 15;
                 if (progress > 90) progress = 90;
                 progressBar.style.width = progress + '%';
                 
                 if (progress >= 90) {
-                    clearInterval(interval);
+                    clearInterval(this.progressInterval);
                     progressText.textContent = 'Finalizando...';
                 }
             }, 200);
         } else {
+            clearInterval(this.progressInterval);
             progressContainer.style.display = 'none';
         }
     }
@@ -1714,8 +1779,9 @@ class ASAPALSAnalytics {
         this.chartReady = false; // Reiniciar estado de gráfico
 
         try {
-            console.log('Fetching chart data from:', `/chart/${chartType}`);
-            const response = await fetch(`/chart/${chartType}`);
+            const chartUrl = this.getChartUrl(chartType);
+            console.log('Fetching chart data from:', chartUrl);
+            const response = await fetch(chartUrl);
             console.log('Response status:', response.status);
             
             const chartConfig = await response.json();
@@ -1745,9 +1811,15 @@ class ASAPALSAnalytics {
         }
     }
 
+    getChartUrl(chartType) {
+        // La media móvil (?rolling=N) solo se superpone al gráfico de líneas
+        const rolling = document.getElementById('rollingWindowSelect')?.value;
+        return chartType === 'line' && rolling ? `/chart/line?rolling=${rolling}` : `/chart/${chartType}`;
+    }
+
     async updateChartAvailability() {
-        // Gráficos disponibles - excluyendo precision y difference que causan errores 400
-        const chartTypes = ['line', 'bar', 'comparison', 'scatter', 'radar'];
+        // Gráficos con botón en la interfaz
+        const chartTypes = ['line', 'bar', 'comparison', 'precision', 'difference', 'scatter', 'radar', 'forecast'];
         let availableCount = 0;
         
         for (const chartType of chartTypes) {
@@ -1779,10 +1851,10 @@ class ASAPALSAnalytics {
         }
         
         // Actualizar contador de gráficos disponibles
-        this.updateAvailableChartsCount(availableCount);
+        this.updateAvailableChartsCount(availableCount, chartTypes.length);
     }
 
-    updateAvailableChartsCount(count) {
+    updateAvailableChartsCount(count, total) {
         const countElement = document.getElementById('availableCount');
         const badgeElement = document.getElementById('availableChartsCount');
         const noChartsMessage = document.getElementById('noChartsMessage');
@@ -1792,7 +1864,7 @@ class ASAPALSAnalytics {
             badgeElement.style.display = count > 0 ? 'inline-block' : 'none';
             
             // Cambiar color del badge según la cantidad
-            if (count === 5) {
+            if (count === total) {
                 badgeElement.className = 'badge bg-success ms-2';
             } else if (count >= 3) {
                 badgeElement.className = 'badge bg-warning ms-2';
@@ -1816,6 +1888,7 @@ class ASAPALSAnalytics {
             'difference': 'Diferencia entre proyección ajustada y fruta recibida',
             'scatter': 'Correlación entre diferentes tipos de movimiento',
             'radar': 'Comparación multidimensional de tipos de movimiento',
+            'forecast': 'Pronóstico de los próximos meses con intervalo de predicción',
         };
         return descriptions[chartType] || '';
     }
@@ -1829,6 +1902,7 @@ class ASAPALSAnalytics {
             'difference': 'Se requieren datos de proyección ajustada y fruta recibida',
             'scatter': 'Se requieren al menos 2 variables con datos válidos',
             'radar': 'Se requieren al menos 3 variables con datos válidos',
+            'forecast': 'Se requiere historia mensual para pronosticar',
         };
         return messages[chartType] || 'Gráfico no disponible con los datos actuales';
     }
@@ -1925,6 +1999,7 @@ class ASAPALSAnalytics {
             'difference': 'Diferencia entre Proyección Ajustada y Fruta Recibida',
             'scatter': 'Correlación entre Tipos de Movimiento',
             'radar': 'Comparación Multidimensional de Tipos de Movimiento',
+            'forecast': 'Pronóstico de Toneladas por Tipo de Movimiento',
         };
 
         document.getElementById('chartTitle').textContent = titles[chartType] || 'Gráfico';
@@ -1939,6 +2014,7 @@ class ASAPALSAnalytics {
             'difference': 'Diferencia entre Proyección Ajustada y Fruta Recibida',
             'scatter': 'Correlación entre Tipos de Movimiento',
             'radar': 'Comparación Multidimensional de Tipos de Movimiento',
+            'forecast': 'Pronóstico de Toneladas por Tipo de Movimiento',
         };
         return titles[chartType] || 'Gráfico';
     }
@@ -2510,7 +2586,7 @@ class ASAPALSAnalytics {
         }
         
         // Obtener todos los tipos de gráficos disponibles
-        const chartTypes = ['line', 'bar', 'comparison', 'precision', 'difference', 'scatter', 'radar'];
+        const chartTypes = ['line', 'bar', 'comparison', 'precision', 'difference', 'scatter', 'radar', 'forecast'];
         let chartCount = 0;
         let totalCharts = 0;
         
@@ -2832,7 +2908,7 @@ class ASAPALSAnalytics {
                             <small class="text-muted">
                                 Pendiente: ${trend.slope.toFixed(4)} | 
                                 Inicio: ${trend.first_value.toFixed(1)} | 
-                                Final: ${trend.last_value.toFixed(1)}
+                                Final: ${trend.last_value.toFixed(1)}${trend.r_squared !== undefined ? ` | R²: ${trend.r_squared.toFixed(2)}` : ''}
                             </small>
                         </div>
                     </div>
@@ -3932,17 +4008,13 @@ Archivo: ${this.currentFileName}
                 type: this.currentRepairFile.type,
                 lastModified: Date.now() // Usar timestamp actual para evitar conflictos
             });
+            fileCopy._uploadSessionId = this.currentRepairFile._uploadSessionId;
             
                 // Realizar análisis con IA usando el endpoint del backend
-                const formData = new FormData();
-                formData.append('file', fileCopy);
-                
                 const controller = new AbortController();
                 const timeoutId = setTimeout(() => controller.abort(), 10000); // 10 segundos timeout
                 
-                const response = await fetch('/api/intelligent-repair', {
-                    method: 'POST',
-                    body: formData,
+                const response = await this.postWithSession('/api/intelligent-repair', fileCopy, {
                     signal: controller.signal
                 });
                 
@@ -4049,10 +4121,6 @@ Archivo: ${this.currentFileName}
                 throw new Error(`Archivo modificado durante el procesamiento: ${integrityCheck.reason}`);
             }
             
-            // Usar directamente la copia inmutable (ya no necesitamos crear otra copia)
-            const formData = new FormData();
-            formData.append('file', this.currentRepairFile);
-            
             // Simular progreso mientras se procesa
             const steps = [
                 { text: "Enviando archivo al servidor...", progress: 20 },
@@ -4082,9 +4150,8 @@ Archivo: ${this.currentFileName}
                 try {
                     console.log(`🔄 Intento ${attempt}/${maxRetries} de reparación...`);
                     
-                    const response = await fetch('/api/intelligent-repair', {
-                        method: 'POST',
-                        body: formData,
+                    // Usar directamente la copia inmutable (o su sesión de carga en el servidor)
+                    const response = await this.postWithSession('/api/intelligent-repair', this.currentRepairFile, {
                         signal: controller.signal
                     });
                     
@@ -4525,15 +4592,8 @@ Archivo: ${this.currentFileName}
                 throw new Error('No hay archivo disponible para obtener datos completos');
             }
             
-            // Crear FormData con el archivo original
-            const formData = new FormData();
-            formData.append('file', this.currentRepairFile);
-            
-            // Llamar al endpoint de reparación para obtener todos los datos
-            const response = await fetch('/api/intelligent-repair', {
-                method: 'POST',
-                body: formData
-            });
+            // Llamar al endpoint de reparación para obtener todos los datos (reutiliza la sesión de carga)
+            const response = await this.postWithSession('/api/intelligent-repair', this.currentRepairFile);
             
             if (!response.ok) {
                 throw new Error(`Error del servidor: ${response.statusText}`);
@@ -313,7 +313,10 @@ function processMobileFile(file) {
     })
     .then(data => {
         console.log('📱 [Mobile] Datos recibidos del servidor:', data);
-        
+        // El servidor procesa en segundo plano; esperar el resultado del trabajo
+        return data.success && data.job_id ? waitForIngestionJob(data.job_id) : data;
+    })
+    .then(data => {
         if (data.success) {
             console.log('📱 [Mobile] Archivo procesado exitosamente, obteniendo resumen...');
             // Obtener datos del servidor usando el endpoint de resumen
@@ -335,6 +338,28 @@ function processMobileFile(file) {
     });
 }
 
+function waitForIngestionJob(jobId) {
+    const text = document.querySelector('#mobileLoadingModal .mobile-modal-text');
+    
+    return fetch(`/api/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                return { success: false, message: data.error };
+            }
+            
+            const job = data.job;
+            if (text) text.textContent = `${job.stage} - ${job.percent}%`;
+            if (job.status === 'done') {
+                return { success: true, message: job.message, ...job.result };
+            }
+            if (job.status === 'failed') {
+                return { success: false, message: job.message };
+            }
+            return new Promise(resolve => setTimeout(resolve, 500)).then(() => waitForIngestionJob(jobId));
+        });
+}
+
 function clearCache() {
     dataCache = null;
     cacheTimestamp = null;
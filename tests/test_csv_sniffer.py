@@ -0,0 +1,47 @@
+"""Detección del formato numérico en sniff_csv_dialect"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def rows(*values):
+    return [[value] for value in values]
+
+
+def test_tres_decimales_con_punto_no_son_miles():
+    thousands, decimal, _ = app._detect_number_format(rows('1.250', '2.375', '0.5'), ';')
+    assert (thousands, decimal) == (',', '.')
+
+
+def test_un_grupo_sin_contexto_no_vota():
+    assert app._detect_number_format(rows('1.250', '2.375'), ';')[:2] == (',', '.')
+
+
+def test_miles_con_punto_y_decimal_con_coma():
+    assert app._detect_number_format(rows('1.234.567', '1.250,5', '3,25'), ';')[:2] == ('.', ',')
+
+
+def test_un_grupo_sigue_a_su_columna():
+    assert app._detect_number_format(rows('1.250', '12.500.000', '3,5'), ';')[:2] == ('.', ',')
+
+
+def test_con_separador_coma_nunca_hay_coma_decimal():
+    assert app._detect_number_format(rows('1.234.567', '3,25'), ',')[:2] == (',', '.')
+
+
+@pytest.mark.parametrize('content, expected', [
+    ('Producto;Valor\nA;1.250\nB;2.375\nC;0.5\n', [1.25, 2.375, 0.5]),
+    ('Producto;Valor\nA;1.250,5\nB;2.375,25\nC;12.000,0\n', [1250.5, 2375.25, 12000.0]),
+])
+def test_lectura_completa(tmp_path, content, expected):
+    path = tmp_path / 'muestra.csv'
+    path.write_text(content, encoding='utf-8')
+    dialect = app.sniff_csv_dialect(str(path))
+    frame, _ = app.read_csv_sniffed(str(path), dialect)
+    assert frame['Valor'].tolist() == pytest.approx(expected)
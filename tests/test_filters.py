@@ -0,0 +1,97 @@
+"""Pila de filtros sobre el pivot: selecciones de filas, vistas y deshacer"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+DATASET_ID = 'a' * 32
+
+
+def make_pivot():
+    dates = pd.date_range('2020-01-01', periods=24, freq='MS')
+    return pd.DataFrame({
+        'Fruta Recibida': np.arange(1.0, 25.0),
+        'Fruta Proyectada': np.where(np.arange(24) % 3 == 0, 0.0, 100.0),
+    }, index=dates)
+
+
+def selected(base, rows):
+    return base.iloc[rows] if isinstance(rows, slice) else base.take(rows)
+
+
+def test_rango_de_fechas_ordenado_es_slice():
+    base = make_pivot()
+    rows = app.resolve_filter(base, slice(0, len(base)), {'date_from': '2020-06-01', 'date_to': '2021-02-01'})
+    assert isinstance(rows, slice)
+    pd.testing.assert_frame_equal(selected(base, rows), base.loc['2020-06-01':'2021-02-01'])
+
+
+def test_rango_de_fechas_desordenado():
+    base = make_pivot().iloc[::-1]
+    rows = app.resolve_filter(base, slice(0, len(base)), {'date_from': '2020-06-01', 'date_to': '2021-02-01'})
+    expected = base[(base.index >= '2020-06-01') & (base.index <= '2021-02-01')]
+    pd.testing.assert_frame_equal(selected(base, rows), expected)
+
+
+def test_tipo_de_movimiento_solo_filas_con_valores():
+    base = make_pivot()
+    rows = app.resolve_filter(base, slice(0, 12), {'movement_type': 'Fruta Proyectada'})
+    pd.testing.assert_frame_equal(selected(base, rows), base.iloc[:12][base.iloc[:12]['Fruta Proyectada'] > 0])
+
+
+@pytest.mark.parametrize('base, spec', [
+    (make_pivot().reset_index(drop=True), {'date_from': '2020-06-01'}),
+    (make_pivot(), {'movement_type': 'No Existe'}),
+])
+def test_filtro_no_aplicable(base, spec):
+    with pytest.raises(ValueError):
+        app.resolve_filter(base, slice(0, len(base)), spec)
+
+
+@pytest.fixture
+def entry(monkeypatch):
+    base = make_pivot()
+    entry = {'id': DATASET_ID, 'frames': {**app._empty_frames(), 'processed_data': base}, 'filters': [],
+             'version_id': 'v' * 32, 'store_version': None, 'sequence': 0, 'notes': {}, 'last_access': 0, 'bytes': 0}
+    monkeypatch.setitem(app.datasets, DATASET_ID, entry)
+    return entry
+
+
+def test_pila_de_filtros(entry):
+    base = entry['frames']['processed_data']
+    with app.app.test_request_context(headers={'X-Dataset-Id': DATASET_ID}):
+        view, depth = app.push_filter({'date_from': '2020-04-01'})
+        assert depth == 1 and np.shares_memory(view.to_numpy(), base.to_numpy())  # Un slice no copia
+        view, depth = app.push_filter({'movement_type': 'Fruta Proyectada'})
+        view, depth = app.push_filter({'date_to': '2021-06-01'})
+        expected = base.loc['2020-04-01':'2021-06-01']
+        pd.testing.assert_frame_equal(view, expected[expected['Fruta Proyectada'] > 0])
+        assert depth == 3
+        assert entry['filters'][1]['view'] is None  # Solo el nivel superior conserva su copia
+        assert [level['filter'] for level in entry['filters']] == app.get_active_filters()
+        assert len({level['version_id'] for level in entry['filters']}) == 3
+
+        # Deshacer vuelve a materializar la vista del nivel que queda arriba
+        view, depth = app.pop_filters()
+        assert depth == 2
+        pd.testing.assert_frame_equal(view, base.loc['2020-04-01':][base.loc['2020-04-01':]['Fruta Proyectada'] > 0])
+        assert app.get_active_frames()['version_id'] == entry['filters'][-1]['version_id']
+
+        view, depth = app.pop_filters(None)
+        assert depth == 0 and view is base
+        assert app.get_active_frames()['version_id'] == entry['version_id']
+
+
+def test_filtro_vacio(entry):
+    with app.app.test_request_context(headers={'X-Dataset-Id': DATASET_ID}):
+        with pytest.raises(ValueError):
+            app.push_filter({'otro': 'x'})
+        view, depth = app.push_filter({'date_from': '2030-01-01'})
+        assert depth == 1 and view.empty
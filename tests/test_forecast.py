@@ -0,0 +1,103 @@
+"""Pronóstico por lotes: modelo elegido según la historia, intervalos y backtest sin mirar el futuro"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+SEASON = app.FORECAST_SEASON
+
+
+def seasonal_series(months, seed=5):
+    rng = np.random.default_rng(seed)
+    t = np.arange(months)
+    return 20000 + 150 * t + 4000 * np.sin(2 * np.pi * t / SEASON) + rng.normal(0, 500, months)
+
+
+@pytest.mark.parametrize('method', app.FORECAST_METHODS)
+@pytest.mark.parametrize('months', [5, SEASON + 3, 3 * SEASON])
+def test_serie_constante(method, months):
+    values = np.full((months, 1), 750.0)
+    forecast = app.forecast_batch(app.fit_forecast_batch(values, method), 18, app.FORECAST_Z[95])
+    np.testing.assert_allclose(forecast['mean'], 750.0)
+    np.testing.assert_allclose(forecast['lower'], 750.0)
+    np.testing.assert_allclose(forecast['upper'], 750.0)
+
+
+def test_una_temporada_sin_residuos_no_tiene_intervalo():
+    # Sin una segunda temporada no hay errores estacionales que medir: el intervalo queda en NaN (null en el JSON)
+    forecast = app.forecast_batch(app.fit_forecast_batch(np.full((SEASON, 1), 750.0), 'holt_winters'), 6, 1.96)
+    np.testing.assert_allclose(forecast['mean'], 750.0)
+    assert np.isnan(forecast['lower']).all() and np.isnan(forecast['upper']).all()
+
+
+def test_modelo_segun_temporadas_observadas():
+    values = np.zeros((4 * SEASON, 5))
+    values[-(SEASON - 1):, 0] = 100  # Menos de una temporada
+    values[-SEASON:, 1] = 100  # Una temporada
+    values[-(2 * SEASON - 1):, 2] = 100  # Casi dos: todavía estacional ingenuo
+    values[-2 * SEASON:, 3] = 100  # Dos temporadas
+    # Columna 4 sin datos
+    model = app.fit_forecast_batch(values, 'holt_winters')
+    assert model['kind'].tolist() == ['naive', 'seasonal_naive', 'seasonal_naive', 'holt_winters', 'empty']
+    model = app.fit_forecast_batch(values, 'seasonal_naive')
+    assert model['kind'].tolist() == ['naive', 'seasonal_naive', 'seasonal_naive', 'seasonal_naive', 'empty']
+
+
+def test_ceros_de_los_extremos_no_son_historia():
+    values = np.zeros((3 * SEASON, 1))
+    values[SEASON:SEASON + 8, 0] = seasonal_series(8)
+    model = app.fit_forecast_batch(values, 'holt_winters')
+    assert model['kind'].tolist() == ['naive']
+    assert model['end'].tolist() == [SEASON + 8]
+    assert model['level'][0] == values[SEASON + 7, 0]
+
+
+@pytest.mark.parametrize('method', app.FORECAST_METHODS)
+@pytest.mark.parametrize('level', sorted(app.FORECAST_Z))
+def test_intervalo_contiene_la_media(method, level):
+    values = np.zeros((40, 3))
+    values[:, 0] = seasonal_series(40)
+    values[-20:, 1] = seasonal_series(20, seed=8)  # Una temporada y algo: estacional ingenuo
+    values[:9, 2] = seasonal_series(9, seed=9)  # Menos de una temporada: último valor
+    forecast = app.forecast_batch(app.fit_forecast_batch(values, method), 24, app.FORECAST_Z[level])
+    assert forecast['mean'].shape == (24, 3)
+    assert (forecast['lower'] <= forecast['mean']).all()
+    assert (forecast['mean'] <= forecast['upper']).all()
+    assert (forecast['lower'] >= 0).all()
+    # El intervalo no se estrecha al alejarse del último dato
+    width = forecast['upper'] - forecast['lower']
+    assert (np.diff(width, axis=0) >= -1e-9).all()
+
+
+@pytest.mark.parametrize('method', app.FORECAST_METHODS)
+def test_backtest_no_usa_meses_posteriores_al_corte(monkeypatch, method):
+    values = np.column_stack([seasonal_series(48), seasonal_series(48, seed=6)])
+    values[40:, 1] = 0  # La segunda columna termina antes: su corte es otro
+    _, end = app.observed_span(values)
+    fitted = []
+    original = app.fit_forecast_batch
+    monkeypatch.setattr(app, 'fit_forecast_batch', lambda history, *args: fitted.append(history) or original(history, *args))
+
+    horizon, folds = 6, 3
+    result = app.backtest_forecast_batch(values, method, horizon, folds)
+    assert len(fitted) == folds
+    rows = np.arange(len(values))[:, np.newaxis]
+    for fold, history in enumerate(fitted, start=1):
+        cutoff = end - fold * horizon
+        assert (history[rows >= cutoff] == 0).all()
+        np.testing.assert_array_equal(history[rows < cutoff], np.broadcast_to(values, history.shape)[rows < cutoff])
+    assert result['folds'].tolist() == [folds, folds]
+
+
+def test_backtest_de_una_serie_estacional_exacta():
+    t = np.arange(3 * SEASON)
+    values = (1000 + 300 * np.sin(2 * np.pi * t / SEASON))[:, np.newaxis]
+    result = app.backtest_forecast_batch(values, 'seasonal_naive', 6, 2)
+    np.testing.assert_allclose(result['mae'], 0, atol=1e-9)
+    np.testing.assert_allclose(result['mape'], 0, atol=1e-9)
@@ -0,0 +1,35 @@
+"""Codificación de DataFrames en los .npz de la caché de datasets"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def roundtrip(tmp_path, frame):
+    path = str(tmp_path / 'frames.npz')
+    app.write_frames_file(path, {'data': frame}, {})
+    frames, _ = app.read_frames_file(path)
+    return frames['data']
+
+
+def test_dtypes_con_nulos_sin_pickle(tmp_path):
+    frame = pd.DataFrame({
+        'entero': pd.array([1, None, 3], dtype='Int64'),
+        'logico': pd.array([True, None, False], dtype='boolean'),
+        'real': pd.array([1.5, None, 2.0], dtype='Float64'),
+    })
+    pd.testing.assert_frame_equal(roundtrip(tmp_path, frame), frame)
+
+
+def test_columnas_habituales(tmp_path):
+    frame = pd.DataFrame({
+        'Fecha': pd.to_datetime(['2024-01-01', None, '2024-03-01']),
+        'T.M.': [1.0, 2.5, 3.0],
+        'Tipo': pd.Categorical(['a', 'b', 'a']),
+    }, index=pd.Index([10, 20, 30], name='fila'))
+    pd.testing.assert_frame_equal(roundtrip(tmp_path, frame), frame)
@@ -0,0 +1,92 @@
+"""Fusión de celdas de una carga incremental con el pivot activo (modos append y upsert)"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def make_pivot():
+    return pd.DataFrame({
+        'Fruta Proyectada': [100.0, 200.0, 300.0],
+        'Fruta Recibida': [90.0, 0.0, 310.0],  # Febrero aún sin recibido
+    }, index=pd.date_range('2024-01-01', periods=3, freq='MS', name='Fecha'))
+
+
+def make_cells(rows):
+    index = pd.MultiIndex.from_tuples([(pd.Timestamp(date), kind) for date, kind, _ in rows],
+                                      names=['Fecha', 'TipoMovimiento'])
+    return pd.Series([value for _, _, value in rows], index=index, name='T.M.')
+
+
+CELLS = [
+    ('2024-01-01', 'Fruta Proyectada', 100.0),  # Igual al existente
+    ('2024-02-01', 'Fruta Recibida', 205.0),  # Celda vacía (0)
+    ('2024-03-01', 'Fruta Recibida', 330.0),  # Existente con otro valor
+    ('2024-04-01', 'Fruta Proyectada', 400.0),  # Fecha nueva
+    ('2024-04-01', 'Fruta Comprada', 50.0),  # Tipo de movimiento nuevo
+]
+
+
+def test_append_no_modifica_celdas_existentes():
+    pivot = make_pivot()
+    merged, changes, written = app.merge_incremental(pivot, make_cells(CELLS), 'append')
+    assert changes['cells_added'] == 3
+    assert changes['cells_updated'] == 0
+    assert changes['cells_unchanged'] == 1
+    assert changes['cells_skipped'] == 1
+    assert changes['new_dates'] == ['2024-04-01']
+    assert changes['new_movement_types'] == ['Fruta Comprada']
+    assert changes['changed_dates'] == ['2024-02-01', '2024-04-01']
+    assert merged.loc['2024-03-01', 'Fruta Recibida'] == 310.0
+    assert merged.loc['2024-02-01', 'Fruta Recibida'] == 205.0
+    assert merged.loc['2024-04-01', 'Fruta Comprada'] == 50.0
+    assert merged.loc['2024-01-01', 'Fruta Comprada'] == 0.0  # Las celdas ampliadas quedan vacías
+    assert len(written) == 3
+
+
+def test_upsert_reemplaza_celdas_existentes():
+    pivot = make_pivot()
+    merged, changes, written = app.merge_incremental(pivot, make_cells(CELLS), 'upsert')
+    assert (changes['cells_added'], changes['cells_updated'], changes['cells_unchanged'], changes['cells_skipped']) == (3, 1, 1, 0)
+    assert changes['changed_dates'] == ['2024-02-01', '2024-03-01', '2024-04-01']
+    assert merged.loc['2024-03-01', 'Fruta Recibida'] == 330.0
+    assert list(merged.index) == list(pd.date_range('2024-01-01', periods=4, freq='MS'))
+    assert merged.index.name == 'Fecha'
+    assert len(written) == 4
+
+
+@pytest.mark.parametrize('mode', sorted(app.INCREMENTAL_MODES))
+def test_no_modifica_el_pivot_base(mode):
+    pivot = make_pivot()
+    before = pivot.copy()
+    app.merge_incremental(pivot, make_cells(CELLS), mode)
+    pd.testing.assert_frame_equal(pivot, before)
+
+
+@pytest.mark.parametrize('mode', sorted(app.INCREMENTAL_MODES))
+def test_sin_cambios_devuelve_el_mismo_pivot(mode):
+    pivot = make_pivot()
+    cells = make_cells([('2024-01-01', 'Fruta Proyectada', 100.0), ('2024-02-01', 'Fruta Recibida', 0.0)])
+    merged, changes, written = app.merge_incremental(pivot, cells, mode)
+    assert merged is pivot
+    assert written.empty
+    assert changes['changed_dates'] == []
+
+
+def test_detalle_sigue_al_pivot():
+    pivot = make_pivot()
+    merged, _, written = app.merge_incremental(pivot, make_cells(CELLS), 'upsert')
+    detail = app.merge_incremental_detail(None, pivot, written)
+    assert detail.attrs['pivot_cells']
+    expected = merged.rename_axis(columns='TipoMovimiento').stack().rename('T.M.')
+    expected = expected[expected != 0].sort_index()
+    actual = detail.set_index(['Fecha', 'TipoMovimiento'])['T.M.'].sort_index()
+    np.testing.assert_array_equal(actual.index.to_list(), expected.index.to_list())
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
@@ -0,0 +1,63 @@
+"""Estadísticas móviles de rolling_window_stats contra DataFrame.rolling de pandas"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+STATISTICS = ('sum', 'mean', 'std', 'min', 'max')
+
+
+def make_values():
+    rng = np.random.default_rng(11)
+    values = rng.normal(20000, 5000, (30, 3))
+    values[[2, 3, 4, 17], 0] = np.nan  # Huecos sueltos y seguidos
+    values[::2, 1] = np.nan  # Mitad de los meses vacíos
+    values[:, 2] = rng.integers(0, 3, 30)  # Valores repetidos: ventanas de desviación cero
+    return values
+
+
+@pytest.mark.parametrize('window', [1, 2, 5, 12, 30, 45])
+@pytest.mark.parametrize('min_periods', [1, 'window'])
+def test_coincide_con_pandas(window, min_periods):
+    values = make_values()
+    min_periods = window if min_periods == 'window' else min_periods
+    results = app.rolling_window_stats(values, window, STATISTICS, min_periods)
+    rolling = pd.DataFrame(values).rolling(window, min_periods=min_periods)
+    for name in STATISTICS:
+        expected = getattr(rolling, name)().to_numpy()
+        assert results[name].shape == values.shape
+        np.testing.assert_allclose(results[name], expected, rtol=1e-7, atol=1e-6, equal_nan=True, err_msg=name)
+
+
+@pytest.mark.parametrize('window', [1, 3, 4, 7, 10])
+def test_extremos_por_bloques(window):
+    values = make_values()[:, :2]
+    frame = pd.DataFrame(values).rolling(window, min_periods=1)
+    minimum = app._window_extreme(values, window, np.minimum, np.inf)
+    maximum = app._window_extreme(values, window, np.maximum, -np.inf)
+    # Las ventanas sin ningún valor quedan en ±inf; rolling_window_stats las marca NaN con min_periods
+    np.testing.assert_array_equal(np.where(np.isinf(minimum), np.nan, minimum), frame.min().to_numpy())
+    np.testing.assert_array_equal(np.where(np.isinf(maximum), np.nan, maximum), frame.max().to_numpy())
+
+
+def test_desviacion_con_media_grande():
+    # pandas pierde precisión aquí; la referencia es la desviación exacta de cada ventana
+    rng = np.random.default_rng(3)
+    values = (1e9 + rng.normal(0, 1, 40))[:, np.newaxis]
+    results = app.rolling_window_stats(values, 3, ('std',), 2)
+    expected = [np.nan] + [np.std(values[max(i - 2, 0):i + 1, 0], ddof=1) for i in range(1, 40)]
+    np.testing.assert_allclose(results['std'][:, 0], expected, rtol=1e-6)
+
+
+def test_ventana_mayor_que_las_filas():
+    values = make_values()[:4]
+    results = app.rolling_window_stats(values, 12, STATISTICS, 12)
+    for name in STATISTICS:
+        assert np.isnan(results[name]).all()
@@ -0,0 +1,77 @@
+"""Tendencias lineales de fit_trends contra una regresión de referencia por columna"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def make_pivot():
+    rng = np.random.default_rng(7)
+    x = np.arange(36, dtype='float64')
+    frame = pd.DataFrame({
+        'Fruta Recibida': 1000 + 25 * x + rng.normal(0, 80, len(x)),
+        'Fruta Proyectada': 3000 - 10 * x + rng.normal(0, 40, len(x)),
+        'Con Huecos': 500 + 3 * x + rng.normal(0, 20, len(x)),
+    }, index=pd.date_range('2022-01-01', periods=len(x), freq='MS'))
+    frame.iloc[[0, 5, 6, 7, 20, 35], 2] = np.nan  # Huecos al inicio, en medio y al final
+    return frame
+
+
+def reference_fit(x, y):
+    """Pendiente, R² y error estándar de la pendiente por mínimos cuadrados con numpy"""
+    slope, intercept = np.polyfit(x, y, 1)
+    residuals = y - (intercept + slope * x)
+    r_squared = 1 - (residuals ** 2).sum() / ((y - y.mean()) ** 2).sum()
+    std_error = np.sqrt((residuals ** 2).sum() / (len(x) - 2) / ((x - x.mean()) ** 2).sum())
+    return slope, r_squared, std_error
+
+
+def observed(frame, column):
+    """Posición de fila y valor de las celdas observadas: la x de fit_trends es la fila del pivot"""
+    series = frame[column].reset_index(drop=True).dropna()
+    return series.index.to_numpy(dtype='float64'), series.to_numpy()
+
+
+def test_coincide_con_minimos_cuadrados():
+    frame = make_pivot()
+    trends = app.fit_trends(frame)
+    assert set(trends) == set(frame.columns)
+    for column in frame.columns:
+        slope, r_squared, std_error = reference_fit(*observed(frame, column))
+        assert trends[column]['slope'] == pytest.approx(slope, rel=1e-9)
+        assert trends[column]['r_squared'] == pytest.approx(r_squared, rel=1e-9)
+        assert trends[column]['std_error'] == pytest.approx(std_error, rel=1e-9)
+
+
+def test_coincide_con_linregress():
+    stats = pytest.importorskip('scipy.stats')
+    frame = make_pivot()
+    trends = app.fit_trends(frame)
+    for column in frame.columns:
+        result = stats.linregress(*observed(frame, column))
+        assert trends[column]['slope'] == pytest.approx(result.slope, rel=1e-9)
+        assert trends[column]['r_squared'] == pytest.approx(result.rvalue ** 2, rel=1e-9)
+        assert trends[column]['std_error'] == pytest.approx(result.stderr, rel=1e-9)
+
+
+def test_huecos_no_cuentan_como_ceros():
+    frame = make_pivot()
+    trends = app.fit_trends(frame)
+    complete = app.fit_trends(frame[['Con Huecos']].fillna(0))
+    assert trends['Con Huecos']['slope'] != pytest.approx(complete['Con Huecos']['slope'])
+    assert trends['Con Huecos']['first_value'] == frame['Con Huecos'].dropna().iloc[0]
+    assert trends['Con Huecos']['last_value'] == frame['Con Huecos'].dropna().iloc[-1]
+
+
+def test_columna_con_un_solo_valor_se_omite():
+    frame = make_pivot()
+    frame['Casi Vacia'] = np.nan
+    frame.iloc[3, frame.columns.get_loc('Casi Vacia')] = 10.0
+    assert 'Casi Vacia' not in app.fit_trends(frame)